@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the MLflow shutdown Lambda against a simulated fleet.
+
+Runs lambda_handler against fake_aws.FakeSageMaker and reports the handler
+wall time and the number of API calls by operation, so changes to
+listing, describing and stopping can be compared. No AWS account is used.
+
+Usage:
+    python bench_mlflow_shutdown.py --servers 2000 --latency-ms 20 -o bench-current.json
+    python bench_mlflow_shutdown.py --servers 2000 --latency-ms 20 --full-details --compare bench-current.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+# Clients are never built against AWS, but botocore still wants a region
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+# With TRACE_FILE set, the tracing module comes from demo_apps/, as in the Lambda package
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'demo_apps'))
+
+import lambda_stop_mlflow_servers
+from fake_aws import FakeCloudWatch, FakeLambdaContext, FakeSageMaker
+
+
+def run_once(args) -> dict:
+    """Run the handler once against a fresh fleet and return its measurements."""
+    sagemaker = FakeSageMaker.with_fleet(
+        args.servers,
+        running_fraction=args.running_fraction,
+        fail_fraction=args.fail_fraction,
+        seed=args.seed,
+        page_size=args.page_size,
+        latency=args.latency_ms / 1000.0,
+        throttle_rate=args.throttle_rate,
+        stop_delay=args.stop_delay
+    )
+    cloudwatch = FakeCloudWatch(latency=args.latency_ms / 1000.0)
+    event = {
+        'full_details': args.full_details,
+        'wait_for_stop': args.wait,
+        'stop_rate_per_second': args.stop_rate
+    }
+    if args.describe_concurrency:
+        event['describe_concurrency'] = args.describe_concurrency
+    if args.stop_concurrency:
+        event['stop_concurrency'] = args.stop_concurrency
+
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker), \
+         patch.object(lambda_stop_mlflow_servers, 'get_cloudwatch_client', return_value=cloudwatch), \
+         patch.object(lambda_stop_mlflow_servers, 'METRICS_BACKEND', args.metrics_backend), \
+         patch.object(lambda_stop_mlflow_servers, 'WAIT_POLL_INTERVAL', args.poll_interval):
+        start = time.perf_counter()
+        result = lambda_stop_mlflow_servers.lambda_handler(event, FakeLambdaContext(args.timeout))
+        elapsed = time.perf_counter() - start
+
+    body = json.loads(result['body'])
+    if result['statusCode'] != 200:
+        raise RuntimeError(f"Handler failed: {body.get('error')}")
+
+    return {
+        'handler_s': elapsed,
+        'api_calls': dict(sagemaker.call_counts) | dict(cloudwatch.call_counts),
+        'throttled': dict(sagemaker.throttled_counts),
+        'servers_stopped': body['servers_stopped'],
+        'servers_failed': body.get('servers_failed', 0),
+        'servers_confirmed_stopped': body.get('servers_confirmed_stopped')
+    }
+
+
+def run_all(args) -> dict:
+    runs = []
+    for i in range(args.repeat):
+        print(f"run {i + 1}/{args.repeat} ...", file=sys.stderr)
+        runs.append(run_once(args))
+
+    times = [r['handler_s'] for r in runs]
+    last = runs[-1]
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')}
+        },
+        'handler_ms': {
+            'median': round(statistics.median(times) * 1000, 1),
+            'min': round(min(times) * 1000, 1),
+            'max': round(max(times) * 1000, 1)
+        },
+        'api_calls': last['api_calls'],
+        'api_calls_total': sum(last['api_calls'].values()),
+        'throttled': last['throttled'],
+        'servers_stopped': last['servers_stopped'],
+        'servers_failed': last['servers_failed'],
+        'servers_confirmed_stopped': last['servers_confirmed_stopped']
+    }
+
+
+def compare(current: dict, baseline: dict) -> str:
+    """Render a table of current vs baseline handler time and API calls."""
+    lines = [f"{'metric':<36}{'baseline':>12}{'current':>12}{'ratio':>8}"]
+
+    def row(metric, old, new):
+        if old is None or new is None:
+            return
+        ratio = new / old if old else float('nan')
+        lines.append(f"{metric:<36}{old:>12}{new:>12}{ratio:>8.2f}")
+
+    row('handler_ms (median)', baseline.get('handler_ms', {}).get('median'), current['handler_ms']['median'])
+    row('api_calls_total', baseline.get('api_calls_total'), current['api_calls_total'])
+    for operation in sorted(set(current['api_calls']) | set(baseline.get('api_calls', {}))):
+        row(operation, baseline.get('api_calls', {}).get(operation, 0), current['api_calls'].get(operation, 0))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the MLflow shutdown Lambda against a simulated fleet.')
+    parser.add_argument('--servers', type=int, default=1000, help='Fleet size (default: %(default)s)')
+    parser.add_argument('--running-fraction', type=float, default=0.5, help='Fraction of servers running (default: %(default)s)')
+    parser.add_argument('--fail-fraction', type=float, default=0.0, help='Fraction of running servers whose stop fails')
+    parser.add_argument('--page-size', type=int, default=100, help='Servers per list page (default: %(default)s)')
+    parser.add_argument('--latency-ms', type=float, default=10.0, help='Latency of every API call (default: %(default)s)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of describe/stop calls throttled')
+    parser.add_argument('--full-details', action='store_true', help='Describe every server (audit mode)')
+    parser.add_argument('--describe-concurrency', type=int, help='Override DESCRIBE_CONCURRENCY')
+    parser.add_argument('--stop-concurrency', type=int, help='Override STOP_CONCURRENCY')
+    parser.add_argument('--stop-rate', type=float, default=0,
+                        help='Stop calls per second, 0 for unlimited (default: %(default)s)')
+    parser.add_argument('--wait', action='store_true', help='Wait for the servers to reach Stopped')
+    parser.add_argument('--stop-delay', type=float, default=1.0, help='Seconds a server spends in Stopping')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='Seconds between polls while waiting')
+    parser.add_argument('--metrics-backend', choices=['memory', 'api'], default='memory',
+                        help="'api' also counts PutMetricData calls (default: %(default)s)")
+    parser.add_argument('--timeout', type=float, default=900, help='Simulated Lambda timeout in seconds')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='Write JSON results to this file')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    # The handler's own logging (including every throttled retry) would drown the output
+    lambda_stop_mlflow_servers.logger.setLevel('ERROR')
+    results = run_all(args)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(results, json.load(f)))
+
+
+if __name__ == '__main__':
+    main()
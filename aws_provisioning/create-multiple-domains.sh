@@ -88,6 +88,8 @@ echo "Domain creation initiated for all teams."
 echo "Check AWS CloudFormation console to monitor progress."
 echo ""
 echo "To check status of all stacks:"
+echo "  python domain_orchestrator.py status --wait"
+echo "or per stack:"
 for team in "${TEAMS[@]}"; do
     echo "  aws cloudformation describe-stacks --stack-name ${team}-sagemaker"
 done 
\ No newline at end of file
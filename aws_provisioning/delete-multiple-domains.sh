@@ -71,6 +71,8 @@ cleanup_parameter_files
 
 echo ""
 echo "To check status of all stacks:"
+echo "  python domain_orchestrator.py status --wait"
+echo "or per stack:"
 for team in "${TEAMS[@]}"; do
     echo "  aws cloudformation describe-stacks --stack-name ${team}-sagemaker"
 done 
\ No newline at end of file
@@ -1,7 +1,8 @@
 #!/bin/bash
 
 # Script to deploy the MLflow tracking server shutdown Lambda function
-# This script creates a CloudFormation stack that includes:
+# This script packages lambda_stop_mlflow_servers.py (with demo_apps/tracing.py)
+# and creates a CloudFormation stack that includes:
 # - Lambda function to stop MLflow tracking servers
 # - IAM role with necessary permissions
 # - EventBridge rule for scheduling
@@ -20,6 +21,19 @@ LAMBDA_FUNCTION_NAME="${LAMBDA_FUNCTION_NAME:-mlflow-server-shutdown}"
 LAMBDA_TIMEOUT="${LAMBDA_TIMEOUT:-300}"
 LAMBDA_MEMORY_SIZE="${LAMBDA_MEMORY_SIZE:-256}"
 
+# Function settings passed to the stack (see README_MLflow_Shutdown.md)
+TARGET_REGIONS="${TARGET_REGIONS:-}"
+TARGET_ROLE_ARNS="${TARGET_ROLE_ARNS:-}"
+STATE_STORE_BUCKET="${STATE_STORE_BUCKET:-}"
+IDLE_THRESHOLD_MINUTES="${IDLE_THRESHOLD_MINUTES:-0}"
+
+# The function code is built here and uploaded to ARTIFACT_BUCKET
+# (default: <stack name>-artifacts-<account id>, created if missing)
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+BUILD_DIR="$SCRIPT_DIR/build/mlflow_shutdown"
+PACKAGED_TEMPLATE="$SCRIPT_DIR/build/packaged-template.yaml"
+ARTIFACT_BUCKET="${ARTIFACT_BUCKET:-}"
+
 # Colors for output
 RED='\033[0;31m'
 GREEN='\033[0;32m'
@@ -65,6 +79,37 @@ check_template() {
     fi
 }
 
+# Function to build the Lambda package: the handler and the tracing module it imports
+build_package() {
+    print_status "Building Lambda package in $BUILD_DIR"
+    
+    rm -rf "$BUILD_DIR"
+    mkdir -p "$BUILD_DIR"
+    cp "$SCRIPT_DIR/lambda_stop_mlflow_servers.py" "$BUILD_DIR/"
+    cp "$SCRIPT_DIR/../demo_apps/tracing.py" "$BUILD_DIR/"
+}
+
+# Function to upload the package and write a template that points at it
+package_template() {
+    if [ -z "$ARTIFACT_BUCKET" ]; then
+        ACCOUNT_ID=$(aws sts get-caller-identity --query Account --output text)
+        ARTIFACT_BUCKET="${STACK_NAME}-artifacts-${ACCOUNT_ID}"
+    fi
+    
+    if ! aws s3api head-bucket --bucket "$ARTIFACT_BUCKET" --region "$REGION" &> /dev/null; then
+        print_status "Creating artifact bucket: $ARTIFACT_BUCKET"
+        aws s3 mb "s3://$ARTIFACT_BUCKET" --region "$REGION"
+    fi
+    
+    print_status "Uploading Lambda package to s3://$ARTIFACT_BUCKET"
+    aws cloudformation package \
+        --template-file "$TEMPLATE_FILE" \
+        --s3-bucket "$ARTIFACT_BUCKET" \
+        --s3-prefix "$STACK_NAME" \
+        --output-template-file "$PACKAGED_TEMPLATE" \
+        --region "$REGION"
+}
+
 # Function to check if stack already exists
 check_stack_exists() {
     if aws cloudformation describe-stacks --stack-name "$STACK_NAME" --region "$REGION" &> /dev/null; then
@@ -84,13 +129,17 @@ deploy_stack() {
     print_status "Lambda memory size: $LAMBDA_MEMORY_SIZE MB"
     
     aws cloudformation deploy \
-        --template-file "$TEMPLATE_FILE" \
+        --template-file "$PACKAGED_TEMPLATE" \
         --stack-name "$STACK_NAME" \
         --parameter-overrides \
             ShutdownTime="$SHUTDOWN_TIME" \
             LambdaFunctionName="$LAMBDA_FUNCTION_NAME" \
             LambdaTimeout="$LAMBDA_TIMEOUT" \
             LambdaMemorySize="$LAMBDA_MEMORY_SIZE" \
+            TargetRegions="$TARGET_REGIONS" \
+            TargetRoleArns="$TARGET_ROLE_ARNS" \
+            StateStoreBucket="$STATE_STORE_BUCKET" \
+            IdleThresholdMinutes="$IDLE_THRESHOLD_MINUTES" \
         --capabilities CAPABILITY_NAMED_IAM \
         --region "$REGION" \
         --no-fail-on-empty-changeset
@@ -101,13 +150,17 @@ update_stack() {
     print_status "Updating existing CloudFormation stack: $STACK_NAME"
     
     aws cloudformation deploy \
-        --template-file "$TEMPLATE_FILE" \
+        --template-file "$PACKAGED_TEMPLATE" \
         --stack-name "$STACK_NAME" \
         --parameter-overrides \
             ShutdownTime="$SHUTDOWN_TIME" \
             LambdaFunctionName="$LAMBDA_FUNCTION_NAME" \
             LambdaTimeout="$LAMBDA_TIMEOUT" \
             LambdaMemorySize="$LAMBDA_MEMORY_SIZE" \
+            TargetRegions="$TARGET_REGIONS" \
+            TargetRoleArns="$TARGET_ROLE_ARNS" \
+            StateStoreBucket="$STATE_STORE_BUCKET" \
+            IdleThresholdMinutes="$IDLE_THRESHOLD_MINUTES" \
         --capabilities CAPABILITY_NAMED_IAM \
         --region "$REGION" \
         --no-fail-on-empty-changeset
@@ -165,6 +218,7 @@ show_usage() {
     echo "  -n, --function-name NAME      Lambda function name (default: mlflow-server-shutdown)"
     echo "  --timeout SECONDS             Lambda timeout in seconds (default: 300)"
     echo "  --memory-size MB              Lambda memory size in MB (default: 256)"
+    echo "  -b, --artifact-bucket BUCKET  S3 bucket for the function package (default: <stack>-artifacts-<account>)"
     echo "  --test                        Test the Lambda function after deployment"
     echo "  --force                       Force deployment even if stack exists"
     echo ""
@@ -221,6 +275,10 @@ while [[ $# -gt 0 ]]; do
             LAMBDA_MEMORY_SIZE="$2"
             shift 2
             ;;
+        -b|--artifact-bucket)
+            ARTIFACT_BUCKET="$2"
+            shift 2
+            ;;
         --test)
             TEST_LAMBDA=true
             shift
@@ -245,6 +303,10 @@ main() {
     check_aws_cli
     check_template
     
+    # Build and upload the function code
+    build_package
+    package_template
+    
     # Check if stack exists
     if check_stack_exists; then
         if [ "$FORCE_DEPLOY" = true ]; then
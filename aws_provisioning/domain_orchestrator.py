@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+"""
+Create, update, delete and check the SageMaker domain stacks of every team.
+
+Python replacement for create-/update-/delete-multiple-domains.sh. Teams
+come from team-config.sh (or --teams). Each team's parameters are rendered
+in memory from the team name (no parameters-<team>.json files), stacks are
+submitted concurrently from a bounded worker pool, and all of them are then
+awaited together by one poll loop that lists every stack in a single
+paginated describe_stacks call per round, backing off while nothing changes.
+
+Usage:
+    python domain_orchestrator.py create
+    python domain_orchestrator.py update --teams iti113-team1 iti113-team2
+    python domain_orchestrator.py update --force
+    python domain_orchestrator.py delete --no-wait
+    python domain_orchestrator.py status
+    python domain_orchestrator.py status --watch
+    python domain_orchestrator.py status --wait --teams iti113-team1 iti113-team2
+
+The status command reads every stack with one paginated describe_stacks call
+(cached for a few seconds) and fetches the recent failed events of failed or
+rolled back stacks concurrently. --watch redraws the table until interrupted,
+and --wait redraws it until every stack has reached a terminal status.
+
+Create and update check the template with one validate_template call per
+run, before any stack is submitted. The SHA-256 of the template and each
+team's parameters is kept in INPUT_CACHE_FILE after every successful
+create or update, and update skips teams whose inputs hash the same and
+whose stack is still in a healthy state, instead of waiting on
+CloudFormation to answer "No updates are to be performed" for each one.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEAM_CONFIG = os.path.join(SCRIPT_DIR, 'team-config.sh')
+TEMPLATE_FILE = os.path.join(SCRIPT_DIR, 'sagemaker_create_domain.yaml')
+DEFAULT_INSTANCE_TYPE = 'ml.t3.medium'
+INPUT_CACHE_FILE = os.path.join(SCRIPT_DIR, '.domain-inputs.json')
+CAPABILITIES = ['CAPABILITY_NAMED_IAM']
+
+# Stack submissions in flight at once
+MAX_WORKERS = 4
+
+# Poll loop: first interval, growth factor while nothing changes, and cap
+POLL_INITIAL_SECONDS = 5.0
+POLL_BACKOFF = 1.5
+POLL_MAX_SECONDS = 30.0
+WAIT_TIMEOUT_SECONDS = 3600.0
+
+# Status dashboard: how long one stack listing is reused, refresh interval
+# of --watch/--wait, and failed events shown per stack
+STATUS_TTL_SECONDS = 5.0
+WATCH_INTERVAL_SECONDS = 10.0
+FAILED_EVENTS = 3
+
+# Status a stack should end in for each operation
+SUCCESS_STATUS = {
+    'create': 'CREATE_COMPLETE',
+    'update': 'UPDATE_COMPLETE',
+    'delete': 'DELETE_COMPLETE',
+}
+
+# Pseudo statuses for stacks that were never submitted or needed nothing
+NO_CHANGES = 'NO_CHANGES'
+DOES_NOT_EXIST = 'DOES_NOT_EXIST'
+SUBMIT_FAILED = 'SUBMIT_FAILED'
+
+TEAM_NAME_PATTERN = re.compile(r'^[a-zA-Z0-9_-]+$')
+
+
+class OrchestratorError(Exception):
+    """Raised for invalid team configuration or a template that fails validation."""
+
+
+def validate_team_name(team: str):
+    """Same rule as validate_team_name in team-config.sh."""
+    if not TEAM_NAME_PATTERN.match(team):
+        raise OrchestratorError(f"Team name '{team}' contains invalid characters. "
+                                "Use only letters, numbers, hyphens, and underscores.")
+
+
+def read_teams(config_path: str = TEAM_CONFIG) -> List[str]:
+    """
+    Read the TEAMS array from team-config.sh. Commented-out assignments are
+    ignored and the last active one wins, as it would in bash.
+    """
+    teams = None
+    with open(config_path) as f:
+        for line in f:
+            match = re.match(r'^\s*TEAMS=\((.*)\)', line)
+            if match:
+                teams = re.findall(r'"([^"]*)"|\'([^\']*)\'|(\S+)', match.group(1))
+                teams = [next(part for part in groups if part) for groups in teams]
+    if teams is None:
+        raise OrchestratorError(f'No TEAMS=(...) assignment found in {config_path}')
+    for team in teams:
+        validate_team_name(team)
+    return teams
+
+
+def stack_name(team: str) -> str:
+    return f'{team}-sagemaker'
+
+
+def team_parameters(team: str, instance_type: str = DEFAULT_INSTANCE_TYPE) -> List[Dict[str, str]]:
+    """The CloudFormation parameters the shell scripts write to parameters-<team>.json."""
+    values = {
+        'DomainName': f'{team}-domain',
+        'StudioUserName': f'{team}-member',
+        'TeamUserName': f'{team}-user',
+        'TeamName': team,
+        'DefaultInstanceType': instance_type,
+    }
+    return [{'ParameterKey': key, 'ParameterValue': value} for key, value in values.items()]
+
+
+def input_hash(template_hash: str, parameters: List[Dict[str, str]]) -> str:
+    """Fingerprint of everything an update sends for one stack: the template's hash and the parameters."""
+    digest = hashlib.sha256(template_hash.encode())
+    digest.update(json.dumps(parameters, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class InputCache:
+    """
+    Input hash each stack was last deployed with, plus the parameter keys of
+    every template that passed validation, kept in a JSON file between runs.
+    A missing or unreadable file is an empty cache.
+    """
+
+    def __init__(self, path: str = INPUT_CACHE_FILE):
+        self.path = path
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.stacks: Dict[str, str] = data.get('stacks', {})
+        self.templates: Dict[str, List[str]] = data.get('templates', {})
+
+    def save(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'stacks': self.stacks, 'templates': self.templates}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def is_terminal(status: str) -> bool:
+    """True once a stack status will not change without a new operation."""
+    return not status.endswith('_IN_PROGRESS')
+
+
+def is_failed(status: str) -> bool:
+    """True for statuses whose cause is in the stack's *_FAILED events."""
+    return 'FAILED' in status or 'ROLLBACK' in status
+
+
+def error_code(error: ClientError) -> str:
+    return error.response.get('Error', {}).get('Code', '')
+
+
+def error_message(error: ClientError) -> str:
+    return error.response.get('Error', {}).get('Message', str(error))
+
+
+class DomainOrchestrator:
+    """
+    Runs one operation over many team stacks.
+
+    Args:
+        client: CloudFormation client (boto3 or a stub with the same methods)
+        template_body: Template text; read from TEMPLATE_FILE when omitted
+        max_workers: Stack submissions in flight at once
+        instance_type: DefaultInstanceType parameter for every team
+        cache: Input hashes from earlier runs; None disables skipping unchanged teams
+        force: Submit updates even for teams whose inputs are unchanged
+        log: Where progress lines go
+        sleep / clock: Replaceable in tests
+    """
+
+    def __init__(self, client, template_body: Optional[str] = None, max_workers: int = MAX_WORKERS,
+                 instance_type: str = DEFAULT_INSTANCE_TYPE, cache: Optional[InputCache] = None,
+                 force: bool = False, log: Callable[[str], None] = print,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        self._template_body = template_body
+        self._template_hash: Optional[str] = None
+        self._template_keys: Optional[List[str]] = None
+        self.cache = cache
+        self.force = force
+        self.max_workers = max(1, max_workers)
+        self.instance_type = instance_type
+        self.log = log
+        self.sleep = sleep
+        self.clock = clock
+
+    @property
+    def template_body(self) -> str:
+        if self._template_body is None:
+            with open(TEMPLATE_FILE) as f:
+                self._template_body = f.read()
+        return self._template_body
+
+    @property
+    def template_hash(self) -> str:
+        if self._template_hash is None:
+            self._template_hash = hashlib.sha256(self.template_body.encode()).hexdigest()
+        return self._template_hash
+
+    def team_hash(self, team: str) -> str:
+        return input_hash(self.template_hash, team_parameters(team, self.instance_type))
+
+    def validate_template(self) -> List[str]:
+        """
+        Validate the template once and return its parameter keys. A template
+        already validated in an earlier run (same hash, per the cache) is not
+        sent again. Raises OrchestratorError if the template is rejected or
+        does not declare every team parameter.
+        """
+        if self._template_keys is None:
+            cached = self.cache.templates.get(self.template_hash) if self.cache is not None else None
+            if cached is None:
+                try:
+                    response = self.client.validate_template(TemplateBody=self.template_body)
+                except ClientError as e:
+                    raise OrchestratorError(f'Template validation failed: {error_message(e)}') from e
+                cached = [p['ParameterKey'] for p in response.get('Parameters', [])]
+            missing = [p['ParameterKey'] for p in team_parameters('team', self.instance_type)
+                       if p['ParameterKey'] not in cached]
+            if missing:
+                raise OrchestratorError(f'Template does not declare parameters: {", ".join(missing)}')
+            self._template_keys = cached
+            if self.cache is not None:
+                self.cache.templates[self.template_hash] = cached
+        return self._template_keys
+
+    def unchanged_teams(self, teams: List[str]) -> List[str]:
+        """
+        Teams whose template and parameters hash the same as at their last
+        successful create or update, and whose stack still exists in a
+        settled, healthy status (checked with one stack listing).
+        """
+        if self.cache is None or self.force:
+            return []
+        candidates = [team for team in teams if self.cache.stacks.get(stack_name(team)) == self.team_hash(team)]
+        if not candidates:
+            return []
+        stacks = self.stack_statuses([stack_name(team) for team in candidates])
+        return [team for team in candidates
+                if stack_name(team) in stacks and is_terminal(stacks[stack_name(team)]['status'])
+                and not is_failed(stacks[stack_name(team)]['status'])]
+
+    # Submission
+
+    def _submit_one(self, operation: str, team: str) -> Dict[str, Any]:
+        name = stack_name(team)
+        result = {'team': team, 'stack': name, 'submitted': False, 'status': None, 'reason': None}
+        try:
+            if operation == 'create':
+                self.client.create_stack(StackName=name, TemplateBody=self.template_body,
+                                         Parameters=team_parameters(team, self.instance_type),
+                                         Capabilities=CAPABILITIES)
+            elif operation == 'update':
+                self.client.update_stack(StackName=name, TemplateBody=self.template_body,
+                                         Parameters=team_parameters(team, self.instance_type),
+                                         Capabilities=CAPABILITIES)
+            else:
+                # delete_stack succeeds silently for a missing stack, so check first
+                self.client.describe_stacks(StackName=name)
+                self.client.delete_stack(StackName=name)
+            result['submitted'] = True
+            self.log(f'{name}: {operation} initiated')
+        except ClientError as e:
+            message = error_message(e)
+            if operation == 'update' and 'No updates are to be performed' in message:
+                result['status'] = NO_CHANGES
+            elif operation != 'create' and 'does not exist' in message:
+                result['status'] = DOES_NOT_EXIST
+            else:
+                result['status'] = SUBMIT_FAILED
+            result['reason'] = message
+            self.log(f'{name}: {operation} not started ({message})')
+        return result
+
+    def submit(self, operation: str, teams: List[str]) -> List[Dict[str, Any]]:
+        """Start the operation on every team's stack, at most max_workers at a time."""
+        if operation not in SUCCESS_STATUS:
+            raise ValueError(f'Unknown operation {operation!r}')
+        for team in teams:
+            validate_team_name(team)
+        if operation != 'delete':
+            self.validate_template()
+
+        skipped = set(self.unchanged_teams(teams)) if operation == 'update' else set()
+        if skipped:
+            self.log(f'Skipping {len(skipped)} teams whose template and parameters are unchanged')
+        to_submit = [team for team in teams if team not in skipped]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(to_submit)))) as executor:
+            submitted = dict(zip(to_submit, executor.map(lambda team: self._submit_one(operation, team), to_submit)))
+        return [
+            submitted[team] if team in submitted else
+            {'team': team, 'stack': stack_name(team), 'submitted': False, 'status': NO_CHANGES,
+             'reason': 'Template and parameters unchanged since the last successful run'}
+            for team in teams
+        ]
+
+    # Status
+
+    def stack_statuses(self, names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Current status of every live stack, keyed by stack name, from one
+        paginated describe_stacks call. Deleted stacks are not included.
+        """
+        wanted = set(names) if names is not None else None
+        stacks = {}
+        kwargs: Dict[str, Any] = {}
+        while True:
+            response = self.client.describe_stacks(**kwargs)
+            for stack in response['Stacks']:
+                if wanted is None or stack['StackName'] in wanted:
+                    stacks[stack['StackName']] = {
+                        'status': stack['StackStatus'],
+                        'reason': stack.get('StackStatusReason'),
+                        'outputs': {o['OutputKey']: o['OutputValue'] for o in stack.get('Outputs', [])},
+                    }
+            if not response.get('NextToken'):
+                return stacks
+            kwargs['NextToken'] = response['NextToken']
+
+    def status(self, teams: List[str]) -> List[Dict[str, Any]]:
+        names = [stack_name(team) for team in teams]
+        stacks = self.stack_statuses(names)
+        return [
+            {'team': team, 'stack': name, **stacks.get(name, {'status': DOES_NOT_EXIST, 'reason': None, 'outputs': {}})}
+            for team, name in zip(teams, names)
+        ]
+
+    def failed_events(self, name: str, limit: int = FAILED_EVENTS) -> List[Dict[str, Any]]:
+        """The most recent *_FAILED events of a stack, newest first, from its first page of events."""
+        try:
+            response = self.client.describe_stack_events(StackName=name)
+        except ClientError as e:
+            self.log(f'{name}: could not read events ({error_message(e)})')
+            return []
+        return [
+            {'resource': e['LogicalResourceId'], 'status': e['ResourceStatus'],
+             'reason': e.get('ResourceStatusReason'), 'time': e.get('Timestamp')}
+            for e in response['StackEvents'] if e['ResourceStatus'].endswith('_FAILED')
+        ][:limit]
+
+    # Waiting
+
+    def wait(self, operation: str, results: List[Dict[str, Any]],
+             timeout: float = WAIT_TIMEOUT_SECONDS) -> List[Dict[str, Any]]:
+        """
+        Poll all submitted stacks together until each reaches a terminal status.
+
+        The interval starts at POLL_INITIAL_SECONDS and grows by POLL_BACKOFF
+        (up to POLL_MAX_SECONDS) for every round in which no stack changed.
+        Stacks still in progress at the timeout keep their last status.
+        """
+        pending = {r['stack']: r for r in results if r['submitted']}
+        deadline = self.clock() + timeout
+        interval = POLL_INITIAL_SECONDS
+        last_seen: Dict[str, str] = {}
+
+        while pending:
+            stacks = self.stack_statuses(list(pending))
+            changed = False
+            for name, result in list(pending.items()):
+                if name in stacks:
+                    status, reason = stacks[name]['status'], stacks[name]['reason']
+                elif operation == 'delete':
+                    status, reason = 'DELETE_COMPLETE', None
+                else:
+                    status, reason = DOES_NOT_EXIST, None
+                if last_seen.get(name) != status:
+                    changed = True
+                    last_seen[name] = status
+                    self.log(f'{name}: {status}')
+                result['status'], result['reason'] = status, reason
+                if is_terminal(status):
+                    del pending[name]
+
+            if not pending:
+                break
+            if self.clock() >= deadline:
+                self.log(f'Timed out waiting for {len(pending)} stacks: {", ".join(sorted(pending))}')
+                break
+            interval = POLL_INITIAL_SECONDS if changed else min(POLL_MAX_SECONDS, interval * POLL_BACKOFF)
+            self.sleep(min(interval, max(0.0, deadline - self.clock())))
+        return results
+
+    def run(self, operation: str, teams: List[str], wait: bool = True,
+            timeout: float = WAIT_TIMEOUT_SECONDS) -> List[Dict[str, Any]]:
+        """Submit the operation for every team and, by default, wait for all of them."""
+        results = self.submit(operation, teams)
+        if wait:
+            self.wait(operation, results, timeout)
+        expected = SUCCESS_STATUS[operation]
+        for result in results:
+            result['ok'] = result['status'] in (expected, NO_CHANGES) or (
+                operation == 'delete' and result['status'] == DOES_NOT_EXIST) or (
+                not wait and result['submitted'])
+        if wait and self.cache is not None:
+            self._record(operation, results)
+        return results
+
+    def _record(self, operation: str, results: List[Dict[str, Any]]):
+        """Remember the inputs of stacks that ended up deployed with them, and forget deleted stacks."""
+        for result in results:
+            if not result['ok']:
+                continue
+            if operation == 'delete':
+                self.cache.stacks.pop(result['stack'], None)
+            else:
+                self.cache.stacks[result['stack']] = self.team_hash(result['team'])
+        self.cache.save()
+
+
+class StatusDashboard:
+    """
+    Status of many team stacks, for the status command.
+
+    The full stack listing is fetched once per ttl seconds whatever the
+    number of teams, and failed events are fetched (concurrently) only for
+    stacks in a failed status, once per stack and status.
+
+    Args:
+        orchestrator: Supplies the client, worker count, log, sleep and clock
+        ttl: Seconds a stack listing is reused
+        events: Failed events kept per stack
+    """
+
+    def __init__(self, orchestrator: DomainOrchestrator, ttl: float = STATUS_TTL_SECONDS,
+                 events: int = FAILED_EVENTS):
+        self.orchestrator = orchestrator
+        self.ttl = ttl
+        self.events = events
+        self._stacks: Optional[Dict[str, Dict[str, Any]]] = None
+        self._fetched_at = 0.0
+        self._events: Dict[tuple, List[Dict[str, Any]]] = {}
+
+    def stacks(self, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        now = self.orchestrator.clock()
+        if force or self._stacks is None or now - self._fetched_at >= self.ttl:
+            self._stacks = self.orchestrator.stack_statuses()
+            self._fetched_at = now
+        return self._stacks
+
+    def snapshot(self, teams: List[str], force: bool = False) -> List[Dict[str, Any]]:
+        """One row per team with status, reason, outputs and recent failed events."""
+        stacks = self.stacks(force)
+        rows = []
+        for team in teams:
+            name = stack_name(team)
+            rows.append({'team': team, 'stack': name,
+                         **stacks.get(name, {'status': DOES_NOT_EXIST, 'reason': None, 'outputs': {}})})
+
+        missing = [(r['stack'], r['status']) for r in rows
+                   if self.events and is_failed(r['status']) and (r['stack'], r['status']) not in self._events]
+        if missing:
+            workers = min(self.orchestrator.max_workers, len(missing))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                fetched = executor.map(lambda key: self.orchestrator.failed_events(key[0], self.events), missing)
+                self._events.update(zip(missing, fetched))
+        for row in rows:
+            row['events'] = self._events.get((row['stack'], row['status']), [])
+        return rows
+
+    @staticmethod
+    def render(rows: List[Dict[str, Any]]) -> str:
+        counts = {'complete': 0, 'in progress': 0, 'failed': 0, 'missing': 0}
+        lines = [f"{'stack':<36}{'status':<28}reason"]
+        for row in rows:
+            status = row['status']
+            if status == DOES_NOT_EXIST:
+                counts['missing'] += 1
+            elif not is_terminal(status):
+                counts['in progress'] += 1
+            elif is_failed(status):
+                counts['failed'] += 1
+            else:
+                counts['complete'] += 1
+            lines.append(f"{row['stack']:<36}{status:<28}{row.get('reason') or ''}")
+            for event in row.get('events', []):
+                lines.append(f"    {event['resource']} {event['status']}: {event['reason'] or ''}")
+        lines.append(f"{len(rows)} stacks: " + ', '.join(f'{count} {label}' for label, count in counts.items()))
+        return '\n'.join(lines)
+
+    def watch(self, teams: List[str], until_terminal: bool = False, interval: float = WATCH_INTERVAL_SECONDS,
+              timeout: float = WAIT_TIMEOUT_SECONDS, out=sys.stdout) -> List[Dict[str, Any]]:
+        """
+        Redraw the table every interval seconds. With until_terminal, return
+        once no stack is in progress (or at the timeout); otherwise run until
+        interrupted.
+        """
+        clock, sleep = self.orchestrator.clock, self.orchestrator.sleep
+        deadline = clock() + timeout
+        while True:
+            rows = self.snapshot(teams)
+            if out.isatty():
+                out.write('\033[H\033[2J')
+            out.write(self.render(rows) + '\n')
+            out.flush()
+            if until_terminal:
+                if all(is_terminal(r['status']) for r in rows) or clock() >= deadline:
+                    return rows
+                sleep(min(interval, max(0.0, deadline - clock())))
+            else:
+                sleep(interval)
+
+
+def print_table(rows: List[Dict[str, Any]]):
+    print(f"{'stack':<36}{'status':<28}reason")
+    for row in rows:
+        print(f"{row['stack']:<36}{row['status'] or 'SUBMITTED':<28}{row.get('reason') or ''}")
+
+
+def show_status(dashboard: StatusDashboard, teams: List[str], args):
+    """The status command: one table, a live table (--watch), or a live table until settled (--wait)."""
+    if args.watch or args.wait:
+        # With --json the live table goes to stderr and only the final rows to stdout
+        out = sys.stderr if args.json else sys.stdout
+        try:
+            rows = dashboard.watch(teams, until_terminal=args.wait, interval=args.interval,
+                                   timeout=args.timeout, out=out)
+        except KeyboardInterrupt:
+            return
+    else:
+        rows = dashboard.snapshot(teams)
+        if not args.json:
+            print(dashboard.render(rows))
+    if args.json:
+        print(json.dumps(rows, indent=2, default=str))
+    if args.wait and any(is_failed(r['status']) or not is_terminal(r['status']) for r in rows):
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the SageMaker domain stacks of all teams.')
+    parser.add_argument('command', choices=['create', 'update', 'delete', 'status'])
+    parser.add_argument('--teams', nargs='+', help='Teams to process (default: TEAMS in team-config.sh)')
+    parser.add_argument('--config', default=TEAM_CONFIG, help='Team configuration file (default: %(default)s)')
+    parser.add_argument('--instance-type', default=DEFAULT_INSTANCE_TYPE)
+    parser.add_argument('--max-workers', type=int, default=MAX_WORKERS,
+                        help='Stacks submitted concurrently (default: %(default)s)')
+    parser.add_argument('--no-wait', action='store_true', help='Return once every operation is submitted')
+    parser.add_argument('--force', action='store_true', help='update: submit teams whose inputs are unchanged too')
+    parser.add_argument('--cache-file', default=INPUT_CACHE_FILE,
+                        help='Input hashes from earlier runs (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=WAIT_TIMEOUT_SECONDS, help='Seconds to wait (default: %(default)s)')
+    parser.add_argument('--region', help='AWS region (default: from the environment)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--watch', action='store_true', help='status: redraw the table until interrupted')
+    parser.add_argument('--wait', action='store_true', help='status: redraw the table until no stack is in progress')
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL_SECONDS,
+                        help='status: seconds between redraws (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    import boto3
+
+    try:
+        teams = args.teams or read_teams(args.config)
+        for team in teams:
+            validate_team_name(team)
+    except OrchestratorError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    orchestrator = DomainOrchestrator(boto3.client('cloudformation', region_name=args.region),
+                                      max_workers=args.max_workers, instance_type=args.instance_type,
+                                      cache=InputCache(args.cache_file), force=args.force, log=(lambda line: print(line, file=sys.stderr)))
+    if args.command == 'status':
+        show_status(StatusDashboard(orchestrator), teams, args)
+        return
+
+    print(f"{args.command.capitalize()} SageMaker domains for teams: {' '.join(teams)}", file=sys.stderr)
+    try:
+        rows = orchestrator.run(args.command, teams, wait=not args.no_wait, timeout=args.timeout)
+    except OrchestratorError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(rows, indent=2, default=str))
+    else:
+        print_table(rows)
+    if any(not r['ok'] for r in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
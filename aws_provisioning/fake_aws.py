@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""
+In-process fake SageMaker, CloudWatch and CloudFormation clients for
+testing and benchmarking the provisioning tools without an AWS account.
+
+FakeSageMaker implements the calls the Lambda makes
+(list_mlflow_tracking_servers via get_paginator, describe, stop and start)
+over a simulated fleet. It supports:
+- any number of servers, listed in pages of page_size
+- a fixed per-call latency
+- throttling errors on a random fraction of calls
+- Stopping -> Stopped (and Starting -> Started) transitions after a delay
+- servers whose stop fails (StopFailed)
+
+FakeCloudFormation keeps stacks that move from *_IN_PROGRESS to their final
+status after a number of describe_stacks calls, for domain_orchestrator.py.
+Failed operations leave a *_FAILED resource event in describe_stack_events.
+
+FakeS3 holds buckets of object versions and delete markers, listed in pages
+by list_object_versions and removed by delete_objects, for s3_purge.py.
+
+Every call is counted in call_counts so runs can be compared.
+
+Usage:
+    sagemaker = FakeSageMaker.with_fleet(2000, running_fraction=0.5, latency=0.02)
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker):
+        lambda_stop_mlflow_servers.lambda_handler({}, None)
+    print(sagemaker.call_counts)
+"""
+
+import bisect
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from botocore.exceptions import ClientError
+
+DEFAULT_ACCOUNT = '123456789012'
+DEFAULT_REGION = 'us-east-1'
+
+# Operations that can be throttled unless told otherwise. Listing is left out
+# because the Lambda (like boto3 paginators) does not retry individual pages.
+DEFAULT_THROTTLED_OPERATIONS = {
+    'DescribeMlflowTrackingServer',
+    'StopMlflowTrackingServer',
+    'StartMlflowTrackingServer',
+}
+
+
+def client_error(code: str, message: str, operation: str) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+class FakePaginator:
+    """Paginator whose pages are fetched lazily, one simulated call each."""
+
+    def __init__(self, service: 'FakeSageMaker'):
+        self.service = service
+
+    def paginate(self, **kwargs) -> Iterable[Dict[str, Any]]:
+        token = None
+        while True:
+            page = self.service.list_mlflow_tracking_servers(NextToken=token) if token else \
+                self.service.list_mlflow_tracking_servers()
+            yield page
+            token = page.get('NextToken')
+            if not token:
+                return
+
+
+class FakeSageMaker:
+    """
+    Simulated SageMaker client holding a fleet of MLflow tracking servers.
+
+    Args:
+        page_size: Servers per list page
+        latency: Seconds every call takes
+        throttle_rate: Fraction of throttleable calls that raise ThrottlingException
+        throttled_operations: Operations that may be throttled
+        stop_delay: Seconds a server spends in Stopping before it is Stopped
+        start_delay: Seconds a server spends in Starting before it is Started
+        seed: Seed for the throttling decisions
+        clock: Time source, replaceable in tests
+        region / account: Used to build the server ARNs
+    """
+
+    def __init__(self, page_size: int = 100, latency: float = 0.0, throttle_rate: float = 0.0,
+                 throttled_operations: Optional[Iterable[str]] = None,
+                 stop_delay: float = 0.0, start_delay: float = 0.0, seed: int = 0,
+                 clock: Callable[[], float] = time.monotonic,
+                 region: str = DEFAULT_REGION, account: str = DEFAULT_ACCOUNT):
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.throttled_operations = set(DEFAULT_THROTTLED_OPERATIONS if throttled_operations is None
+                                        else throttled_operations)
+        self.stop_delay = stop_delay
+        self.start_delay = start_delay
+        self.clock = clock
+        self.region = region
+        self.account = account
+        self.call_counts: Counter = Counter()
+        self.throttled_counts: Counter = Counter()
+        self._servers: Dict[str, Dict[str, Any]] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def with_fleet(cls, count: int, running_fraction: float = 0.5, fail_fraction: float = 0.0,
+                   prefix: str = 'mlflow-server', seed: int = 0, **kwargs) -> 'FakeSageMaker':
+        """
+        Create a fake with count servers, of which running_fraction are Started
+        and fail_fraction of those fail to stop.
+        """
+        service = cls(seed=seed, **kwargs)
+        rng = random.Random(seed)
+        for i in range(count):
+            running = rng.random() < running_fraction
+            service.add_server(f'{prefix}-{i:05d}', 'Started' if running else 'Stopped',
+                               fail_stop=running and rng.random() < fail_fraction,
+                               size=rng.choice(('Small', 'Medium', 'Large')))
+        return service
+
+    # Fleet management (not part of the SageMaker API)
+
+    def add_server(self, name: str, status: str = 'Started', fail_stop: bool = False,
+                   last_modified: Optional[datetime] = None, size: str = 'Small'):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._servers[name] = {
+                'TrackingServerName': name,
+                'TrackingServerArn': f'arn:aws:sagemaker:{self.region}:{self.account}:mlflow-tracking-server/{name}',
+                'TrackingServerStatus': status,
+                'IsActive': 'Active',
+                'MlflowVersion': '2.16.2',
+                'TrackingServerSize': size,
+                'CreationTime': now - timedelta(days=1),
+                'LastModifiedTime': last_modified or now,
+                'fail_stop': fail_stop,
+                'settles_at': None,
+            }
+
+    def statuses(self) -> Dict[str, str]:
+        """Current status of every server, by name."""
+        with self._lock:
+            return {name: self._status(server) for name, server in self._servers.items()}
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.call_counts.values())
+
+    # Simulation internals
+
+    def _status(self, server: Dict[str, Any]) -> str:
+        """Resolve a pending transition whose delay has elapsed (lock held)."""
+        settles_at = server['settles_at']
+        if settles_at is not None and self.clock() >= settles_at:
+            status = server['TrackingServerStatus']
+            server['TrackingServerStatus'] = {'Stopping': 'Stopped', 'Starting': 'Started'}.get(status, status)
+            server['LastModifiedTime'] = datetime.now(timezone.utc)
+            server['settles_at'] = None
+        return server['TrackingServerStatus']
+
+    def _call(self, operation: str):
+        """Count the call, wait out the latency and maybe throttle it."""
+        with self._lock:
+            self.call_counts[operation] += 1
+            throttled = (operation in self.throttled_operations
+                         and self.throttle_rate > 0
+                         and self._random.random() < self.throttle_rate)
+            if throttled:
+                self.throttled_counts[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            raise client_error('ThrottlingException', 'Rate exceeded', operation)
+
+    def _get(self, name: str, operation: str) -> Dict[str, Any]:
+        server = self._servers.get(name)
+        if server is None:
+            raise client_error('ResourceNotFound', f'Tracking server {name} does not exist', operation)
+        return server
+
+    @staticmethod
+    def _public(server: Dict[str, Any], fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        keys = fields or [k for k in server if k not in ('fail_stop', 'settles_at')]
+        return {k: server[k] for k in keys}
+
+    # SageMaker API
+
+    def get_paginator(self, operation_name: str) -> FakePaginator:
+        if operation_name != 'list_mlflow_tracking_servers':
+            raise NotImplementedError(f'FakeSageMaker has no paginator for {operation_name}')
+        return FakePaginator(self)
+
+    def list_mlflow_tracking_servers(self, NextToken: Optional[str] = None, MaxResults: Optional[int] = None,
+                                     **kwargs) -> Dict[str, Any]:
+        self._call('ListMlflowTrackingServers')
+        start = int(NextToken) if NextToken else 0
+        size = MaxResults or self.page_size
+        summary_fields = ('TrackingServerArn', 'TrackingServerName', 'CreationTime', 'LastModifiedTime',
+                          'TrackingServerStatus', 'IsActive', 'MlflowVersion')
+        with self._lock:
+            names = sorted(self._servers)[start:start + size]
+            summaries = []
+            for name in names:
+                server = self._servers[name]
+                self._status(server)
+                summaries.append(self._public(server, summary_fields))
+        page = {'TrackingServerSummaries': summaries}
+        if start + size < len(self._servers):
+            page['NextToken'] = str(start + size)
+        return page
+
+    def describe_mlflow_tracking_server(self, TrackingServerName: str) -> Dict[str, Any]:
+        operation = 'DescribeMlflowTrackingServer'
+        self._call(operation)
+        with self._lock:
+            server = self._get(TrackingServerName, operation)
+            self._status(server)
+            return self._public(server)
+
+    def stop_mlflow_tracking_server(self, TrackingServerName: str) -> Dict[str, Any]:
+        operation = 'StopMlflowTrackingServer'
+        self._call(operation)
+        with self._lock:
+            server = self._get(TrackingServerName, operation)
+            status = self._status(server)
+            if status != 'Started':
+                raise client_error('ValidationException',
+                                   f'Tracking server {TrackingServerName} is {status}, not Started', operation)
+            server['LastModifiedTime'] = datetime.now(timezone.utc)
+            if server['fail_stop']:
+                server['TrackingServerStatus'] = 'StopFailed'
+                raise client_error('InternalFailure', f'Failed to stop {TrackingServerName}', operation)
+            server['TrackingServerStatus'] = 'Stopping'
+            server['settles_at'] = self.clock() + self.stop_delay
+            return {'TrackingServerArn': server['TrackingServerArn']}
+
+    def start_mlflow_tracking_server(self, TrackingServerName: str) -> Dict[str, Any]:
+        operation = 'StartMlflowTrackingServer'
+        self._call(operation)
+        with self._lock:
+            server = self._get(TrackingServerName, operation)
+            status = self._status(server)
+            if status != 'Stopped':
+                raise client_error('ValidationException',
+                                   f'Tracking server {TrackingServerName} is {status}, not Stopped', operation)
+            server['TrackingServerStatus'] = 'Starting'
+            server['LastModifiedTime'] = datetime.now(timezone.utc)
+            server['settles_at'] = self.clock() + self.start_delay
+            return {'TrackingServerArn': server['TrackingServerArn']}
+
+
+class FakeCloudWatch:
+    """Simulated CloudWatch client that records put_metric_data calls."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.call_counts: Counter = Counter()
+        self.metric_data: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def put_metric_data(self, Namespace: str, MetricData: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if len(MetricData) > 1000:
+            raise client_error('InvalidParameterValue', 'At most 1000 datapoints per call', 'PutMetricData')
+        with self._lock:
+            self.call_counts['PutMetricData'] += 1
+            self.metric_data.extend(dict(datum, Namespace=Namespace) for datum in MetricData)
+        if self.latency:
+            time.sleep(self.latency)
+        return {}
+
+
+class FakeCloudFormation:
+    """
+    Simulated CloudFormation client for the stack operations the domain
+    tooling uses.
+
+    Each create/update/delete leaves the stack *_IN_PROGRESS for `ticks`
+    describe_stacks calls before it settles. Stacks named in fail_stacks roll
+    back instead of completing.
+
+    Args:
+        ticks: describe_stacks calls an operation stays in progress
+        page_size: Stacks per describe_stacks page
+        fail_stacks: Names of stacks whose create/update fails
+    """
+
+    def __init__(self, ticks: int = 2, page_size: int = 100, fail_stacks: Iterable[str] = ()):
+        self.ticks = ticks
+        self.page_size = page_size
+        self.fail_stacks = set(fail_stacks)
+        self.call_counts: Counter = Counter()
+        self.stacks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add_stack(self, name: str, status: str = 'CREATE_COMPLETE', template_body: str = '',
+                  parameters: Optional[List[Dict[str, str]]] = None):
+        """Put an existing stack in place (not part of the CloudFormation API)."""
+        with self._lock:
+            self.stacks[name] = {
+                'StackName': name,
+                'StackId': f'arn:aws:cloudformation:{DEFAULT_REGION}:{DEFAULT_ACCOUNT}:stack/{name}/{len(self.stacks)}',
+                'StackStatus': status,
+                'TemplateBody': template_body,
+                'Parameters': list(parameters or []),
+                'CreationTime': datetime.now(timezone.utc),
+                'ticks_left': 0,
+                'final_status': status,
+                'failed_resource': None,
+                'Events': [],
+            }
+
+    def _event(self, stack: Dict[str, Any], logical_id: str, status: str, reason: Optional[str] = None):
+        stack['Events'].insert(0, {
+            'StackName': stack['StackName'],
+            'EventId': f"{stack['StackName']}-{len(stack['Events'])}",
+            'LogicalResourceId': logical_id,
+            'ResourceStatus': status,
+            'ResourceStatusReason': reason,
+            'Timestamp': datetime.now(timezone.utc),
+        })
+
+    def _start(self, stack: Dict[str, Any], operation: str):
+        failed = stack['StackName'] in self.fail_stacks and operation != 'DELETE'
+        stack['StackStatus'] = f'{operation}_IN_PROGRESS'
+        stack['ticks_left'] = self.ticks
+        stack['final_status'] = {
+            'CREATE': 'ROLLBACK_COMPLETE' if failed else 'CREATE_COMPLETE',
+            'UPDATE': 'UPDATE_ROLLBACK_COMPLETE' if failed else 'UPDATE_COMPLETE',
+            'DELETE': 'DELETE_COMPLETE',
+        }[operation]
+        stack['failed_resource'] = f'{operation}_FAILED' if failed else None
+        if failed:
+            stack['StackStatusReason'] = 'The following resource(s) failed: [SageMakerStudioInternetOnlyDomain]'
+        self._event(stack, stack['StackName'], stack['StackStatus'])
+        self._advance(stack, 0)
+
+    def _advance(self, stack: Dict[str, Any], ticks: int = 1):
+        if stack['StackStatus'].endswith('_IN_PROGRESS'):
+            stack['ticks_left'] -= ticks
+            if stack['ticks_left'] <= 0:
+                stack['StackStatus'] = stack['final_status']
+                if stack['failed_resource']:
+                    self._event(stack, 'SageMakerStudioInternetOnlyDomain', stack['failed_resource'],
+                                'Resource handler returned message: "Service quota exceeded"')
+                self._event(stack, stack['StackName'], stack['StackStatus'], stack.get('StackStatusReason'))
+                if stack['StackStatus'] == 'DELETE_COMPLETE':
+                    del self.stacks[stack['StackName']]
+
+    def _missing(self, name: str, operation: str) -> ClientError:
+        return client_error('ValidationError', f'Stack with id {name} does not exist', operation)
+
+    @staticmethod
+    def _public(stack: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in stack.items()
+                if k in ('StackName', 'StackId', 'StackStatus', 'StackStatusReason', 'Parameters', 'CreationTime')}
+
+    def create_stack(self, StackName: str, TemplateBody: str, Parameters=None, Capabilities=None, **kwargs):
+        with self._lock:
+            self.call_counts['CreateStack'] += 1
+            if StackName in self.stacks:
+                raise client_error('AlreadyExistsException', f'Stack [{StackName}] already exists', 'CreateStack')
+        self.add_stack(StackName, 'CREATE_IN_PROGRESS', TemplateBody, Parameters)
+        with self._lock:
+            stack = self.stacks[StackName]
+            self._start(stack, 'CREATE')
+            return {'StackId': stack['StackId']}
+
+    def update_stack(self, StackName: str, TemplateBody: str, Parameters=None, Capabilities=None, **kwargs):
+        with self._lock:
+            self.call_counts['UpdateStack'] += 1
+            stack = self.stacks.get(StackName)
+            if stack is None:
+                raise self._missing(StackName, 'UpdateStack')
+            if not is_settled(stack['StackStatus']):
+                raise client_error('ValidationError', f'Stack:{stack["StackId"]} is in {stack["StackStatus"]} '
+                                   'state and can not be updated.', 'UpdateStack')
+            if stack['TemplateBody'] == TemplateBody and stack['Parameters'] == list(Parameters or []):
+                raise client_error('ValidationError', 'No updates are to be performed.', 'UpdateStack')
+            stack['TemplateBody'] = TemplateBody
+            stack['Parameters'] = list(Parameters or [])
+            self._start(stack, 'UPDATE')
+            return {'StackId': stack['StackId']}
+
+    def delete_stack(self, StackName: str, **kwargs):
+        with self._lock:
+            self.call_counts['DeleteStack'] += 1
+            stack = self.stacks.get(StackName)
+            if stack is not None and not stack['StackStatus'].startswith('DELETE'):
+                self._start(stack, 'DELETE')
+            return {}
+
+    def describe_stacks(self, StackName: Optional[str] = None, NextToken: Optional[str] = None, **kwargs):
+        with self._lock:
+            self.call_counts['DescribeStacks'] += 1
+            for stack in list(self.stacks.values()):
+                self._advance(stack)
+            if StackName is not None:
+                stack = self.stacks.get(StackName)
+                if stack is None:
+                    raise self._missing(StackName, 'DescribeStacks')
+                return {'Stacks': [self._public(stack)]}
+            names = sorted(self.stacks)
+            start = int(NextToken) if NextToken else 0
+            response = {'Stacks': [self._public(self.stacks[n]) for n in names[start:start + self.page_size]]}
+            if start + self.page_size < len(names):
+                response['NextToken'] = str(start + self.page_size)
+            return response
+
+    def describe_stack_events(self, StackName: str, NextToken: Optional[str] = None, **kwargs):
+        with self._lock:
+            self.call_counts['DescribeStackEvents'] += 1
+            stack = self.stacks.get(StackName)
+            if stack is None:
+                raise self._missing(StackName, 'DescribeStackEvents')
+            start = int(NextToken) if NextToken else 0
+            response = {'StackEvents': [dict(e) for e in stack['Events'][start:start + self.page_size]]}
+            if start + self.page_size < len(stack['Events']):
+                response['NextToken'] = str(start + self.page_size)
+            return response
+
+    def validate_template(self, TemplateBody: str, **kwargs):
+        """Rejects templates without Resources; parameters are the keys indented under Parameters:."""
+        with self._lock:
+            self.call_counts['ValidateTemplate'] += 1
+        if not re.search(r'^Resources:', TemplateBody, re.MULTILINE):
+            raise client_error('ValidationError', 'Template format error: At least one Resources member must be defined.',
+                               'ValidateTemplate')
+        section = re.search(r'^Parameters:\n((?:[ \t].*\n|\n)*)', TemplateBody, re.MULTILINE)
+        keys = re.findall(r'^  (\w+):', section.group(1), re.MULTILINE) if section else []
+        return {'Parameters': [{'ParameterKey': key} for key in keys], 'Capabilities': ['CAPABILITY_NAMED_IAM']}
+
+    def statuses(self) -> Dict[str, str]:
+        with self._lock:
+            return {name: stack['StackStatus'] for name, stack in self.stacks.items()}
+
+
+class FakeS3:
+    """
+    Simulated S3 client for emptying and deleting buckets.
+
+    Every bucket holds (key, version id) entries. list_object_versions pages
+    through them with key and version id markers like S3 does, so deleting
+    entries between pages does not skip any.
+
+    Args:
+        page_size: Largest page list_object_versions returns
+        latency: Seconds every call sleeps
+        fail_keys: Keys delete_objects reports as AccessDenied
+    """
+
+    def __init__(self, page_size: int = 1000, latency: float = 0.0, fail_keys: Iterable[str] = ()):
+        self.page_size = page_size
+        self.latency = latency
+        self.fail_keys = set(fail_keys)
+        self.call_counts: Counter = Counter()
+        self.max_batch = 0
+        self.buckets: Dict[str, List[tuple]] = {}
+        self._lock = threading.Lock()
+
+    def add_bucket(self, name: str, objects: int = 0, versions: int = 1, delete_markers: bool = False):
+        """
+        Create a bucket holding `objects` keys with `versions` versions each,
+        plus a delete marker per key if asked (not part of the S3 API).
+        """
+        entries = []
+        for i in range(objects):
+            key = f'artifacts/{i:08d}.bin'
+            entries.extend((key, f'v{v:04d}', False) for v in range(versions))
+            if delete_markers:
+                entries.append((key, 'dm0000', True))
+        with self._lock:
+            self.buckets[name] = sorted(entries)
+
+    def _call(self, operation: str):
+        with self._lock:
+            self.call_counts[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _bucket(self, name: str, operation: str) -> List[tuple]:
+        if name not in self.buckets:
+            raise client_error('NoSuchBucket', 'The specified bucket does not exist', operation)
+        return self.buckets[name]
+
+    def list_buckets(self, **kwargs) -> Dict[str, Any]:
+        self._call('ListBuckets')
+        with self._lock:
+            return {'Buckets': [{'Name': name} for name in sorted(self.buckets)]}
+
+    def list_object_versions(self, Bucket: str, KeyMarker: Optional[str] = None,
+                             VersionIdMarker: Optional[str] = None, MaxKeys: int = 1000,
+                             **kwargs) -> Dict[str, Any]:
+        self._call('ListObjectVersions')
+        with self._lock:
+            entries = self._bucket(Bucket, 'ListObjectVersions')
+            start = bisect.bisect_right(entries, (KeyMarker, VersionIdMarker, True)) if KeyMarker else 0
+            page = entries[start:start + min(MaxKeys, self.page_size)]
+            response = {
+                'Versions': [{'Key': k, 'VersionId': v} for k, v, marker in page if not marker],
+                'DeleteMarkers': [{'Key': k, 'VersionId': v} for k, v, marker in page if marker],
+                'IsTruncated': start + len(page) < len(entries),
+            }
+            if response['IsTruncated']:
+                response['NextKeyMarker'], response['NextVersionIdMarker'] = page[-1][:2]
+            return response
+
+    def delete_objects(self, Bucket: str, Delete: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        self._call('DeleteObjects')
+        objects = Delete['Objects']
+        if len(objects) > 1000:
+            raise client_error('MalformedXML', 'The XML you provided was not well-formed', 'DeleteObjects')
+        with self._lock:
+            entries = self._bucket(Bucket, 'DeleteObjects')
+            self.max_batch = max(self.max_batch, len(objects))
+            doomed = {(o['Key'], o['VersionId']) for o in objects if o['Key'] not in self.fail_keys}
+            self.buckets[Bucket] = [e for e in entries if e[:2] not in doomed]
+        errors = [{'Key': o['Key'], 'VersionId': o['VersionId'], 'Code': 'AccessDenied', 'Message': 'Access Denied'}
+                  for o in objects if o['Key'] in self.fail_keys]
+        return {'Errors': errors} if errors else {}
+
+    def delete_bucket(self, Bucket: str, **kwargs) -> Dict[str, Any]:
+        self._call('DeleteBucket')
+        with self._lock:
+            if self._bucket(Bucket, 'DeleteBucket'):
+                raise client_error('BucketNotEmpty', 'The bucket you tried to delete is not empty', 'DeleteBucket')
+            del self.buckets[Bucket]
+            return {}
+
+    def object_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: len(entries) for name, entries in self.buckets.items()}
+
+
+def is_settled(status: str) -> bool:
+    return not status.endswith('_IN_PROGRESS')
+
+
+class FakeLambdaContext:
+    """Lambda context whose remaining time counts down from timeout_seconds."""
+
+    function_name = 'mlflow-server-shutdown'
+
+    def __init__(self, timeout_seconds: float = 900):
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
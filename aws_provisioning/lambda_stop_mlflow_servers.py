@@ -1,102 +1,327 @@
+import time
+_import_started = time.perf_counter()
+
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
+_boto3_imported = time.perf_counter()
+import contextlib
+import functools
 import json
 import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+try:
+    from tracing import tracer
+except ImportError:
+    # Deployed without tracing.py (from demo_apps/) next to it: spans are no-ops
+    tracer = None
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize AWS clients
-sagemaker_client = boto3.client('sagemaker')
-cloudwatch_client = boto3.client('cloudwatch')
+# Where cold-start time goes; reported once by the first invocation
+COLD_START_TIMINGS: Dict[str, Any] = {
+    'import_boto3_ms': round((_boto3_imported - _import_started) * 1000, 1),
+    'client_init_ms': {}
+}
+_cold_start = True
+
+# Describe every server instead of working from the list summaries (for audits)
+FULL_DETAILS = os.environ.get('FULL_DETAILS', 'false').lower() == 'true'
+
+# Maximum number of describe_mlflow_tracking_server calls in flight at once
+DESCRIBE_CONCURRENCY = int(os.environ.get('DESCRIBE_CONCURRENCY', '8'))
+
+# Concurrent stop calls and the maximum rate at which they are issued
+STOP_CONCURRENCY = int(os.environ.get('STOP_CONCURRENCY', '8'))
+STOP_RATE_PER_SECOND = float(os.environ.get('STOP_RATE_PER_SECOND', '5'))
+
+# Optionally wait until the stopped servers actually reach 'Stopped'
+WAIT_FOR_STOP = os.environ.get('WAIT_FOR_STOP', 'false').lower() == 'true'
+WAIT_POLL_INTERVAL = float(os.environ.get('WAIT_POLL_INTERVAL', '15'))
+WAIT_SAFETY_MARGIN_MS = int(os.environ.get('WAIT_SAFETY_MARGIN_MS', '20000'))
+WAIT_MAX_SECONDS = float(os.environ.get('WAIT_MAX_SECONDS', '840'))
+
+# Regions and assumable role ARNs to fan out over (comma separated). When
+# neither is set only the Lambda's own account and region are processed.
+TARGET_REGIONS = [r.strip() for r in os.environ.get('TARGET_REGIONS', '').split(',') if r.strip()]
+TARGET_ROLE_ARNS = [r.strip() for r in os.environ.get('TARGET_ROLE_ARNS', '').split(',') if r.strip()]
+TARGET_CONCURRENCY = int(os.environ.get('TARGET_CONCURRENCY', '4'))
+
+# Stop issuing stop calls once less than this much Lambda time remains; the
+# servers not reached are handed to the next invocation as a continuation
+STOP_SAFETY_MARGIN_MS = int(os.environ.get('STOP_SAFETY_MARGIN_MS', '10000'))
+
+# Optional local file holding continuation tokens for the next invocation
+CONTINUATION_QUEUE = os.environ.get('CONTINUATION_QUEUE', '')
+
+# A queued token is only removed once its invocation finishes; one whose
+# invocations keep failing is dropped after this many deliveries
+CONTINUATION_MAX_ATTEMPTS = int(os.environ.get('CONTINUATION_MAX_ATTEMPTS', '3'))
+
+# Relative hourly cost of each tracking server size; bigger servers are stopped first
+SERVER_SIZE_COST = {'Large': 3, 'Medium': 2, 'Small': 1}
+
+# Only stop servers idle for longer than this many minutes (0 stops every
+# running server). Activity comes from the probes named in ACTIVITY_PROBES.
+IDLE_THRESHOLD_MINUTES = float(os.environ.get('IDLE_THRESHOLD_MINUTES', '0'))
+ACTIVITY_PROBES = [p.strip() for p in os.environ.get('ACTIVITY_PROBES', 'last_modified').split(',') if p.strip()]
+ACTIVITY_TAG = os.environ.get('ACTIVITY_TAG', 'LastActivity')
+
+# Report what would be stopped without stopping anything
+DRY_RUN = os.environ.get('DRY_RUN', 'false').lower() == 'true'
+
+# Statuses after which a stopping server will not change any more
+TERMINAL_STOP_STATUSES = {'Stopped', 'StopFailed'}
+
+# Retry settings for throttled API calls
+MAX_RETRIES = int(os.environ.get('MAX_RETRIES', '5'))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', '0.2'))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', '5.0'))
+
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'SlowDown',
+}
+
+# Where metrics go: 'emf' (structured log lines, no API call), 'api'
+# (PutMetricData) or 'memory' (kept in process, for tests)
+METRICS_BACKEND = os.environ.get('METRICS_BACKEND', 'emf').lower()
+METRICS_NAMESPACE = 'MLflowTrackingServer/Shutdown'
+
+# Optional store of each server's last seen status, e.g. /tmp/mlflow-shutdown.db
+# (SQLite, survives warm invocations only) or s3://bucket/key. Empty disables it.
+STATE_STORE = os.environ.get('STATE_STORE', '')
+
+# Statuses of a server that we consider shut down when looking for restarts
+SHUT_DOWN_STATUSES = {'Stopping', 'Stopped'}
 
+# AWS clients are built lazily on first use and cached per region, so
+# importing this module costs no client construction. The pool is sized for
+# the concurrent describe/stop calls; throttling is retried by
+# call_with_retry, so botocore only makes a couple of quick attempts.
+CLIENT_CONFIG = Config(
+    max_pool_connections=max(10, DESCRIBE_CONCURRENCY, STOP_CONCURRENCY),
+    connect_timeout=int(os.environ.get('CLIENT_CONNECT_TIMEOUT', '5')),
+    read_timeout=int(os.environ.get('CLIENT_READ_TIMEOUT', '30')),
+    retries={'mode': 'standard', 'max_attempts': 3},
+    tcp_keepalive=True
+)
+
+# Assumed-role clients are rebuilt when their credentials get this close to expiry
+CREDENTIAL_REFRESH_MARGIN_SECONDS = 300
+
+_clients: Dict[Tuple, Any] = {}
+_clients_lock = threading.Lock()
+
+def traced(name: str) -> Callable:
+    """Decorator timing every call of a function as a span (a no-op unless TRACE_FILE is set)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if tracer is None or not tracer.enabled:
+                return fn(*args, **kwargs)
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def trace_span(name: str, **args):
+    """Context manager timing a block as a span (a no-op unless TRACE_FILE is set)."""
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, **args)
+
+def traced_invocation(handler: Callable) -> Callable:
+    """
+    Trace each invocation as one root span and write the trace file when it
+    ends. Warm invocations start from an empty trace, so the file always
+    holds the latest run.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if tracer is None or not tracer.enabled:
+            return handler(event, context)
+        tracer.clear()
+        try:
+            with tracer.span('lambda_handler'):
+                return handler(event, context)
+        finally:
+            try:
+                tracer.export()
+                logger.info(f"Trace timings: {json.dumps(tracer.summary())}")
+            except OSError as e:
+                logger.error(f"Failed to write trace file {tracer.path}: {str(e)}")
+    return wrapper
+
+@traced_invocation
 def lambda_handler(event, context):
     """
     Lambda function to stop all running SageMaker MLflow tracking servers.
     
     This function:
-    1. Lists all MLflow tracking servers
+    1. Lists all MLflow tracking servers (in every configured region/account)
     2. Identifies running servers
-    3. Stops them
-    4. Logs the results
-    5. Sends metrics to CloudWatch
+    3. Stops them (concurrently, rate limited)
+    4. Optionally waits for them to reach 'Stopped' (wait_for_stop)
+    5. Records what it saw in the state store, if one is configured
+    6. Logs the results
+    7. Sends metrics to CloudWatch
+    
+    Servers are stopped most expensive first. When the Lambda's remaining
+    time runs low, the servers not yet reached are returned as a
+    `continuation` token (and pushed to CONTINUATION_QUEUE if set); passing
+    it back in the event as "continuation" resumes with just those servers.
     """
     
+    global _cold_start
+    
     try:
         logger.info("Starting MLflow tracking server shutdown process")
         
-        # Get all MLflow tracking servers
-        tracking_servers = list_mlflow_tracking_servers()
-        logger.info(f"Found {len(tracking_servers)} total MLflow tracking servers")
+        queue = get_continuation_queue(event.get('continuation_queue'))
+        # A queued token stays queued until this invocation has finished with
+        # it, so a failure or timeout leaves it for the next invocation
+        claimed = None
+        continuation = event.get('continuation')
+        if not continuation and queue is not None:
+            claimed = continuation = queue.claim()
+        if continuation:
+            targets = continuation_targets(continuation)
+            logger.info(f"Resuming {sum(len(t['servers']) for t in targets)} deferred servers from a continuation")
+        else:
+            targets = resolve_targets(event)
+        multi_target = len(targets) > 1
         
-        # for i, server in enumerate(tracking_servers):
-        #     print(f"Server {i}: {server}")
-        # Filter running servers
-        running_servers = [server for server in tracking_servers if server['TrackingServerStatus'] == 'Started']
-        logger.info(f"Found {len(running_servers)} running MLflow tracking servers")
+        store = get_state_store(event.get('state_store'))
+        state = load_state(store)
         
-        if not running_servers:
+        if multi_target:
+            logger.info(f"Processing {len(targets)} targets: {', '.join(target_label(t) for t in targets)}")
+            with ThreadPoolExecutor(max_workers=min(max(1, TARGET_CONCURRENCY), len(targets))) as executor:
+                results = list(executor.map(lambda target: process_target(target, event, context, state=state), targets))
+            
+            failed_targets = [r for r in results if r['error']]
+            if len(failed_targets) == len(results):
+                raise RuntimeError(f"All {len(results)} targets failed: " +
+                                   '; '.join(f"{r['target']}: {r['error']}" for r in failed_targets))
+        else:
+            # A single target keeps the original behaviour of failing the whole invocation
+            results = [process_target(targets[0], event, context, raise_errors=True, state=state)]
+            failed_targets = []
+        
+        if store is not None:
+            save_state(store, state, results)
+        
+        def qualified(result, name):
+            return f"{result['target']}/{name}" if multi_target else name
+        
+        if _cold_start:
+            # client_init_ms is only filled in once the first clients have been built
+            _cold_start = False
+            logger.info(f"Cold start timings: {json.dumps(COLD_START_TIMINGS)}")
+        
+        total_servers = sum(r['total_servers'] for r in results)
+        running_count = sum(r['running_servers'] for r in results)
+        stopped_names = [qualified(r, name) for r in results for name in r['stopped_servers']]
+        failed_names = [qualified(r, name) for r in results for name in r['failed_servers']]
+        breakdown = [target_summary(r) for r in results] if multi_target else None
+        server_metrics = [dict(m, name=qualified(r, m['name'])) for r in results for m in r['server_metrics']]
+        restarted_names = [qualified(r, name) for r in results for name in r['restarted_servers']]
+        deferred_names = [qualified(r, name) for r in results for name in r['deferred_servers']]
+        next_continuation = build_continuation(results) if deferred_names else None
+        if next_continuation:
+            logger.warning(f"Ran out of time, deferring {len(deferred_names)} servers to the next invocation")
+            if queue is not None:
+                queue.push(next_continuation)
+        if claimed is not None:
+            queue.ack(claimed)
+        restarted_count = len(restarted_names) if store is not None else None
+        
+        idle_report = [dict(entry, name=qualified(r, entry['name'])) for r in results for entry in r['idle_report']]
+        kept_active = [entry['name'] for entry in idle_report if entry['decision'] == 'keep']
+        dry_run = event.get('dry_run', DRY_RUN)
+        
+        def add_optional_fields(body):
+            if idle_report:
+                body['servers_kept_active'] = len(kept_active)
+                body['kept_active_servers'] = kept_active
+                body['idle_report'] = idle_report
+            if dry_run:
+                body['dry_run'] = True
+                body['would_stop'] = [entry['name'] for entry in idle_report if entry['decision'] == 'stop']
+            if next_continuation:
+                body['servers_deferred'] = len(deferred_names)
+                body['deferred_servers'] = deferred_names
+                body['continuation'] = next_continuation
+            if store is None:
+                return
+            body['servers_unchanged'] = sum(r['unchanged_servers'] for r in results)
+            body['restarted_servers'] = restarted_names
+        
+        if not running_count:
             logger.info("No running MLflow tracking servers found. Nothing to stop.")
-            send_metrics(0, 0, 0)
+            send_metrics(0, 0, total_servers, error=bool(failed_targets), targets=breakdown,
+                         restarted_count=restarted_count)
+            response_body = {
+                'message': 'No running MLflow tracking servers found',
+                'servers_stopped': 0,
+                'total_servers': total_servers
+            }
+            add_optional_fields(response_body)
+            if breakdown:
+                response_body['targets'] = breakdown
             return {
                 'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'No running MLflow tracking servers found',
-                    'servers_stopped': 0,
-                    'total_servers': len(tracking_servers)
-                })
+                'body': json.dumps(response_body)
             }
         
-        # Stop running servers
-        stopped_servers = []
-        failed_servers = []
-        
-        for server in running_servers:
-            try:
-                server_name = server['TrackingServerName']
-                logger.info(f"Stopping MLflow tracking server: {server_name}")
-                
-               
-                response = sagemaker_client.stop_mlflow_tracking_server(
-                    TrackingServerName=server_name
-                )
-
-                
-                stopped_servers.append({
-                    'name': server_name,
-                    'arn': server['TrackingServerArn'],
-                    'response': response
-                    # 'response': 'stopped'
-                })
-                
-                logger.info(f"Successfully initiated stop for server: {server_name}")
-                
-            except Exception as e:
-                logger.error(f"Failed to stop server {server['TrackingServerName']}: {str(e)}")
-                failed_servers.append({
-                    'name': server['TrackingServerName'],
-                    'arn': server['TrackingServerArn'],
-                    'error': str(e)
-                })
-        
         # Send metrics to CloudWatch
-        send_metrics(len(stopped_servers), len(failed_servers), len(tracking_servers))
+        send_metrics(len(stopped_names), len(failed_names), total_servers, error=bool(failed_targets),
+                     targets=breakdown, servers=server_metrics, restarted_count=restarted_count)
         
         # Prepare response
         response_body = {
-            'message': f'MLflow tracking server shutdown completed',
-            'servers_stopped': len(stopped_servers),
-            'servers_failed': len(failed_servers),
-            'total_servers': len(tracking_servers),
-            'stopped_servers': [s['name'] for s in stopped_servers],
-            'failed_servers': [s['name'] for s in failed_servers],
+            'message': 'Dry run: no servers were stopped' if dry_run else f'MLflow tracking server shutdown completed',
+            'servers_stopped': len(stopped_names),
+            'servers_failed': len(failed_names),
+            'total_servers': total_servers,
+            'stopped_servers': stopped_names,
+            'failed_servers': failed_names,
             'timestamp': datetime.now(timezone.utc).isoformat()
         }
+        add_optional_fields(response_body)
+        
+        final_states = {qualified(r, name): state for r in results for name, state in r['final_states'].items()}
+        if final_states:
+            confirmed = [name for name, state in final_states.items() if state['status'] == 'Stopped']
+            response_body['servers_confirmed_stopped'] = len(confirmed)
+            response_body['final_states'] = {name: state['status'] for name, state in final_states.items()}
+            response_body['seconds_to_stop'] = {
+                name: state['seconds_to_stop'] for name, state in final_states.items()
+                if state['seconds_to_stop'] is not None
+            }
         
-        logger.info(f"Shutdown process completed. Stopped: {len(stopped_servers)}, Failed: {len(failed_servers)}")
+        if breakdown:
+            response_body['targets'] = breakdown
+        
+        logger.info(f"Shutdown process completed. Stopped: {len(stopped_names)}, Failed: {len(failed_names)}")
         
         return {
             'statusCode': 200,
@@ -115,51 +340,1108 @@ def lambda_handler(event, context):
             })
         }
 
-def list_mlflow_tracking_servers() -> List[Dict[str, Any]]:
+def resolve_targets(event) -> List[Dict[str, Optional[str]]]:
+    """
+    Work out which region/account pairs to process.
+    
+    The event may list explicit targets ({"targets": [{"region": ..., "role_arn": ...}]})
+    or give "regions" and "role_arns", which are combined with each other.
+    Otherwise TARGET_REGIONS and TARGET_ROLE_ARNS are used. With nothing
+    configured a single default target (the Lambda's own account and region)
+    is returned.
+    
+    Returns:
+        List of {'region', 'role_arn'} dictionaries (None means default)
+    """
+    if event.get('targets'):
+        return [{'region': t.get('region'), 'role_arn': t.get('role_arn')} for t in event['targets']]
+    
+    regions = event.get('regions') or TARGET_REGIONS or [None]
+    role_arns = event.get('role_arns') or TARGET_ROLE_ARNS or [None]
+    return [{'region': region, 'role_arn': role_arn} for role_arn in role_arns for region in regions]
+
+def continuation_targets(continuation: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Targets of a continuation token, each with the names of the servers
+    still to be stopped ({'region', 'role_arn', 'servers'}).
+    """
+    if continuation.get('version') != 1:
+        raise ValueError(f"Unsupported continuation token version {continuation.get('version')}")
+    return [{'region': t.get('region'), 'role_arn': t.get('role_arn'), 'servers': list(t['servers'])}
+            for t in continuation['targets'] if t.get('servers')]
+
+def build_continuation(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Continuation token for the servers each target had to defer."""
+    return {
+        'version': 1,
+        'id': uuid.uuid4().hex,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'targets': [
+            {'region': r['region'], 'role_arn': r['role_arn'], 'servers': r['deferred_servers']}
+            for r in results if r['deferred_servers']
+        ]
+    }
+
+class FileContinuationQueue:
+    """
+    Local stand-in for a work queue: continuation tokens kept in a JSON file.
+    In Lambda use a path under /tmp; it lasts while the environment is warm.
+    
+    Like a message queue, claim() hands out the oldest token without
+    removing it, and ack() removes it once the work is done. Each claim is
+    counted in the token's 'attempts', and a token claimed max_attempts
+    times without an ack is dropped.
+    """
+    
+    def __init__(self, path: str, max_attempts: Optional[int] = None):
+        self.path = path
+        self.max_attempts = CONTINUATION_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self._lock = threading.Lock()
+    
+    def _read(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+    
+    def _write(self, tokens: List[Dict[str, Any]]):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(tokens, f)
+        os.replace(tmp_path, self.path)
+    
+    def push(self, token: Dict[str, Any]):
+        with self._lock:
+            self._write(self._read() + [token])
+    
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """Remove and return the oldest token, or None if the queue is empty."""
+        with self._lock:
+            tokens = self._read()
+            if not tokens:
+                return None
+            self._write(tokens[1:])
+            return tokens[0]
+    
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Return the oldest token, leaving it queued until ack() is called.
+        
+        Returns:
+            The token with its 'attempts' count, or None if the queue is empty
+        """
+        with self._lock:
+            tokens = self._read()
+            while tokens and tokens[0].get('attempts', 0) >= self.max_attempts:
+                dropped = tokens.pop(0)
+                logger.error(f"Dropping continuation {token_id(dropped)} after {dropped['attempts']} failed attempts")
+            if not tokens:
+                self._write(tokens)
+                return None
+            tokens[0]['attempts'] = tokens[0].get('attempts', 0) + 1
+            self._write(tokens)
+            return dict(tokens[0])
+    
+    def ack(self, token: Dict[str, Any]) -> bool:
+        """Remove a claimed token; False if it is no longer queued."""
+        with self._lock:
+            tokens = self._read()
+            remaining = [t for t in tokens if token_id(t) != token_id(token)]
+            if len(remaining) == len(tokens):
+                return False
+            self._write(remaining)
+            return True
+    
+    def __len__(self):
+        return len(self._read())
+
+def token_id(token: Dict[str, Any]) -> str:
+    """Identity of a continuation token (tokens from before ids were added are compared by content)."""
+    if token.get('id'):
+        return token['id']
+    return json.dumps({k: v for k, v in token.items() if k != 'attempts'}, sort_keys=True)
+
+def get_continuation_queue(path: Optional[str] = None) -> Optional[FileContinuationQueue]:
+    """Queue at path (default CONTINUATION_QUEUE), or None when not configured."""
+    path = CONTINUATION_QUEUE if path is None else path
+    return FileContinuationQueue(path) if path else None
+
+def server_cost(server: Dict[str, Any]) -> Tuple[int, float]:
+    """
+    Sort key putting the most expensive servers first: larger sizes first
+    (TrackingServerSize is only known from describe, see with_server_sizes),
+    then the servers that have been running longest since their last change.
+    """
+    modified = server.get('LastModifiedTime')
+    started = modified.timestamp() if isinstance(modified, datetime) else float('inf')
+    return (-SERVER_SIZE_COST.get(server.get('TrackingServerSize'), 0), started)
+
+@traced('with_server_sizes')
+def with_server_sizes(servers: List[Dict[str, Any]], client=None, max_workers: Optional[int] = None,
+                      known: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Add TrackingServerSize to servers that are only known from their list
+    summary, so that server_cost can order them. Only the given servers (the
+    ones about to be stopped) are described, concurrently; a server whose
+    describe fails keeps its summary and sorts as the cheapest size.
+
+    With known state, a server not modified since its size was recorded
+    takes the recorded size instead of being described again.
+
+    Returns:
+        The servers in the same order, with sizes where they could be found
+    """
+    if len(servers) < 2:
+        return servers
+    servers = [with_known_size(server, known.get(server['TrackingServerArn'])) if known else server
+               for server in servers]
+    missing = [server for server in servers if 'TrackingServerSize' not in server]
+    if not missing:
+        return servers
+    client = client or get_sagemaker_client()
+
+    def size(server):
+        try:
+            detail = describe_tracking_server(server['TrackingServerName'], client)
+        except Exception as e:
+            logger.warning(f"Could not get the size of {server['TrackingServerName']}: {str(e)}")
+            return None
+        return detail.get('TrackingServerSize') if isinstance(detail, dict) else None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers or DESCRIBE_CONCURRENCY)) as executor:
+        found = list(executor.map(size, missing))
+    sizes = {server['TrackingServerName']: value for server, value in zip(missing, found) if value}
+    return [dict(server, TrackingServerSize=sizes[server['TrackingServerName']])
+            if server['TrackingServerName'] in sizes else server
+            for server in servers]
+
+def probe_last_modified(server: Dict[str, Any], client) -> Optional[datetime]:
+    """Activity probe: the server's LastModifiedTime (start, update, ...)."""
+    modified = server.get('LastModifiedTime')
+    return modified if isinstance(modified, datetime) else None
+
+def probe_activity_tag(server: Dict[str, Any], client) -> Optional[datetime]:
+    """
+    Activity probe: an ISO 8601 timestamp in the server's ACTIVITY_TAG tag,
+    kept up to date by whatever logs to the server (e.g. a training job hook).
+    """
+    response = call_with_retry(client.list_tags, ResourceArn=server['TrackingServerArn'])
+    for tag in response.get('Tags', []):
+        if tag['Key'] == ACTIVITY_TAG:
+            value = datetime.fromisoformat(tag['Value'].replace('Z', '+00:00'))
+            return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return None
+
+# Activity probes by name; each returns the server's last activity time or None
+ACTIVITY_PROBE_FUNCTIONS: Dict[str, Callable[[Dict[str, Any], Any], Optional[datetime]]] = {
+    'last_modified': probe_last_modified,
+    'tag': probe_activity_tag
+}
+
+def register_activity_probe(name: str, probe: Callable[[Dict[str, Any], Any], Optional[datetime]]):
+    """Make a custom activity probe available to ACTIVITY_PROBES / activity_probes."""
+    ACTIVITY_PROBE_FUNCTIONS[name] = probe
+
+@traced('evaluate_idleness')
+def evaluate_idleness(servers: List[Dict[str, Any]], threshold_minutes: float,
+                      probes: Optional[List[str]] = None, client=None,
+                      max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Score how idle each server is and decide whether to stop it.
+    
+    Every probe is run for every server in parallel. A server's last activity
+    is the latest time any probe reports, and its idle score is the idle time
+    divided by the threshold: servers scoring 1 or more are stopped. Servers
+    without any activity signal, or with a threshold of 0, are always stopped.
+    A probe that fails is logged and ignored.
+    
+    Args:
+        servers: Running servers (summaries or details)
+        threshold_minutes: Idle time after which a server is stopped
+        probes: Names of the probes to run (default ACTIVITY_PROBES)
+        client: SageMaker client passed to the probes
+        max_workers: Maximum concurrent probe calls (default DESCRIBE_CONCURRENCY)
+        
+    Returns:
+        One report entry per server, in the order of servers, with its
+        signals, last_activity, idle_minutes, score and decision ('stop'/'keep')
+    """
+    names = probes or ACTIVITY_PROBES
+    unknown = [name for name in names if name not in ACTIVITY_PROBE_FUNCTIONS]
+    if unknown:
+        raise ValueError(f"Unknown activity probes: {', '.join(unknown)}")
+    client = client or get_sagemaker_client()
+    now = datetime.now(timezone.utc)
+    
+    def run_probe(server, name):
+        try:
+            return ACTIVITY_PROBE_FUNCTIONS[name](server, client)
+        except Exception as e:
+            logger.warning(f"Activity probe '{name}' failed for {server['TrackingServerName']}: {str(e)}")
+            return None
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers or DESCRIBE_CONCURRENCY)) as executor:
+        futures = [[executor.submit(run_probe, server, name) for name in names] for server in servers]
+        signals = [[future.result() for future in row] for row in futures]
+    
+    report = []
+    for server, times in zip(servers, signals):
+        seen = [t for t in times if t is not None]
+        last_activity = max(seen) if seen else None
+        idle_minutes = (now - last_activity).total_seconds() / 60 if last_activity else None
+        if idle_minutes is None or threshold_minutes <= 0:
+            score = None
+            decision = 'stop'
+        else:
+            score = round(idle_minutes / threshold_minutes, 2)
+            decision = 'stop' if score >= 1 else 'keep'
+        report.append({
+            'name': server['TrackingServerName'],
+            'signals': {name: _timestamp(t) for name, t in zip(names, times)},
+            'last_activity': _timestamp(last_activity),
+            'idle_minutes': round(idle_minutes, 1) if idle_minutes is not None else None,
+            'score': score,
+            'decision': decision
+        })
+    return report
+
+def target_account(target: Dict[str, Optional[str]]) -> Optional[str]:
+    """Account id of a target, taken from its role ARN."""
+    role_arn = target.get('role_arn')
+    return role_arn.split(':')[4] if role_arn else None
+
+def target_label(target: Dict[str, Optional[str]]) -> str:
+    """Human readable '<account>/<region>' label for a target."""
+    return f"{target_account(target) or 'local'}/{target.get('region') or 'default'}"
+
+def get_client(service: str, region: Optional[str] = None, role_arn: Optional[str] = None):
+    """
+    Return a cached boto3 client, creating it on first use.
+    
+    Clients are cached per service, region and role. Clients for an assumed
+    role are recreated shortly before their temporary credentials expire.
+    
+    Args:
+        service: AWS service name, e.g. 'sagemaker'
+        region: Region name (default: the Lambda's own region)
+        role_arn: Role to assume for cross-account access
+    """
+    key = (service, region, role_arn)
+    with _clients_lock:
+        cached = _clients.get(key)
+    if cached is not None:
+        client, expires = cached
+        if expires is None or expires - time.time() > CREDENTIAL_REFRESH_MARGIN_SECONDS:
+            return client
+    
+    started = time.perf_counter()
+    credentials = {}
+    expires = None
+    
+    if role_arn:
+        assumed = get_client('sts', region).assume_role(
+            RoleArn=role_arn,
+            RoleSessionName='mlflow-server-shutdown'
+        )['Credentials']
+        credentials = {
+            'aws_access_key_id': assumed['AccessKeyId'],
+            'aws_secret_access_key': assumed['SecretAccessKey'],
+            'aws_session_token': assumed['SessionToken']
+        }
+        expires = assumed['Expiration'].timestamp()
+    
+    client = boto3.client(service, region_name=region, config=CLIENT_CONFIG, **credentials)
+    
+    with _clients_lock:
+        current = _clients.get(key)
+        if current is not None and current is not cached:
+            # another thread built the same client meanwhile; use that one
+            return current[0]
+        _clients[key] = (client, expires)
+    
+    COLD_START_TIMINGS['client_init_ms'][f"{service}/{region or 'default'}"] = round((time.perf_counter() - started) * 1000, 1)
+    return client
+
+def get_sagemaker_client(region: Optional[str] = None, role_arn: Optional[str] = None):
+    """Cached SageMaker client for a region (and optional assumed role)."""
+    return get_client('sagemaker', region, role_arn)
+
+def get_cloudwatch_client(region: Optional[str] = None):
+    """Cached CloudWatch client for a region."""
+    return get_client('cloudwatch', region)
+
+def reset_clients():
+    """Drop all cached clients (used by tests)."""
+    with _clients_lock:
+        _clients.clear()
+
+def create_sagemaker_client(target: Dict[str, Optional[str]]):
+    """
+    Return the SageMaker client for a target, assuming its role if one is given.
+    """
+    return get_sagemaker_client(target.get('region'), target.get('role_arn'))
+
+@traced('process_target')
+def process_target(target: Dict[str, Optional[str]], event, context, raise_errors: bool = False,
+                   state: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    List, stop and optionally wait for the MLflow servers of one target.
+    
+    Args:
+        target: {'region', 'role_arn'} dictionary from resolve_targets
+        event: Lambda event (for per-invocation overrides)
+        context: Lambda context
+        raise_errors: Re-raise failures instead of recording them in the result
+        state: Server records from the state store, keyed by ARN (None when
+            no store is configured)
+        
+    Returns:
+        Per-target result with server counts, names and any error
+    """
+    label = target_label(target)
+    result = {
+        'target': label,
+        'region': target.get('region'),
+        'role_arn': target.get('role_arn'),
+        'account': target_account(target),
+        'total_servers': 0,
+        'running_servers': 0,
+        'stopped_servers': [],
+        'failed_servers': [],
+        'final_states': {},
+        'server_metrics': [],
+        'restarted_servers': [],
+        'deferred_servers': [],
+        'idle_report': [],
+        'unchanged_servers': 0,
+        'observed_state': {},
+        'error': None
+    }
+    
+    try:
+        client = create_sagemaker_client(target)
+        
+        # Get all MLflow tracking servers. The list summaries already carry the
+        # name, ARN and status, so servers are only described in audit mode.
+        full_details = event.get('full_details', FULL_DETAILS)
+        tracking_servers = list_mlflow_tracking_servers(event.get('describe_concurrency'), full_details=full_details,
+                                                        client=client, known=state)
+        logger.info(f"[{label}] Found {len(tracking_servers)} total MLflow tracking servers")
+        
+        if state is not None:
+            observed = result['observed_state']
+            for server in tracking_servers:
+                previous = state.get(server['TrackingServerArn'])
+                record = state_record(with_known_size(server, previous), label)
+                observed[server['TrackingServerArn']] = record
+                if previous is None:
+                    continue
+                if previous['status'] in SHUT_DOWN_STATUSES and record['status'] in ('Starting', 'Started'):
+                    logger.warning(f"[{label}] Server {record['name']} was restarted since the last run "
+                                   f"(was {previous['status']}, last modified {record['last_modified']})")
+                    result['restarted_servers'].append(record['name'])
+                elif previous['status'] == record['status'] == 'Stopped' and previous['last_modified'] == record['last_modified']:
+                    result['unchanged_servers'] += 1
+            logger.info(f"[{label}] {result['unchanged_servers']} servers unchanged and stopped since the last run")
+        
+        # Filter running servers. A resumed target only handles the servers
+        # deferred by the previous invocation.
+        running_servers = [server for server in tracking_servers if server['TrackingServerStatus'] == 'Started']
+        if target.get('servers') is not None:
+            deferred = set(target['servers'])
+            running_servers = [server for server in running_servers if server['TrackingServerName'] in deferred]
+        logger.info(f"[{label}] Found {len(running_servers)} running MLflow tracking servers")
+        
+        result['total_servers'] = len(tracking_servers)
+        result['running_servers'] = len(running_servers)
+        if not running_servers:
+            return result
+        
+        # Keep servers that are still in use, or just report in a dry run
+        threshold = float(event.get('idle_threshold_minutes', IDLE_THRESHOLD_MINUTES))
+        dry_run = event.get('dry_run', DRY_RUN)
+        if threshold > 0 or dry_run:
+            result['idle_report'] = evaluate_idleness(running_servers, threshold,
+                                                      probes=event.get('activity_probes'), client=client)
+            idle = {entry['name'] for entry in result['idle_report'] if entry['decision'] == 'stop'}
+            logger.info(f"[{label}] {len(idle)} of {len(running_servers)} running servers are idle")
+            if dry_run:
+                return result
+            running_servers = [server for server in running_servers if server['TrackingServerName'] in idle]
+        
+        # Stop running servers concurrently, rate limited, until time runs low,
+        # most expensive first. Summaries carry no size, so the servers about
+        # to be stopped are described for it.
+        running_servers = with_server_sizes(running_servers, client=client,
+                                            max_workers=event.get('describe_concurrency'), known=state)
+        running_servers.sort(key=server_cost)
+        for server in running_servers:
+            if server['TrackingServerArn'] in result['observed_state']:
+                result['observed_state'][server['TrackingServerArn']]['size'] = server.get('TrackingServerSize')
+        deferred_servers = []
+        stopped_servers, failed_servers = stop_tracking_servers(
+            running_servers,
+            max_workers=event.get('stop_concurrency'),
+            rate=event.get('stop_rate_per_second'),
+            client=client,
+            context=context,
+            deferred=deferred_servers
+        )
+        result['stopped_servers'] = [s['name'] for s in stopped_servers]
+        result['failed_servers'] = [s['name'] for s in failed_servers]
+        result['deferred_servers'] = [s['TrackingServerName'] for s in deferred_servers]
+        
+        # Optionally wait for the stops to complete within the remaining time
+        if stopped_servers and event.get('wait_for_stop', WAIT_FOR_STOP):
+            result['final_states'] = wait_for_servers_stopped(stopped_servers, context, client=client)
+        
+        for record in stopped_servers:
+            if record['arn'] in result['observed_state']:
+                final_status = result['final_states'].get(record['name'], {}).get('status', 'Stopping')
+                result['observed_state'][record['arn']]['status'] = final_status
+        
+        for record, outcome in [(s, 'Stopped') for s in stopped_servers] + [(s, 'Failed') for s in failed_servers]:
+            final_state = result['final_states'].get(record['name'], {})
+            result['server_metrics'].append({
+                'name': record['name'],
+                'outcome': outcome,
+                'stop_call_seconds': record.get('stop_call_seconds'),
+                'seconds_to_stop': final_state.get('seconds_to_stop')
+            })
+        
+    except Exception as e:
+        if raise_errors:
+            raise
+        logger.error(f"Failed to process target {label}: {str(e)}")
+        result['error'] = str(e)
+    
+    return result
+
+def target_summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-target breakdown included in the response and metrics."""
+    summary = {
+        'target': result['target'],
+        'region': result['region'],
+        'account': result['account'],
+        'servers_stopped': len(result['stopped_servers']),
+        'servers_failed': len(result['failed_servers']),
+        'total_servers': result['total_servers'],
+        'stopped_servers': result['stopped_servers'],
+        'failed_servers': result['failed_servers']
+    }
+    if result['final_states']:
+        summary['final_states'] = {name: state['status'] for name, state in result['final_states'].items()}
+    if result['error']:
+        summary['error'] = result['error']
+    return summary
+
+def is_throttling_error(error: Exception) -> bool:
+    """Return True if the exception is an AWS throttling error."""
+    if not isinstance(error, ClientError):
+        return False
+    return error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+def call_with_retry(fn: Callable, *args, max_retries: Optional[int] = None, **kwargs):
+    """
+    Call an AWS API function, retrying with exponential backoff and jitter
+    when the call is throttled.
+    
+    Args:
+        fn: Boto3 client method to call
+        max_retries: Number of retries after the first attempt (default MAX_RETRIES)
+        
+    Returns:
+        The API response
+    """
+    retries = MAX_RETRIES if max_retries is None else max_retries
+    
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except ClientError as e:
+            if not is_throttling_error(e) or attempt == retries:
+                raise
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+            delay = random.uniform(delay / 2, delay)
+            logger.warning(f"Throttled calling {getattr(fn, '__name__', fn)}, retrying in {delay:.2f}s (attempt {attempt + 1}/{retries})")
+            time.sleep(delay)
+
+@traced('describe')
+def describe_tracking_server(server_name: str, client=None) -> Optional[Dict[str, Any]]:
+    """
+    Describe a single MLflow tracking server.
+    
+    Args:
+        server_name: Name of the tracking server
+        client: SageMaker client (default: the cached client for the Lambda's region)
+        
+    Returns:
+        The server details, or None if the server could not be described
+    """
+    client = client or get_sagemaker_client()
+    
+    try:
+        server_details = call_with_retry(
+            client.describe_mlflow_tracking_server,
+            TrackingServerName=server_name
+        )
+        print(f"Found: {server_name}")
+        return server_details
+        
+    except ClientError as e:
+        print(f"Error describing {server_name}: {e}")
+        return None
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces calls so at most `rate` start per second.
+    A rate of 0 or less disables limiting.
+    """
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def remaining_time_ms(context) -> Optional[float]:
+    """Remaining Lambda execution time, or None when not running in Lambda."""
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if not callable(get_remaining):
+        return None
+    remaining = get_remaining()
+    return remaining if isinstance(remaining, (int, float)) else None
+
+@traced('stop_servers')
+def stop_tracking_servers(servers: List[Dict[str, Any]], max_workers: Optional[int] = None,
+                          rate: Optional[float] = None, client=None, context=None,
+                          deferred: Optional[List[Dict[str, Any]]] = None,
+                          safety_margin_ms: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Issue stop calls for the given servers concurrently, in the given order.
+    
+    With a Lambda context, no new stop call is started once the remaining
+    time drops below the safety margin; those servers are appended to
+    `deferred` instead (or counted as failed if no list is given).
+    
+    Args:
+        servers: Running servers (summaries or details)
+        max_workers: Maximum concurrent stop calls (default STOP_CONCURRENCY)
+        rate: Maximum stop calls started per second (default STOP_RATE_PER_SECOND)
+        client: SageMaker client (default: the cached client for the Lambda's region)
+        context: Lambda context, for the remaining time
+        deferred: List that receives the servers that were not attempted
+        safety_margin_ms: Time to keep in reserve (default STOP_SAFETY_MARGIN_MS)
+        
+    Returns:
+        Tuple of (stopped, failed) lists, both in the order of servers
+    """
+    client = client or get_sagemaker_client()
+    workers = max(1, max_workers or STOP_CONCURRENCY)
+    limiter = RateLimiter(STOP_RATE_PER_SECOND if rate is None else rate)
+    margin_ms = STOP_SAFETY_MARGIN_MS if safety_margin_ms is None else safety_margin_ms
+    
+    def out_of_time():
+        remaining = remaining_time_ms(context)
+        return remaining is not None and remaining < margin_ms
+    
+    def stop(server):
+        server_name = server['TrackingServerName']
+        started = None
+        if out_of_time():
+            return None, server
+        try:
+            limiter.acquire()
+            if out_of_time():
+                return None, server
+            logger.info(f"Stopping MLflow tracking server: {server_name}")
+            
+            started = time.monotonic()
+            with trace_span('stop', server=server_name):
+                response = call_with_retry(
+                    client.stop_mlflow_tracking_server,
+                    TrackingServerName=server_name
+                )
+            finished = time.monotonic()
+            
+            logger.info(f"Successfully initiated stop for server: {server_name}")
+            return True, {
+                'name': server_name,
+                'arn': server['TrackingServerArn'],
+                'response': response,
+                'stop_requested_at': finished,
+                'stop_call_seconds': finished - started
+            }
+            
+        except Exception as e:
+            logger.error(f"Failed to stop server {server_name}: {str(e)}")
+            return False, {
+                'name': server_name,
+                'arn': server['TrackingServerArn'],
+                'error': str(e),
+                'stop_call_seconds': time.monotonic() - started if started is not None else None
+            }
+    
+    with ThreadPoolExecutor(max_workers=min(workers, max(1, len(servers)))) as executor:
+        results = list(executor.map(stop, servers))
+    
+    skipped = [server for ok, server in results if ok is None]
+    if skipped:
+        logger.warning(f"Stopping {len(skipped)} servers deferred, less than {margin_ms} ms of Lambda time left")
+        if deferred is not None:
+            deferred.extend(skipped)
+    
+    stopped_servers = [record for ok, record in results if ok]
+    failed_servers = [record for ok, record in results if ok is False]
+    if deferred is None:
+        failed_servers.extend({'name': s['TrackingServerName'], 'arn': s['TrackingServerArn'],
+                               'error': 'Not attempted before the Lambda deadline'} for s in skipped)
+    return stopped_servers, failed_servers
+
+@traced('wait_for_stop')
+def wait_for_servers_stopped(stopped_servers: List[Dict[str, Any]], context,
+                             poll_interval: Optional[float] = None,
+                             safety_margin_ms: Optional[int] = None, client=None) -> Dict[str, Dict[str, Any]]:
+    """
+    Poll until every server reaches a terminal stop status or time runs low.
+    
+    All servers are polled together with a single paginated list call per
+    round instead of one describe per server. Polling stops once the Lambda's
+    remaining time would drop below the safety margin (or WAIT_MAX_SECONDS
+    elapses when running outside Lambda).
+    
+    Args:
+        stopped_servers: Records returned by stop_tracking_servers
+        context: Lambda context
+        poll_interval: Seconds between polls (default WAIT_POLL_INTERVAL)
+        safety_margin_ms: Time to keep in reserve (default WAIT_SAFETY_MARGIN_MS)
+        client: SageMaker client (default: the cached client for the Lambda's region)
+        
+    Returns:
+        Dictionary of server name to {'status', 'seconds_to_stop'}
+    """
+    interval = WAIT_POLL_INTERVAL if poll_interval is None else poll_interval
+    margin_ms = WAIT_SAFETY_MARGIN_MS if safety_margin_ms is None else safety_margin_ms
+    requested_at = {s['name']: s['stop_requested_at'] for s in stopped_servers}
+    states = {name: {'status': 'Stopping', 'seconds_to_stop': None} for name in requested_at}
+    pending = set(requested_at)
+    started = time.monotonic()
+    
+    while pending:
+        remaining = remaining_time_ms(context)
+        if remaining is None:
+            remaining = (WAIT_MAX_SECONDS - (time.monotonic() - started)) * 1000
+        if remaining - interval * 1000 < margin_ms:
+            logger.warning(f"Stopped waiting with {len(pending)} servers still stopping: time budget exhausted")
+            break
+        
+        time.sleep(interval)
+        statuses = {s['TrackingServerName']: s['TrackingServerStatus']
+                    for s in list_mlflow_tracking_servers(full_details=False, client=client)}
+        now = time.monotonic()
+        
+        for name in list(pending):
+            # a server missing from the listing was deleted while stopping
+            status = statuses.get(name, 'NotFound')
+            states[name]['status'] = status
+            if status in TERMINAL_STOP_STATUSES or name not in statuses:
+                states[name]['seconds_to_stop'] = round(now - requested_at[name], 1)
+                pending.discard(name)
+        
+        logger.info(f"Waiting for stop: {len(requested_at) - len(pending)}/{len(requested_at)} servers done")
+    
+    return states
+
+@traced('list_servers')
+def list_mlflow_tracking_servers(max_workers: Optional[int] = None, full_details: bool = True, client=None,
+                                 known: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
     """
     List all MLflow tracking servers across all domains.
     
+    With full_details, describe calls are fanned out over a bounded thread
+    pool as each page of summaries arrives, so the total time is driven by
+    the slowest call rather than the sum of all calls. Without it, the
+    TrackingServerSummaries are returned as-is (they carry the name, ARN and
+    status) and no describe calls are made. Results keep the listing order.
+    
+    With known state, servers that are still stopped and have not been
+    modified since they were recorded are not described again; their summary
+    is returned instead.
+    
+    Args:
+        max_workers: Maximum concurrent describe calls (default DESCRIBE_CONCURRENCY)
+        full_details: Describe every server instead of returning the summaries
+        client: SageMaker client (default: the cached client for the Lambda's region)
+        known: Server records from the state store, keyed by ARN
+        
     Returns:
         List of MLflow tracking server dictionaries
     """
-    all_servers = []
+    client = client or get_sagemaker_client()
+    workers = max(1, max_workers or DESCRIBE_CONCURRENCY)
     
     try:
-        # # Get all domains
-        # domains_response = sagemaker_client.list_domains()
-        # domains = domains_response['Domains']
+        # List all MLflow tracking servers (no domain filtering needed)
+        paginator = client.get_paginator('list_mlflow_tracking_servers')
         
-        # logger.info(f"Found {len(domains)} SageMaker domains")
+        if not full_details:
+            all_servers = []
+            for page in paginator.paginate():
+                all_servers.extend(page['TrackingServerSummaries'])
+            logger.info(f"Total MLflow tracking servers found: {len(all_servers)} (summaries only)")
+            return all_servers
         
-        # List all MLflow tracking servers (no domain filtering needed)
-        paginator = sagemaker_client.get_paginator('list_mlflow_tracking_servers')
-        
-        for page in paginator.paginate():
-            for server in page['TrackingServerSummaries']:
-                    try:
-                        # Get detailed information about each server
-                        server_details = sagemaker_client.describe_mlflow_tracking_server(
-                            TrackingServerName=server['TrackingServerName']
-                        )
-                        all_servers.append(server_details)
-                        print(f"Found: {server['TrackingServerName']}")
-                        
-                    except ClientError as e:
-                        print(f"Error describing {server['TrackingServerName']}: {e}")
-
-
-            # servers = page.get('MlflowTrackingServers', [])
-            # all_servers.extend(servers)
-            # logger.info(f"Found {len(servers)} MLflow tracking servers")
-        
-        logger.info(f"Total MLflow tracking servers found: {len(all_servers)}")
+        skipped = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for page in paginator.paginate():
+                for server in page['TrackingServerSummaries']:
+                    if known and is_unchanged_stopped(server, known.get(server['TrackingServerArn'])):
+                        skipped += 1
+                        futures.append(server)
+                        continue
+                    # Get detailed information about each server
+                    futures.append(executor.submit(describe_tracking_server, server['TrackingServerName'], client))
+            
+            results = [item if isinstance(item, dict) else item.result() for item in futures]
+        
+        all_servers = [server for server in results if server is not None]
+        
+        logger.info(f"Total MLflow tracking servers found: {len(all_servers)} ({skipped} unchanged, not described)")
         return all_servers
         
     except Exception as e:
         logger.error(f"Error listing MLflow tracking servers: {str(e)}")
         raise
 
-def send_metrics(stopped_count: int, failed_count: int, total_count: int, error: bool = False):
+def _timestamp(value) -> Optional[str]:
+    """ISO form of an API timestamp, so it can be stored and compared."""
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def state_record(server: Dict[str, Any], target: str) -> Dict[str, Any]:
+    """State store record for a server summary or description."""
+    return {
+        'name': server['TrackingServerName'],
+        'target': target,
+        'status': server['TrackingServerStatus'],
+        'last_modified': _timestamp(server.get('LastModifiedTime')),
+        'size': server.get('TrackingServerSize'),
+        'seen_at': datetime.now(timezone.utc).isoformat()
+    }
+
+def with_known_size(server: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The server with its recorded size, if it has not been modified since the record was made."""
+    if ('TrackingServerSize' in server or previous is None or not previous.get('size')
+            or previous['last_modified'] != _timestamp(server.get('LastModifiedTime'))):
+        return server
+    return dict(server, TrackingServerSize=previous['size'])
+
+def is_unchanged_stopped(server: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> bool:
+    """True if the server was stopped last run and has not been modified since."""
+    return (previous is not None
+            and server['TrackingServerStatus'] == 'Stopped'
+            and previous['status'] == 'Stopped'
+            and previous['last_modified'] == _timestamp(server.get('LastModifiedTime')))
+
+class StateStore:
+    """
+    Persists server records between runs, keyed by tracking server ARN.
+    Subclasses implement load and save for a particular backend.
+    """
+    
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+    
+    def save(self, records: Dict[str, Dict[str, Any]]):
+        """Replace the stored records with the given ones."""
+        raise NotImplementedError
+
+class SqliteStateStore(StateStore):
+    """
+    State in a local SQLite file. In Lambda use a path under /tmp; it is kept
+    for as long as the execution environment stays warm.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+    
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS servers ('
+            'arn TEXT PRIMARY KEY, name TEXT, target TEXT, status TEXT, last_modified TEXT, seen_at TEXT, size TEXT)'
+        )
+        # files written before sizes were recorded lack the column
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(servers)')}
+        if 'size' not in columns:
+            connection.execute('ALTER TABLE servers ADD COLUMN size TEXT')
+        return connection
+    
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        connection = self._connect()
+        try:
+            rows = connection.execute('SELECT arn, name, target, status, last_modified, size, seen_at FROM servers').fetchall()
+        finally:
+            connection.close()
+        return {
+            arn: {'name': name, 'target': target, 'status': status, 'last_modified': last_modified, 'size': size,
+                  'seen_at': seen_at}
+            for arn, name, target, status, last_modified, size, seen_at in rows
+        }
+    
+    def save(self, records: Dict[str, Dict[str, Any]]):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM servers')
+                connection.executemany(
+                    'INSERT INTO servers (arn, name, target, status, last_modified, size, seen_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(arn, r['name'], r['target'], r['status'], r['last_modified'], r.get('size'), r['seen_at'])
+                     for arn, r in records.items()]
+                )
+        finally:
+            connection.close()
+
+class S3StateStore(StateStore):
+    """State as a single JSON object in S3, shared by every execution environment."""
+    
+    def __init__(self, bucket: str, key: str, client=None):
+        self.bucket = bucket
+        self.key = key
+        self.client = client
+    
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        client = self.client or get_client('s3')
+        try:
+            response = client.get_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return {}
+            raise
+        return json.loads(response['Body'].read())
+    
+    def save(self, records: Dict[str, Dict[str, Any]]):
+        client = self.client or get_client('s3')
+        client.put_object(Bucket=self.bucket, Key=self.key, Body=json.dumps(records).encode(),
+                          ContentType='application/json')
+
+def get_state_store(uri: Optional[str] = None) -> Optional[StateStore]:
+    """
+    Create the state store described by uri (default STATE_STORE):
+    s3://bucket/key, sqlite:///path or a plain file path. Returns None when
+    no store is configured.
+    """
+    uri = STATE_STORE if uri is None else uri
+    if not uri:
+        return None
+    if uri.startswith('s3://'):
+        bucket, _, key = uri[len('s3://'):].partition('/')
+        if not bucket or not key:
+            raise ValueError(f"State store '{uri}' must look like s3://bucket/key")
+        return S3StateStore(bucket, key)
+    if uri.startswith('sqlite://'):
+        uri = uri[len('sqlite://'):]
+    return SqliteStateStore(uri)
+
+@traced('load_state')
+def load_state(store: Optional[StateStore]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Load the previous run's records; a failing store behaves like an empty one."""
+    if store is None:
+        return None
+    try:
+        return store.load()
+    except Exception as e:
+        logger.error(f"Failed to load state from {type(store).__name__}: {str(e)}")
+        return {}
+
+@traced('save_state')
+def save_state(store: StateStore, previous: Dict[str, Dict[str, Any]], results: List[Dict[str, Any]]):
+    """
+    Store what this run observed. Records of targets that failed are carried
+    over, and servers that disappeared from a processed target are dropped.
+    """
+    processed = {r['target'] for r in results if not r['error']}
+    records = {arn: record for arn, record in previous.items() if record.get('target') not in processed}
+    for result in results:
+        records.update(result['observed_state'])
+    try:
+        store.save(records)
+        logger.info(f"Saved state for {len(records)} servers")
+    except Exception as e:
+        logger.error(f"Failed to save state to {type(store).__name__}: {str(e)}")
+        # Like metrics, state is best effort and must not fail the shutdown
+
+class MetricsSink:
+    """
+    Buffers datapoints for one invocation and publishes them together on flush().
+    Subclasses implement _publish for a particular backend.
+    """
+    
+    def __init__(self, namespace: str = METRICS_NAMESPACE):
+        self.namespace = namespace
+        self.buffer: List[Dict[str, Any]] = []
+    
+    def put(self, name: str, value: float, unit: str = 'Count', dimensions: Optional[Dict[str, str]] = None):
+        """Buffer one datapoint; dimensions maps dimension name to value."""
+        self.buffer.append({
+            'name': name,
+            'value': value,
+            'unit': unit,
+            'dimensions': dict(dimensions or {}),
+            'timestamp': datetime.now(timezone.utc)
+        })
+    
+    def flush(self) -> int:
+        """Publish and clear the buffered datapoints, returning how many there were."""
+        datapoints, self.buffer = self.buffer, []
+        if datapoints:
+            self._publish(datapoints)
+        return len(datapoints)
+    
+    def _publish(self, datapoints: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+class EmfMetricsSink(MetricsSink):
+    """
+    Writes datapoints as CloudWatch Embedded Metric Format log lines. The
+    Lambda log agent turns them into metrics, so no API call is made.
+    """
+    
+    # EMF limits: 100 metrics per directive and 100 values per metric
+    MAX_METRICS = 100
+    MAX_VALUES = 100
+    
+    def __init__(self, namespace: str = METRICS_NAMESPACE, stream=None):
+        super().__init__(namespace)
+        self.stream = stream
+    
+    def records(self, datapoints: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Group datapoints sharing the same dimensions into EMF records."""
+        groups: Dict[Tuple, Dict[str, Dict[str, Any]]] = {}
+        for point in datapoints:
+            metrics = groups.setdefault(tuple(sorted(point['dimensions'].items())), {})
+            metric = metrics.setdefault(point['name'], {'unit': point['unit'], 'values': []})
+            metric['values'].append(point['value'])
+        
+        timestamp = int(datetime.now(timezone.utc).timestamp() * 1000)
+        records = []
+        for dimensions, metrics in groups.items():
+            chunks = [(name, metric['unit'], metric['values'][i:i + self.MAX_VALUES])
+                      for name, metric in metrics.items()
+                      for i in range(0, len(metric['values']), self.MAX_VALUES)]
+            while chunks:
+                # a metric name may only appear once per record
+                batch, seen, rest = [], set(), []
+                for chunk in chunks:
+                    if chunk[0] in seen or len(batch) == self.MAX_METRICS:
+                        rest.append(chunk)
+                    else:
+                        seen.add(chunk[0])
+                        batch.append(chunk)
+                chunks = rest
+                
+                record = {
+                    '_aws': {
+                        'Timestamp': timestamp,
+                        'CloudWatchMetrics': [{
+                            'Namespace': self.namespace,
+                            'Dimensions': [[key for key, _ in dimensions]],
+                            'Metrics': [{'Name': name, 'Unit': unit} for name, unit, _ in batch]
+                        }]
+                    }
+                }
+                record.update(dimensions)
+                for name, _, values in batch:
+                    record[name] = values[0] if len(values) == 1 else values
+                records.append(record)
+        return records
+    
+    def _publish(self, datapoints: List[Dict[str, Any]]):
+        stream = self.stream or sys.stdout
+        for record in self.records(datapoints):
+            stream.write(json.dumps(record) + '\n')
+        stream.flush()
+
+class ApiMetricsSink(MetricsSink):
+    """Publishes datapoints with synchronous PutMetricData calls."""
+    
+    # put_metric_data accepts at most 1000 datapoints per call
+    MAX_DATAPOINTS = 1000
+    
+    def __init__(self, namespace: str = METRICS_NAMESPACE, client=None):
+        super().__init__(namespace)
+        self.client = client
+    
+    def _publish(self, datapoints: List[Dict[str, Any]]):
+        metric_data = []
+        for point in datapoints:
+            datum = {
+                'MetricName': point['name'],
+                'Value': point['value'],
+                'Unit': point['unit'],
+                'Timestamp': point['timestamp']
+            }
+            if point['dimensions']:
+                datum['Dimensions'] = [{'Name': k, 'Value': v} for k, v in point['dimensions'].items()]
+            metric_data.append(datum)
+        
+        client = self.client or get_cloudwatch_client()
+        for i in range(0, len(metric_data), self.MAX_DATAPOINTS):
+            client.put_metric_data(
+                Namespace=self.namespace,
+                MetricData=metric_data[i:i + self.MAX_DATAPOINTS]
+            )
+
+class InMemoryMetricsSink(MetricsSink):
+    """Keeps flushed datapoints in `published`, for tests and local runs."""
+    
+    def __init__(self, namespace: str = METRICS_NAMESPACE):
+        super().__init__(namespace)
+        self.published: List[Dict[str, Any]] = []
+    
+    def _publish(self, datapoints: List[Dict[str, Any]]):
+        self.published.extend(datapoints)
+    
+    def values(self, name: str, **dimensions) -> List[float]:
+        """Published values of a metric whose dimensions match exactly."""
+        return [p['value'] for p in self.published if p['name'] == name and p['dimensions'] == dimensions]
+
+METRICS_SINKS = {
+    'emf': EmfMetricsSink,
+    'api': ApiMetricsSink,
+    'memory': InMemoryMetricsSink
+}
+
+def get_metrics_sink(backend: Optional[str] = None) -> MetricsSink:
+    """
+    Create a sink for the given backend (default METRICS_BACKEND).
+    
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    backend = (backend or METRICS_BACKEND).lower()
+    if backend not in METRICS_SINKS:
+        raise ValueError(f"Unknown metrics backend '{backend}', expected one of {', '.join(METRICS_SINKS)}")
+    return METRICS_SINKS[backend]()
+
+@traced('send_metrics')
+def send_metrics(stopped_count: int, failed_count: int, total_count: int, error: bool = False,
+                 targets: Optional[List[Dict[str, Any]]] = None,
+                 servers: Optional[List[Dict[str, Any]]] = None,
+                 sink: Optional[MetricsSink] = None, restarted_count: Optional[int] = None):
     """
     Send metrics to CloudWatch for monitoring.
     
@@ -168,45 +1450,84 @@ def send_metrics(stopped_count: int, failed_count: int, total_count: int, error:
         failed_count: Number of servers that failed to stop
         total_count: Total number of servers found
         error: Whether there was an error in the main process
+        targets: Optional per-target breakdown (see target_summary); each target
+            gets its own counters with Account and Region dimensions
+        servers: Optional per-server records ({'name', 'outcome', 'stop_call_seconds',
+            'seconds_to_stop'}); each gets duration metrics with ServerName and
+            Outcome dimensions
+        sink: Where to send the metrics (default: a new sink for METRICS_BACKEND)
+        restarted_count: Servers found running again after the last run
+            stopped them (only sent when a state store is configured)
     """
     try:
-        namespace = 'MLflowTrackingServer/Shutdown'
-        timestamp = datetime.now(timezone.utc)
-        
-        metrics = [
-            {
-                'MetricName': 'ServersStopped',
-                'Value': stopped_count,
-                'Unit': 'Count',
-                'Timestamp': timestamp
-            },
-            {
-                'MetricName': 'ServersFailed',
-                'Value': failed_count,
-                'Unit': 'Count',
-                'Timestamp': timestamp
-            },
-            {
-                'MetricName': 'TotalServers',
-                'Value': total_count,
-                'Unit': 'Count',
-                'Timestamp': timestamp
-            },
-            {
-                'MetricName': 'ShutdownSuccess',
-                'Value': 1 if not error else 0,
-                'Unit': 'Count',
-                'Timestamp': timestamp
-            }
-        ]
+        sink = sink or get_metrics_sink()
         
-        cloudwatch_client.put_metric_data(
-            Namespace=namespace,
-            MetricData=metrics
-        )
+        sink.put('ServersStopped', stopped_count)
+        sink.put('ServersFailed', failed_count)
+        sink.put('TotalServers', total_count)
+        sink.put('ShutdownSuccess', 1 if not error else 0)
+        if restarted_count is not None:
+            sink.put('ServersRestarted', restarted_count)
+        
+        for target in targets or []:
+            dimensions = {'Account': target['account'] or 'local', 'Region': target['region'] or 'default'}
+            sink.put('ServersStopped', target['servers_stopped'], dimensions=dimensions)
+            sink.put('ServersFailed', target['servers_failed'], dimensions=dimensions)
+            sink.put('TotalServers', target['total_servers'], dimensions=dimensions)
         
-        logger.info(f"Sent {len(metrics)} metrics to CloudWatch")
+        for server in servers or []:
+            dimensions = {'ServerName': server['name'], 'Outcome': server['outcome']}
+            if server.get('stop_call_seconds') is not None:
+                sink.put('StopCallDuration', round(server['stop_call_seconds'], 3), 'Seconds', dimensions)
+            if server.get('seconds_to_stop') is not None:
+                sink.put('SecondsToStop', server['seconds_to_stop'], 'Seconds', dimensions)
+        
+        count = sink.flush()
+        logger.info(f"Sent {count} metrics to CloudWatch via {type(sink).__name__}")
         
     except Exception as e:
         logger.error(f"Failed to send metrics to CloudWatch: {str(e)}")
         # Don't raise the exception as metrics failure shouldn't break the main function
+
+def profile_imports(top: int = 15) -> List[Tuple[str, float]]:
+    """
+    Import this module in a fresh interpreter with -X importtime and return
+    its `top` slowest direct imports as (module, cumulative_ms) pairs, plus
+    the time spent in the module body itself.
+    """
+    import subprocess
+    
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    module_name = os.path.splitext(os.path.basename(__file__))[0]
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                            cwd=module_dir, env=env, capture_output=True, text=True, check=True)
+    
+    # Lines look like "import time: self [us] | cumulative | <indent>package" and
+    # a package is printed after everything it imported, one indent level deeper
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+    
+    index = next(i for i, entry in enumerate(entries) if entry[0] == module_name and entry[1] == 0)
+    timings = [(f'{module_name} (module body)', entries[index][2])]
+    for name, depth, _, cumulative_ms in reversed(entries[:index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            timings.append((name, cumulative_ms))
+    return sorted(timings, key=lambda item: item[1], reverse=True)[:top]
+
+COLD_START_TIMINGS['module_init_ms'] = round((time.perf_counter() - _import_started) * 1000, 1)
+
+if __name__ == '__main__':
+    if '--profile-imports' in sys.argv:
+        print(f"{'module':<48}{'cumulative ms':>14}")
+        for name, ms in profile_imports():
+            print(f"{name:<48}{ms:>14.1f}")
+    else:
+        print("Usage: python lambda_stop_mlflow_servers.py --profile-imports")
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Empty and delete S3 buckets, many at once.
+
+Python replacement for delete_buckets.sh. Each bucket's object versions and
+delete markers are streamed from the paginated list_object_versions call
+(which also covers unversioned buckets, whose objects have version "null"),
+cut into batches of up to 1000 keys and deleted with delete_objects by a
+worker pool shared by every bucket. Listing never waits for a whole bucket:
+at most a few batches per bucket are queued ahead of the deleters, so memory
+stays flat however large the bucket is. Progress and throughput are logged
+while it runs, and --dry-run only counts what would be deleted.
+
+Usage:
+    python s3_purge.py --dry-run
+    python s3_purge.py iti113-team1-artifacts iti113-team2-artifacts --yes
+    python s3_purge.py --exclude nyp-aicourse shared-data --keep-buckets
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+
+# Never emptied or deleted, as in delete_buckets.sh
+PROTECTED_BUCKETS = {'nyp-aicourse'}
+
+# delete_objects accepts at most 1000 keys per request
+BATCH_SIZE = 1000
+
+# Buckets listed at once, and delete_objects requests in flight across all of them
+BUCKET_WORKERS = 8
+DELETE_WORKERS = 32
+
+# Batches a bucket may have queued ahead of the deleters
+MAX_QUEUED_BATCHES = 4
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+
+def error_code(error: Exception) -> str:
+    # BotoCoreError (endpoint, connection, credentials...) has no response to take a code from
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code', '')
+    return type(error).__name__
+
+
+def iter_versions(client, bucket: str, page_size: int = BATCH_SIZE) -> Iterator[Dict[str, str]]:
+    """
+    Yield {'Key', 'VersionId'} for every object version and delete marker in
+    the bucket, one list_object_versions page at a time.
+    """
+    kwargs: Dict[str, Any] = {'Bucket': bucket, 'MaxKeys': page_size}
+    while True:
+        response = client.list_object_versions(**kwargs)
+        for entry in response.get('Versions', []) + response.get('DeleteMarkers', []):
+            yield {'Key': entry['Key'], 'VersionId': entry['VersionId']}
+        if not response.get('IsTruncated'):
+            return
+        kwargs['KeyMarker'] = response['NextKeyMarker']
+        kwargs['VersionIdMarker'] = response['NextVersionIdMarker']
+
+
+def batches(entries: Iterator[Dict[str, str]], size: int = BATCH_SIZE) -> Iterator[List[Dict[str, str]]]:
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Progress:
+    """Thread-safe running totals, logged at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, log: Callable[[str], None], clock: Callable[[], float], interval: float = PROGRESS_INTERVAL):
+        self.log = log
+        self.clock = clock
+        self.interval = interval
+        self.started = clock()
+        self.objects = 0
+        self.requests = 0
+        self.errors = 0
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return max(self.clock() - self.started, 1e-9)
+
+    def add(self, objects: int, errors: int = 0):
+        with self._lock:
+            self.objects += objects
+            self.errors += errors
+            self.requests += 1
+            now = self.clock()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def report(self, verb: str = 'deleted'):
+        self.log(f'{verb} {self.objects} objects in {self.requests} requests, '
+                 f'{self.errors} errors, {self.elapsed:.1f}s ({self.objects / self.elapsed:.0f} objects/s)')
+
+
+class BucketPurger:
+    """
+    Empties (and by default deletes) many buckets concurrently.
+
+    Args:
+        client: S3 client (boto3 or a stub with the same methods)
+        bucket_workers: Buckets listed at once
+        delete_workers: delete_objects requests in flight across all buckets
+        batch_size: Keys per delete_objects request (at most 1000)
+        dry_run: Only list and count; nothing is deleted
+        delete_buckets: Delete each bucket once it is empty
+        log: Where progress lines go
+        clock: Replaceable in tests
+    """
+
+    def __init__(self, client, bucket_workers: int = BUCKET_WORKERS, delete_workers: int = DELETE_WORKERS,
+                 batch_size: int = BATCH_SIZE, dry_run: bool = False, delete_buckets: bool = True,
+                 log: Callable[[str], None] = print, clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        self.bucket_workers = max(1, bucket_workers)
+        self.delete_workers = max(1, delete_workers)
+        self.batch_size = max(1, min(BATCH_SIZE, batch_size))
+        self.dry_run = dry_run
+        self.delete_buckets = delete_buckets
+        self.log = log
+        self.clock = clock
+        self.progress = Progress(log, clock)
+        self._result_lock = threading.Lock()
+
+    def _delete_batch(self, bucket: str, batch: List[Dict[str, str]], result: Dict[str, Any]):
+        try:
+            response = self.client.delete_objects(Bucket=bucket, Delete={'Objects': batch, 'Quiet': True})
+            errors = response.get('Errors', [])
+        except Exception as e:
+            # anything but the batch's own failure would abort every bucket in the purge
+            errors = [{'Key': entry['Key'], 'VersionId': entry['VersionId'], 'Code': error_code(e),
+                       'Message': str(e)} for entry in batch]
+        with self._result_lock:
+            result['deleted'] += len(batch) - len(errors)
+            result['errors'] += len(errors)
+            if errors and not result['reason']:
+                result['reason'] = f"{errors[0].get('Code')}: {errors[0].get('Message')}"
+        self.progress.add(len(batch) - len(errors), len(errors))
+
+    def purge_bucket(self, bucket: str, executor: ThreadPoolExecutor) -> Dict[str, Any]:
+        """Stream one bucket's versions into the shared delete pool, then delete the bucket."""
+        result = {'bucket': bucket, 'listed': 0, 'deleted': 0, 'errors': 0,
+                  'bucket_deleted': False, 'seconds': 0.0, 'reason': None}
+        started = self.clock()
+        # Bounds the batches this bucket has waiting in the shared pool
+        queued = threading.BoundedSemaphore(MAX_QUEUED_BATCHES)
+        futures = []
+
+        def release(_future):
+            queued.release()
+
+        try:
+            for batch in batches(iter_versions(self.client, bucket, self.batch_size), self.batch_size):
+                result['listed'] += len(batch)
+                if self.dry_run:
+                    continue
+                queued.acquire()
+                future = executor.submit(self._delete_batch, bucket, batch, result)
+                future.add_done_callback(release)
+                futures.append(future)
+        except Exception as e:
+            with self._result_lock:
+                result['errors'] += 1
+                result['reason'] = f'{error_code(e)}: {e}'
+        for future in futures:
+            future.result()
+
+        if self.dry_run:
+            self.log(f'{bucket}: would delete {result["listed"]} objects')
+        elif self.delete_buckets and not result['errors']:
+            try:
+                self.client.delete_bucket(Bucket=bucket)
+                result['bucket_deleted'] = True
+            except Exception as e:
+                result['reason'] = f'{error_code(e)}: {e}'
+        result['seconds'] = round(self.clock() - started, 3)
+        if not self.dry_run:
+            outcome = 'bucket deleted' if result['bucket_deleted'] else (
+                'emptied' if not result['errors'] and not self.delete_buckets else f'failed ({result["reason"]})')
+            self.log(f'{bucket}: {result["deleted"]} objects deleted in {result["seconds"]:.1f}s, {outcome}')
+        return result
+
+    def purge(self, buckets: List[str]) -> List[Dict[str, Any]]:
+        """Purge every bucket, at most bucket_workers at a time; results are in input order."""
+        protected = sorted(set(buckets) & PROTECTED_BUCKETS)
+        if protected:
+            raise ValueError(f'Refusing to purge protected buckets: {", ".join(protected)}')
+        self.progress = Progress(self.log, self.clock)
+        with ThreadPoolExecutor(max_workers=self.delete_workers) as deleters, \
+                ThreadPoolExecutor(max_workers=min(self.bucket_workers, max(1, len(buckets)))) as listers:
+            results = list(listers.map(lambda bucket: self.purge_bucket(bucket, deleters), buckets))
+        if self.dry_run:
+            self.log(f'would delete {sum(r["listed"] for r in results)} objects from {len(results)} buckets')
+        else:
+            self.progress.report()
+        return results
+
+
+def list_buckets(client, exclude: Optional[List[str]] = None) -> List[str]:
+    """All buckets in the account except the protected and excluded ones."""
+    skip = PROTECTED_BUCKETS | set(exclude or [])
+    return [b['Name'] for b in client.list_buckets().get('Buckets', []) if b['Name'] not in skip]
+
+
+def print_table(rows: List[Dict[str, Any]], dry_run: bool):
+    print(f"{'bucket':<48}{'objects':>10}{'errors':>8}{'seconds':>9}  {'outcome'}")
+    for row in rows:
+        if dry_run:
+            outcome = 'dry run'
+        elif row['bucket_deleted']:
+            outcome = 'deleted'
+        else:
+            outcome = 'emptied' if not row['errors'] and not row['reason'] else row['reason']
+        count = row['listed'] if dry_run else row['deleted']
+        print(f"{row['bucket']:<48}{count:>10}{row['errors']:>8}{row['seconds']:>9.1f}  {outcome}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Empty and delete S3 buckets concurrently.')
+    parser.add_argument('buckets', nargs='*', help='Buckets to purge (default: every bucket in the account)')
+    parser.add_argument('--exclude', nargs='+', default=[],
+                        help=f'Buckets to keep, in addition to {", ".join(sorted(PROTECTED_BUCKETS))}')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the objects that would be deleted')
+    parser.add_argument('--keep-buckets', action='store_true', help='Empty the buckets but do not delete them')
+    parser.add_argument('--bucket-workers', type=int, default=BUCKET_WORKERS,
+                        help='Buckets processed at once (default: %(default)s)')
+    parser.add_argument('--delete-workers', type=int, default=DELETE_WORKERS,
+                        help='delete_objects requests in flight (default: %(default)s)')
+    parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation')
+    parser.add_argument('--region', help='AWS region (default: from the environment)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args(argv)
+
+    import boto3
+    from botocore.config import Config
+
+    # Enough connections for every deleter; adaptive retries back off on SlowDown
+    client = boto3.client('s3', region_name=args.region, config=Config(
+        max_pool_connections=args.delete_workers + args.bucket_workers,
+        retries={'max_attempts': 10, 'mode': 'adaptive'}))
+
+    excluded = PROTECTED_BUCKETS | set(args.exclude)
+    buckets = [b for b in args.buckets if b not in excluded] if args.buckets else list_buckets(client, args.exclude)
+    if not buckets:
+        print('No buckets to purge.', file=sys.stderr)
+        return
+
+    if not args.dry_run and not args.yes:
+        print('WARNING: This will permanently delete ALL contents of:', file=sys.stderr)
+        for bucket in buckets:
+            print(f'  - {bucket}', file=sys.stderr)
+        if input("Type 'DELETE' to confirm: ") != 'DELETE':
+            print('Operation cancelled', file=sys.stderr)
+            return
+
+    purger = BucketPurger(client, bucket_workers=args.bucket_workers, delete_workers=args.delete_workers,
+                          dry_run=args.dry_run, delete_buckets=not args.keep_buckets,
+                          log=(lambda line: print(line, file=sys.stderr)))
+    rows = purger.purge(buckets)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows, args.dry_run)
+    if any(r['errors'] or r['reason'] for r in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Test script for the multi-team domain orchestrator.
+Runs the orchestrator against the in-process CloudFormation stub in fake_aws.py.
+"""
+
+import io
+import os
+import sys
+import tempfile
+
+# Add the current directory to the path so we can import the orchestrator
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import domain_orchestrator
+    from domain_orchestrator import (DomainOrchestrator, InputCache, StatusDashboard, read_teams, team_parameters,
+                                     OrchestratorError)
+    from fake_aws import FakeCloudFormation
+except ImportError:
+    print("Error: Could not import domain_orchestrator. Make sure the file exists.")
+    sys.exit(1)
+
+TEMPLATE = """AWSTemplateFormatVersion: '2010-09-09'
+Parameters:
+  DomainName: {Type: String}
+  StudioUserName: {Type: String}
+  TeamUserName: {Type: String}
+  TeamName: {Type: String}
+  DefaultInstanceType: {Type: String}
+Resources: {}
+"""
+
+
+class FakeClock:
+    """Clock advanced by the orchestrator's sleep calls instead of real time."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def __call__(self):
+        return self.now
+
+
+def make_orchestrator(cloudformation, clock=None, **kwargs):
+    clock = clock or FakeClock()
+    return DomainOrchestrator(cloudformation, template_body=TEMPLATE, log=lambda line: None,
+                              sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def test_read_teams():
+    """Test that the active TEAMS assignment is read and validated."""
+    print("Testing read_teams...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = os.path.join(tmp, 'team-config.sh')
+        with open(config, 'w') as f:
+            f.write('# TEAMS=("old-team")\nTEAMS=("iti113-team1" "iti113-team2")\nexport TEAMS\n')
+        assert read_teams(config) == ['iti113-team1', 'iti113-team2']
+
+        with open(config, 'w') as f:
+            f.write('TEAMS=("bad team!")\n')
+        try:
+            read_teams(config)
+            assert False, "Invalid team names should be rejected"
+        except OrchestratorError:
+            pass
+
+    # The parameters match what the shell scripts wrote to parameters-<team>.json
+    params = {p['ParameterKey']: p['ParameterValue'] for p in team_parameters('iti113-teamx')}
+    assert params == {
+        'DomainName': 'iti113-teamx-domain',
+        'StudioUserName': 'iti113-teamx-member',
+        'TeamUserName': 'iti113-teamx-user',
+        'TeamName': 'iti113-teamx',
+        'DefaultInstanceType': 'ml.t3.medium'
+    }
+
+    print("✅ read_teams test passed")
+
+
+def test_create_waits_for_all_stacks():
+    """Test concurrent creation with one shared poll loop."""
+    print("Testing create...")
+
+    teams = [f'iti113-team{i}' for i in range(1, 13)]
+    cloudformation = FakeCloudFormation(ticks=3, page_size=5, fail_stacks={'iti113-team7-sagemaker'})
+    results = make_orchestrator(cloudformation).run('create', teams)
+
+    statuses = {r['team']: r['status'] for r in results}
+    assert statuses['iti113-team7'] == 'ROLLBACK_COMPLETE'
+    assert all(status == 'CREATE_COMPLETE' for team, status in statuses.items() if team != 'iti113-team7')
+    assert [r['team'] for r in results if not r['ok']] == ['iti113-team7']
+
+    # One paginated listing per round (3 pages of 5), not one describe per stack per round
+    rounds = cloudformation.call_counts['DescribeStacks'] / 3
+    assert rounds <= 4, f"Expected a few polling rounds, got {rounds}"
+    assert cloudformation.call_counts['CreateStack'] == 12
+
+    print("✅ create test passed")
+
+
+def test_update_and_delete():
+    """Test that unchanged and missing stacks are reported, and deletes are awaited."""
+    print("Testing update and delete...")
+
+    cloudformation = FakeCloudFormation(ticks=2)
+    cloudformation.add_stack('iti113-team1-sagemaker', template_body=TEMPLATE, parameters=team_parameters('iti113-team1'))
+    cloudformation.add_stack('iti113-team2-sagemaker', template_body='old template', parameters=team_parameters('iti113-team2'))
+    orchestrator = make_orchestrator(cloudformation)
+
+    updated = {r['team']: r for r in orchestrator.run('update', ['iti113-team1', 'iti113-team2', 'iti113-team3'])}
+    assert updated['iti113-team1']['status'] == domain_orchestrator.NO_CHANGES
+    assert updated['iti113-team1']['ok']
+    assert updated['iti113-team2']['status'] == 'UPDATE_COMPLETE'
+    assert updated['iti113-team3']['status'] == domain_orchestrator.DOES_NOT_EXIST
+    assert not updated['iti113-team3']['ok']
+
+    deleted = orchestrator.run('delete', ['iti113-team1', 'iti113-team2'])
+    assert all(r['status'] == 'DELETE_COMPLETE' and r['ok'] for r in deleted)
+    assert cloudformation.statuses() == {}
+
+    status = orchestrator.status(['iti113-team1'])
+    assert status[0]['status'] == domain_orchestrator.DOES_NOT_EXIST
+
+    print("✅ update and delete test passed")
+
+
+def test_poll_backoff():
+    """Test that the poll interval backs off while nothing changes and honours the timeout."""
+    print("Testing poll backoff...")
+
+    clock = FakeClock()
+    cloudformation = FakeCloudFormation(ticks=1000)
+    orchestrator = make_orchestrator(cloudformation, clock=clock)
+    results = orchestrator.run('create', ['iti113-team1'], timeout=120)
+
+    assert results[0]['status'] == 'CREATE_IN_PROGRESS'
+    assert not results[0]['ok']
+    assert clock.sleeps[0] == domain_orchestrator.POLL_INITIAL_SECONDS
+    assert clock.sleeps[1] == domain_orchestrator.POLL_INITIAL_SECONDS * domain_orchestrator.POLL_BACKOFF
+    assert clock.sleeps == sorted(clock.sleeps[:-1]) + clock.sleeps[-1:], "Intervals should grow until the deadline"
+    assert max(clock.sleeps) <= domain_orchestrator.POLL_MAX_SECONDS
+    assert clock.now <= 120
+
+    print("✅ poll backoff test passed")
+
+
+def test_status_dashboard():
+    """Test the cached listing, failed events and waiting until every stack settles."""
+    print("Testing status dashboard...")
+
+    teams = [f'iti113-team{i}' for i in range(1, 21)]
+    clock = FakeClock()
+    cloudformation = FakeCloudFormation(ticks=4, page_size=10, fail_stacks={'iti113-team3-sagemaker'})
+    orchestrator = make_orchestrator(cloudformation, clock=clock)
+    orchestrator.submit('create', teams[:-1])
+    dashboard = StatusDashboard(orchestrator, ttl=5)
+
+    # Within the TTL the listing is reused
+    dashboard.snapshot(teams)
+    dashboard.snapshot(teams[:3])
+    assert cloudformation.call_counts['DescribeStacks'] == 2, "Expected one paginated listing (2 pages)"
+
+    out = io.StringIO()
+    rows = {r['team']: r for r in dashboard.watch(teams, until_terminal=True, interval=2, out=out)}
+    assert all(not r['status'].endswith('_IN_PROGRESS') for r in rows.values())
+    assert rows['iti113-team20']['status'] == domain_orchestrator.DOES_NOT_EXIST
+    assert rows['iti113-team3']['status'] == 'ROLLBACK_COMPLETE'
+    assert rows['iti113-team3']['events'][0]['status'] == 'CREATE_FAILED'
+    assert 'quota' in rows['iti113-team3']['events'][0]['reason']
+    assert all(not r['events'] for team, r in rows.items() if team != 'iti113-team3')
+    assert '1 failed' in out.getvalue() and '18 complete' in out.getvalue()
+
+    # Events are fetched once per failed stack and status, not on every redraw
+    dashboard.snapshot(teams, force=True)
+    assert cloudformation.call_counts['DescribeStackEvents'] == 1
+
+    print("✅ status dashboard test passed")
+
+
+def test_update_skips_unchanged_inputs():
+    """Test that updates are only submitted for teams whose template or parameters changed."""
+    print("Testing update input cache...")
+
+    teams = [f'iti113-team{i}' for i in range(1, 7)]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = os.path.join(tmp, 'inputs.json')
+        cloudformation = FakeCloudFormation(ticks=1)
+        for team in teams:
+            cloudformation.add_stack(f'{team}-sagemaker', template_body='old template', parameters=team_parameters(team))
+
+        first = make_orchestrator(cloudformation, cache=InputCache(cache_file)).run('update', teams)
+        assert all(r['status'] == 'UPDATE_COMPLETE' for r in first)
+        assert cloudformation.call_counts['UpdateStack'] == 6
+        assert cloudformation.call_counts['ValidateTemplate'] == 1, "The template should be validated once per run"
+
+        # Nothing changed: no update_stack calls and no second validation
+        cloudformation.call_counts.clear()
+        second = make_orchestrator(cloudformation, cache=InputCache(cache_file)).run('update', teams)
+        assert all(r['status'] == domain_orchestrator.NO_CHANGES and r['ok'] for r in second)
+        assert cloudformation.call_counts['UpdateStack'] == 0
+        assert cloudformation.call_counts['ValidateTemplate'] == 0
+
+        # One team's parameters change, and one stack was deleted outside the tool
+        cloudformation.call_counts.clear()
+        cloudformation.stacks.pop('iti113-team6-sagemaker')
+        orchestrator = make_orchestrator(cloudformation, cache=InputCache(cache_file))
+        cached = orchestrator.cache.stacks['iti113-team2-sagemaker']
+        orchestrator.cache.stacks['iti113-team2-sagemaker'] = 'stale'
+        third = {r['team']: r for r in orchestrator.run('update', teams)}
+        assert cloudformation.call_counts['UpdateStack'] == 2
+        assert third['iti113-team2']['status'] == domain_orchestrator.NO_CHANGES, "CloudFormation still had these inputs"
+        assert third['iti113-team6']['status'] == domain_orchestrator.DOES_NOT_EXIST
+        assert InputCache(cache_file).stacks['iti113-team2-sagemaker'] == cached
+
+        # --force submits every team again
+        cloudformation.call_counts.clear()
+        make_orchestrator(cloudformation, cache=InputCache(cache_file), force=True).run('update', teams[:3])
+        assert cloudformation.call_counts['UpdateStack'] == 3
+
+    # A template that fails validation stops the run before any stack is touched
+    cloudformation = FakeCloudFormation()
+    orchestrator = DomainOrchestrator(cloudformation, template_body='Parameters: {}\n', log=lambda line: None)
+    try:
+        orchestrator.run('create', teams)
+        assert False, "An invalid template should be rejected"
+    except OrchestratorError:
+        pass
+    assert cloudformation.call_counts['CreateStack'] == 0
+
+    print("✅ update input cache test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting domain orchestrator tests...\n")
+
+    try:
+        test_read_teams()
+        test_create_waits_for_all_stacks()
+        test_update_and_delete()
+        test_poll_backoff()
+        test_status_dashboard()
+        test_update_skips_unchanged_inputs()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
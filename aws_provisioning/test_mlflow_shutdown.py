@@ -4,19 +4,29 @@ Test script for the MLflow shutdown Lambda function.
 This script simulates the Lambda environment and tests the function logic.
 """
 
+import io
 import json
 import boto3
+from botocore.exceptions import ClientError
 from unittest.mock import Mock, patch, MagicMock
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import sys
 import os
+import tempfile
+import threading
+import time
 
 # Add the current directory to the path so we can import the lambda function
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+# Clients need a region to be constructed outside Lambda
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
 # Import the lambda function
 try:
-    from lambda_stop_mlflow_servers import lambda_handler, list_mlflow_tracking_servers, send_metrics
+    import lambda_stop_mlflow_servers
+    from lambda_stop_mlflow_servers import lambda_handler, list_mlflow_tracking_servers, send_metrics, call_with_retry
+    from fake_aws import FakeSageMaker, FakeLambdaContext
 except ImportError:
     print("Error: Could not import lambda_stop_mlflow_servers. Make sure the file exists.")
     sys.exit(1)
@@ -42,23 +52,23 @@ def create_mock_sagemaker_response():
     
     # Mock MLflow tracking servers response
     mlflow_servers_response = {
-        'MlflowTrackingServers': [
+        'TrackingServerSummaries': [
             {
-                'MlflowTrackingServerName': 'mlflow-server-1',
-                'MlflowTrackingServerArn': 'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/mlflow-server-1',
-                'Status': 'InService',
+                'TrackingServerName': 'mlflow-server-1',
+                'TrackingServerArn': 'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/mlflow-server-1',
+                'TrackingServerStatus': 'Started',
                 'DomainId': 'd-1234567890abcdef'
             },
             {
-                'MlflowTrackingServerName': 'mlflow-server-2',
-                'MlflowTrackingServerArn': 'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/mlflow-server-2',
-                'Status': 'Stopped',
+                'TrackingServerName': 'mlflow-server-2',
+                'TrackingServerArn': 'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/mlflow-server-2',
+                'TrackingServerStatus': 'Stopped',
                 'DomainId': 'd-1234567890abcdef'
             },
             {
-                'MlflowTrackingServerName': 'mlflow-server-3',
-                'MlflowTrackingServerArn': 'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/mlflow-server-3',
-                'Status': 'InService',
+                'TrackingServerName': 'mlflow-server-3',
+                'TrackingServerArn': 'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/mlflow-server-3',
+                'TrackingServerStatus': 'Started',
                 'DomainId': 'd-0987654321fedcba'
             }
         ]
@@ -72,6 +82,7 @@ def test_list_mlflow_tracking_servers():
     
     domains_response, mlflow_servers_response = create_mock_sagemaker_response()
     
+    lambda_stop_mlflow_servers.reset_clients()
     with patch('boto3.client') as mock_boto3_client:
         # Create mock SageMaker client
         mock_sagemaker_client = Mock()
@@ -87,6 +98,10 @@ def test_list_mlflow_tracking_servers():
         # Mock the paginate method
         mock_paginator.paginate.return_value = [mlflow_servers_response]
         
+        # Describe returns the server's details
+        servers_by_name = {s['TrackingServerName']: s for s in mlflow_servers_response['TrackingServerSummaries']}
+        mock_sagemaker_client.describe_mlflow_tracking_server.side_effect = lambda TrackingServerName: servers_by_name[TrackingServerName]
+        
         # Call the function
         result = list_mlflow_tracking_servers()
         
@@ -94,23 +109,532 @@ def test_list_mlflow_tracking_servers():
         assert len(result) == 3, f"Expected 3 servers, got {len(result)}"
         
         # Check that we have the expected servers
-        server_names = [server['MlflowTrackingServerName'] for server in result]
+        server_names = [server['TrackingServerName'] for server in result]
         expected_names = ['mlflow-server-1', 'mlflow-server-2', 'mlflow-server-3']
         assert set(server_names) == set(expected_names), f"Expected {expected_names}, got {server_names}"
         
         print("✅ list_mlflow_tracking_servers test passed")
 
+def make_server(name, status='Started'):
+    """Build a tracking server record with the fields the handler reads."""
+    return {
+        'TrackingServerName': name,
+        'TrackingServerArn': f'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/{name}',
+        'TrackingServerStatus': status
+    }
+
+def throttling_error(operation='DescribeMlflowTrackingServer'):
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, operation)
+
+def test_list_mlflow_tracking_servers_parallel():
+    """Test that describe calls run concurrently and keep the listing order."""
+    print("Testing list_mlflow_tracking_servers parallel describe...")
+    
+    names = [f'mlflow-server-{i}' for i in range(12)]
+    pages = [
+        {'TrackingServerSummaries': [{'TrackingServerName': n} for n in names[:7]]},
+        {'TrackingServerSummaries': [{'TrackingServerName': n} for n in names[7:]]}
+    ]
+    
+    lock = threading.Lock()
+    in_flight = {'now': 0, 'max': 0}
+    
+    def describe(TrackingServerName):
+        with lock:
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        # later servers answer first, so completion order differs from listing order
+        time.sleep(0.05 - names.index(TrackingServerName) * 0.003)
+        with lock:
+            in_flight['now'] -= 1
+        return make_server(TrackingServerName)
+    
+    mock_sagemaker_client = Mock()
+    mock_sagemaker_client.get_paginator.return_value.paginate.return_value = pages
+    mock_sagemaker_client.describe_mlflow_tracking_server.side_effect = describe
+    
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=mock_sagemaker_client):
+        result = list_mlflow_tracking_servers(max_workers=4)
+    
+    assert [s['TrackingServerName'] for s in result] == names, "Results should keep the listing order"
+    assert in_flight['max'] == 4, f"Expected 4 concurrent describe calls, got {in_flight['max']}"
+    
+    print("✅ list_mlflow_tracking_servers parallel test passed")
+
+def test_call_with_retry_throttling():
+    """Test that throttled calls are retried with backoff and other errors are not."""
+    print("Testing call_with_retry...")
+    
+    fn = Mock(side_effect=[throttling_error(), throttling_error(), {'ok': True}])
+    with patch.object(lambda_stop_mlflow_servers.time, 'sleep') as mock_sleep:
+        assert call_with_retry(fn, TrackingServerName='a') == {'ok': True}
+        assert fn.call_count == 3
+        assert mock_sleep.call_count == 2
+        
+        # Non-throttling errors are raised immediately
+        error = ClientError({'Error': {'Code': 'ResourceNotFound', 'Message': 'missing'}}, 'DescribeMlflowTrackingServer')
+        fn = Mock(side_effect=error)
+        try:
+            call_with_retry(fn)
+            assert False, "Expected ClientError"
+        except ClientError:
+            pass
+        assert fn.call_count == 1
+        
+        # Retries are bounded
+        fn = Mock(side_effect=throttling_error())
+        try:
+            call_with_retry(fn, max_retries=2)
+            assert False, "Expected ClientError"
+        except ClientError:
+            pass
+        assert fn.call_count == 3
+    
+    print("✅ call_with_retry test passed")
+
+def test_lambda_handler_summary_fast_path():
+    """Test that the handler works from list summaries and only calls stop for running servers."""
+    print("Testing lambda_handler summary-only fast path...")
+    
+    summaries = {'TrackingServerSummaries': [
+        make_server('mlflow-server-1', 'Started'),
+        make_server('mlflow-server-2', 'Stopped'),
+        make_server('mlflow-server-3', 'Stopped'),
+        make_server('mlflow-server-4', 'Started')
+    ]}
+    
+    mock_sagemaker_client = Mock()
+    mock_sagemaker_client.get_paginator.return_value.paginate.return_value = [summaries]
+    mock_sagemaker_client.stop_mlflow_tracking_server.return_value = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+    
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=mock_sagemaker_client), \
+         patch.object(lambda_stop_mlflow_servers, 'get_cloudwatch_client', return_value=Mock()):
+        result = lambda_handler({}, Mock())
+        
+        response_body = json.loads(result['body'])
+        assert response_body['servers_stopped'] == 2
+        assert response_body['total_servers'] == 4
+        assert response_body['stopped_servers'] == ['mlflow-server-1', 'mlflow-server-4']
+        # Only the running servers are described, for their size
+        described = [c[1]['TrackingServerName'] for c in mock_sagemaker_client.describe_mlflow_tracking_server.call_args_list]
+        assert sorted(described) == ['mlflow-server-1', 'mlflow-server-4']
+        mock_sagemaker_client.describe_mlflow_tracking_server.reset_mock()
+        
+        # Audit mode describes every server, and the descriptions already carry the size
+        mock_sagemaker_client.describe_mlflow_tracking_server.side_effect = \
+            lambda TrackingServerName: dict(next(s for s in summaries['TrackingServerSummaries'] if s['TrackingServerName'] == TrackingServerName),
+                                            TrackingServerSize='Small')
+        result = lambda_handler({'full_details': True}, Mock())
+        assert json.loads(result['body'])['servers_stopped'] == 2
+        assert mock_sagemaker_client.describe_mlflow_tracking_server.call_count == 4
+    
+    print("✅ lambda_handler summary fast path test passed")
+
+def test_stop_tracking_servers_concurrent():
+    """Test concurrent stop calls keep order and report failures."""
+    print("Testing stop_tracking_servers...")
+    
+    servers = [make_server(f'mlflow-server-{i}') for i in range(6)]
+    
+    def stop(TrackingServerName):
+        if TrackingServerName == 'mlflow-server-3':
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad state'}}, 'StopMlflowTrackingServer')
+        time.sleep(0.02)
+        return {'TrackingServerArn': TrackingServerName}
+    
+    mock_sagemaker_client = Mock()
+    mock_sagemaker_client.stop_mlflow_tracking_server.side_effect = stop
+    
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=mock_sagemaker_client):
+        stopped, failed = lambda_stop_mlflow_servers.stop_tracking_servers(servers, max_workers=3, rate=0)
+    
+    assert [s['name'] for s in stopped] == ['mlflow-server-0', 'mlflow-server-1', 'mlflow-server-2', 'mlflow-server-4', 'mlflow-server-5']
+    assert [s['name'] for s in failed] == ['mlflow-server-3']
+    assert 'bad state' in failed[0]['error']
+    
+    print("✅ stop_tracking_servers test passed")
+
+def test_lambda_handler_wait_for_stop():
+    """Test that wait mode polls all servers together and reports final states."""
+    print("Testing lambda_handler wait_for_stop...")
+    
+    listings = [
+        {'TrackingServerSummaries': [make_server('mlflow-server-1', 'Started'), make_server('mlflow-server-2', 'Started')]},
+        {'TrackingServerSummaries': [make_server('mlflow-server-1', 'Stopped'), make_server('mlflow-server-2', 'Stopping')]},
+        {'TrackingServerSummaries': [make_server('mlflow-server-1', 'Stopped'), make_server('mlflow-server-2', 'Stopped')]}
+    ]
+    
+    mock_sagemaker_client = Mock()
+    mock_sagemaker_client.get_paginator.return_value.paginate.side_effect = lambda: [listings.pop(0)]
+    mock_sagemaker_client.stop_mlflow_tracking_server.return_value = {}
+    
+    context = Mock()
+    context.get_remaining_time_in_millis.return_value = 300000
+    
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=mock_sagemaker_client), \
+         patch.object(lambda_stop_mlflow_servers, 'get_cloudwatch_client', return_value=Mock()), \
+         patch.object(lambda_stop_mlflow_servers.time, 'sleep'):
+        result = lambda_handler({'wait_for_stop': True}, context)
+    
+    response_body = json.loads(result['body'])
+    assert response_body['servers_stopped'] == 2
+    assert response_body['servers_confirmed_stopped'] == 2
+    assert response_body['final_states'] == {'mlflow-server-1': 'Stopped', 'mlflow-server-2': 'Stopped'}
+    assert set(response_body['seconds_to_stop']) == {'mlflow-server-1', 'mlflow-server-2'}
+    
+    # When time is short the handler returns without waiting
+    listings[:] = [{'TrackingServerSummaries': [make_server('mlflow-server-1', 'Started')]}]
+    context.get_remaining_time_in_millis.return_value = 10000
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=mock_sagemaker_client), \
+         patch.object(lambda_stop_mlflow_servers, 'get_cloudwatch_client', return_value=Mock()):
+        result = lambda_handler({'wait_for_stop': True}, context)
+    response_body = json.loads(result['body'])
+    assert response_body['final_states'] == {'mlflow-server-1': 'Stopping'}
+    assert response_body['servers_confirmed_stopped'] == 0
+    
+    print("✅ lambda_handler wait_for_stop test passed")
+
+def test_lambda_handler_multi_target():
+    """Test fan-out over regions and accounts with stubbed per-target clients."""
+    print("Testing lambda_handler multi-region/multi-account fan-out...")
+    
+    fleets = {
+        ('us-east-1', None): [make_server('a', 'Started'), make_server('b', 'Stopped')],
+        ('ap-southeast-1', None): [make_server('a', 'Started'), make_server('c', 'Started')],
+        ('us-east-1', 'arn:aws:iam::210987654321:role/shutdown'): [make_server('d', 'Stopped')],
+        ('ap-southeast-1', 'arn:aws:iam::210987654321:role/shutdown'): None  # assume role fails
+    }
+    
+    def client_for(target):
+        servers = fleets[(target['region'], target['role_arn'])]
+        if servers is None:
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'not authorized'}}, 'AssumeRole')
+        client = Mock()
+        client.get_paginator.return_value.paginate.return_value = [{'TrackingServerSummaries': servers}]
+        client.stop_mlflow_tracking_server.return_value = {}
+        return client
+    
+    sink = lambda_stop_mlflow_servers.InMemoryMetricsSink()
+    event = {
+        'regions': ['us-east-1', 'ap-southeast-1'],
+        'role_arns': [None, 'arn:aws:iam::210987654321:role/shutdown']
+    }
+    
+    with patch.object(lambda_stop_mlflow_servers, 'create_sagemaker_client', side_effect=client_for), \
+         patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink', return_value=sink):
+        result = lambda_handler(event, Mock())
+    
+    assert result['statusCode'] == 200
+    response_body = json.loads(result['body'])
+    assert response_body['servers_stopped'] == 3
+    assert response_body['total_servers'] == 5
+    assert response_body['stopped_servers'] == ['local/us-east-1/a', 'local/ap-southeast-1/a', 'local/ap-southeast-1/c']
+    
+    targets = {t['target']: t for t in response_body['targets']}
+    assert len(targets) == 4
+    assert targets['local/ap-southeast-1']['servers_stopped'] == 2
+    assert targets['210987654321/us-east-1']['total_servers'] == 1
+    assert 'not authorized' in targets['210987654321/ap-southeast-1']['error']
+    
+    # Aggregate metrics, three per-target counters for each of the 4 targets
+    # and a stop call duration for each of the 3 stopped servers
+    assert len(sink.published) == 4 + 3 * 4 + 3
+    assert sink.values('ShutdownSuccess') == [0], "A failed target should mark the run as unsuccessful"
+    assert sink.values('ServersStopped', Account='local', Region='ap-southeast-1') == [2]
+    assert len(sink.values('StopCallDuration', ServerName='local/ap-southeast-1/c', Outcome='Stopped')) == 1
+    
+    print("✅ lambda_handler multi-target test passed")
+
+def test_state_store_skips_unchanged_and_detects_restarts():
+    """Test that a state store lets later runs skip unchanged servers and spot restarts."""
+    print("Testing lambda_handler with a state store...")
+    
+    earlier = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    later = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    
+    def server(name, status, modified):
+        return dict(make_server(name, status), LastModifiedTime=modified)
+    
+    mock_sagemaker_client = Mock()
+    mock_sagemaker_client.stop_mlflow_tracking_server.return_value = {}
+    mock_sagemaker_client.describe_mlflow_tracking_server.side_effect = lambda TrackingServerName: server(TrackingServerName, 'Started', later)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        event = {'state_store': os.path.join(tmp, 'state.db')}
+        
+        with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=mock_sagemaker_client), \
+             patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink', return_value=lambda_stop_mlflow_servers.InMemoryMetricsSink()):
+            # First run stops 'a' and records 'b' as stopped
+            mock_sagemaker_client.get_paginator.return_value.paginate.return_value = [
+                {'TrackingServerSummaries': [server('a', 'Started', earlier), server('b', 'Stopped', earlier)]}
+            ]
+            first = json.loads(lambda_handler(event, Mock())['body'])
+            assert first['servers_stopped'] == 1
+            assert first['servers_unchanged'] == 0
+            
+            state = lambda_stop_mlflow_servers.get_state_store(event['state_store']).load()
+            assert {r['name']: r['status'] for r in state.values()} == {'a': 'Stopping', 'b': 'Stopped'}
+            
+            # Someone restarted 'a'; 'b' is untouched and is not described again
+            mock_sagemaker_client.get_paginator.return_value.paginate.return_value = [
+                {'TrackingServerSummaries': [server('a', 'Started', later), server('b', 'Stopped', earlier)]}
+            ]
+            second = json.loads(lambda_handler(dict(event, full_details=True), Mock())['body'])
+    
+    assert second['restarted_servers'] == ['a']
+    assert second['servers_unchanged'] == 1
+    assert second['stopped_servers'] == ['a']
+    described = [c[1]['TrackingServerName'] for c in mock_sagemaker_client.describe_mlflow_tracking_server.call_args_list]
+    assert described == ['a'], f"Unchanged stopped server should not be described, got {described}"
+    
+    print("✅ state store test passed")
+
+def test_state_store_in_summary_mode():
+    """Test that in the default mode the store saves the size describes of a resumed run and spots restarts."""
+    print("Testing the state store without full details...")
+    
+    now = datetime.now(timezone.utc)
+    sagemaker = FakeSageMaker()
+    for i, size in enumerate(['Small', 'Large', 'Medium', 'Small', 'Large']):
+        sagemaker.add_server(f'server-{i}', 'Started', size=size, last_modified=now - timedelta(hours=10 - i))
+    sagemaker.add_server('stopped', 'Stopped')
+    
+    class Context:
+        # Time for the two Large servers only
+        def get_remaining_time_in_millis(self):
+            return 60000 if sagemaker.call_counts['StopMlflowTrackingServer'] < 2 else 5000
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        event = {'state_store': os.path.join(tmp, 'state.db'), 'stop_concurrency': 1, 'stop_rate_per_second': 0}
+        
+        with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker), \
+             patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink', return_value=lambda_stop_mlflow_servers.InMemoryMetricsSink()):
+            first = json.loads(lambda_handler(event, Context())['body'])
+            assert first['stopped_servers'] == ['server-1', 'server-4']
+            assert sagemaker.call_counts['DescribeMlflowTrackingServer'] == 5
+            
+            state = lambda_stop_mlflow_servers.get_state_store(event['state_store']).load()
+            sizes = {r['name']: r['size'] for r in state.values()}
+            assert sizes['server-2'] == 'Medium' and sizes['stopped'] is None
+            
+            # The deferred servers are unchanged, so their recorded sizes are used
+            second = json.loads(lambda_handler(dict(event, continuation=first['continuation']), FakeLambdaContext(60))['body'])
+            assert second['stopped_servers'] == ['server-2', 'server-0', 'server-3']
+            assert sagemaker.call_counts['DescribeMlflowTrackingServer'] == 5, "Unchanged servers should not be described again"
+            
+            # A restart is still noticed without describing anything
+            sagemaker.start_mlflow_tracking_server(TrackingServerName='server-1')
+            third = json.loads(lambda_handler(event, FakeLambdaContext(60))['body'])
+    
+    assert third['restarted_servers'] == ['server-1']
+    assert third['servers_unchanged'] == 2  # 'stopped', and server-4 since the second run
+    assert sagemaker.call_counts['DescribeMlflowTrackingServer'] == 5
+    
+    print("✅ summary mode state store test passed")
+
+def test_lambda_handler_large_simulated_fleet():
+    """Test the handler against a simulated fleet with many pages, throttling and failures."""
+    print("Testing lambda_handler against a simulated fleet...")
+    
+    sagemaker = FakeSageMaker.with_fleet(2500, running_fraction=0.4, fail_fraction=0.01, page_size=100,
+                                         throttle_rate=0.05, stop_delay=0.05, seed=7)
+    running = [name for name, status in sagemaker.statuses().items() if status == 'Started']
+    event = {'stop_rate_per_second': 0, 'wait_for_stop': True}
+    
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker), \
+         patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink', return_value=lambda_stop_mlflow_servers.InMemoryMetricsSink()), \
+         patch.object(lambda_stop_mlflow_servers, 'RETRY_BASE_DELAY', 0.001), \
+         patch.object(lambda_stop_mlflow_servers, 'WAIT_POLL_INTERVAL', 0.05):
+        result = lambda_handler(event, FakeLambdaContext(60))
+    
+    assert result['statusCode'] == 200
+    response_body = json.loads(result['body'])
+    assert response_body['total_servers'] == 2500
+    assert response_body['servers_stopped'] + response_body['servers_failed'] == len(running)
+    assert response_body['servers_failed'] > 0
+    assert response_body['servers_confirmed_stopped'] == response_body['servers_stopped']
+    assert sagemaker.throttled_counts['StopMlflowTrackingServer'] > 0, "Some stop calls should have been throttled"
+    
+    # Summary mode: running servers are only described for their size, stopped ones not at all,
+    # and there is one stop per running server plus one per throttled attempt
+    assert sagemaker.call_counts['DescribeMlflowTrackingServer'] == len(running) + sagemaker.throttled_counts['DescribeMlflowTrackingServer']
+    assert sagemaker.call_counts['StopMlflowTrackingServer'] == len(running) + sagemaker.throttled_counts['StopMlflowTrackingServer']
+    assert sagemaker.call_counts['ListMlflowTrackingServers'] % 25 == 0, "Each listing should take 25 pages"
+    
+    print("✅ simulated fleet test passed")
+
+def test_lambda_handler_deadline_continuation():
+    """Test that the handler stops big servers first and defers the rest near the deadline."""
+    print("Testing lambda_handler deadline and continuation...")
+    
+    sagemaker = FakeSageMaker()
+    for i, size in enumerate(['Small', 'Large', 'Medium', 'Small', 'Large', 'Medium']):
+        sagemaker.add_server(f'server-{i}', 'Started', size=size)
+    
+    class Context:
+        # Plenty of time for the first three stop calls, then too little
+        def get_remaining_time_in_millis(self):
+            return 60000 if sagemaker.call_counts['StopMlflowTrackingServer'] < 3 else 5000
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        queue_path = os.path.join(tmp, 'continuations.json')
+        event = {'full_details': True, 'stop_concurrency': 1, 'stop_rate_per_second': 0, 'continuation_queue': queue_path}
+        
+        with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker), \
+             patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink', return_value=lambda_stop_mlflow_servers.InMemoryMetricsSink()):
+            first = json.loads(lambda_handler(event, Context())['body'])
+            
+            assert first['stopped_servers'] == ['server-1', 'server-4', 'server-2'], first['stopped_servers']
+            assert first['servers_failed'] == 0
+            assert first['servers_deferred'] == 3
+            assert first['continuation']['targets'][0]['servers'] == ['server-5', 'server-0', 'server-3']
+            assert len(lambda_stop_mlflow_servers.FileContinuationQueue(queue_path)) == 1
+            
+            # The next invocation picks the token up from the queue and finishes the job
+            second = json.loads(lambda_handler(event, FakeLambdaContext(60))['body'])
+    
+    assert sorted(second['stopped_servers']) == ['server-0', 'server-3', 'server-5']
+    assert 'continuation' not in second
+    assert set(sagemaker.statuses().values()) == {'Stopped'}
+    
+    print("✅ deadline continuation test passed")
+
+def test_summary_mode_orders_by_size():
+    """Test that without full details the running servers are described for their size and ordered by it."""
+    print("Testing size ordering from summaries...")
+    
+    now = datetime.now(timezone.utc)
+    sagemaker = FakeSageMaker()
+    for i, size in enumerate(['Small', 'Large', 'Medium', 'Small', 'Large']):
+        # older servers first, so ordering by LastModifiedTime alone would keep the listing order
+        sagemaker.add_server(f'server-{i}', 'Started', size=size, last_modified=now - timedelta(hours=10 - i))
+    for i in range(5, 8):
+        sagemaker.add_server(f'server-{i}', 'Stopped', size='Large')
+    
+    class Context:
+        # Time for the two Large servers only
+        def get_remaining_time_in_millis(self):
+            return 60000 if sagemaker.call_counts['StopMlflowTrackingServer'] < 2 else 5000
+    
+    event = {'stop_concurrency': 1, 'stop_rate_per_second': 0}
+    with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker), \
+         patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink', return_value=lambda_stop_mlflow_servers.InMemoryMetricsSink()):
+        result = json.loads(lambda_handler(event, Context())['body'])
+    
+    assert result['stopped_servers'] == ['server-1', 'server-4'], result['stopped_servers']
+    assert result['continuation']['targets'][0]['servers'] == ['server-2', 'server-0', 'server-3']
+    assert sagemaker.call_counts['DescribeMlflowTrackingServer'] == 5, "Only running servers should be described"
+    
+    print("✅ size ordering test passed")
+
+def test_continuation_survives_failed_invocation():
+    """Test that a queued continuation is only removed once an invocation has finished with it."""
+    print("Testing continuation acknowledgement...")
+    
+    sagemaker = FakeSageMaker()
+    for i in range(3):
+        sagemaker.add_server(f'server-{i}', 'Started')
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        queue_path = os.path.join(tmp, 'continuations.json')
+        queue = lambda_stop_mlflow_servers.FileContinuationQueue(queue_path, max_attempts=2)
+        queue.push(lambda_stop_mlflow_servers.build_continuation(
+            [{'region': None, 'role_arn': None, 'deferred_servers': ['server-0', 'server-2']}]))
+        event = {'stop_rate_per_second': 0, 'continuation_queue': queue_path}
+        
+        with patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker), \
+             patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink', return_value=lambda_stop_mlflow_servers.InMemoryMetricsSink()):
+            with patch.object(lambda_stop_mlflow_servers, 'process_target', side_effect=RuntimeError('timed out')):
+                failed = lambda_handler(event, FakeLambdaContext(60))
+            assert failed['statusCode'] == 500
+            assert len(queue) == 1, "A failed invocation must leave its continuation queued"
+            
+            done = json.loads(lambda_handler(event, FakeLambdaContext(60))['body'])
+            assert sorted(done['stopped_servers']) == ['server-0', 'server-2']
+            assert len(queue) == 0, "A finished continuation should be acknowledged"
+            assert sagemaker.statuses()['server-1'] == 'Started', "Only the deferred servers are resumed"
+            
+            # a token whose invocations keep failing is eventually dropped
+            queue.push({'version': 1, 'targets': [{'region': None, 'role_arn': None, 'servers': ['server-1']}]})
+            with patch.object(lambda_stop_mlflow_servers, 'process_target', side_effect=RuntimeError('timed out')):
+                for _ in range(2):
+                    lambda_handler(event, FakeLambdaContext(60))
+            assert len(queue) == 1 and queue.claim() is None and len(queue) == 0
+    
+    print("✅ continuation acknowledgement test passed")
+
+def test_lambda_handler_idle_policy():
+    """Test that only idle servers are stopped and dry runs stop nothing."""
+    print("Testing lambda_handler idle policy...")
+    
+    now = datetime.now(timezone.utc)
+    sagemaker = FakeSageMaker()
+    sagemaker.add_server('busy', 'Started', last_modified=now - timedelta(minutes=5))
+    sagemaker.add_server('logging', 'Started', last_modified=now - timedelta(hours=6))
+    sagemaker.add_server('idle', 'Started', last_modified=now - timedelta(hours=6))
+    
+    # A custom probe: 'logging' had a run logged to it ten minutes ago
+    # (registered inside patch.dict, so it does not leak into later tests)
+    recent_runs = {'logging': now - timedelta(minutes=10)}
+    event = {'idle_threshold_minutes': 60, 'activity_probes': ['last_modified', 'recent_runs'], 'stop_rate_per_second': 0}
+    
+    with patch.dict(lambda_stop_mlflow_servers.ACTIVITY_PROBE_FUNCTIONS), \
+         patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker), \
+         patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink', return_value=lambda_stop_mlflow_servers.InMemoryMetricsSink()):
+        lambda_stop_mlflow_servers.register_activity_probe('recent_runs', lambda server, client: recent_runs.get(server['TrackingServerName']))
+        dry = json.loads(lambda_handler(dict(event, dry_run=True), Mock())['body'])
+        assert dry['dry_run'] is True
+        assert dry['servers_stopped'] == 0
+        assert dry['would_stop'] == ['idle']
+        assert sagemaker.call_counts['StopMlflowTrackingServer'] == 0
+        
+        report = {entry['name']: entry for entry in dry['idle_report']}
+        assert report['logging']['decision'] == 'keep'
+        assert report['logging']['signals']['recent_runs'] is not None
+        assert report['idle']['score'] >= 6
+        
+        result = json.loads(lambda_handler(event, Mock())['body'])
+    
+    assert 'recent_runs' not in lambda_stop_mlflow_servers.ACTIVITY_PROBE_FUNCTIONS
+    assert result['stopped_servers'] == ['idle']
+    assert sorted(result['kept_active_servers']) == ['busy', 'logging']
+    assert sagemaker.statuses() == {'busy': 'Started', 'logging': 'Started', 'idle': 'Stopped'}
+    
+    print("✅ idle policy test passed")
+
+def test_lazy_cached_clients():
+    """Test that clients are built on first use, cached per region and tuned."""
+    print("Testing lazy client construction...")
+    
+    lambda_stop_mlflow_servers.reset_clients()
+    with patch('boto3.client') as mock_boto3_client:
+        mock_boto3_client.side_effect = lambda service, **kwargs: Mock(name=f"{service}-{kwargs.get('region_name')}")
+        
+        first = lambda_stop_mlflow_servers.get_sagemaker_client()
+        assert lambda_stop_mlflow_servers.get_sagemaker_client() is first
+        other_region = lambda_stop_mlflow_servers.get_sagemaker_client('eu-west-1')
+        assert other_region is not first
+        assert mock_boto3_client.call_count == 2
+        
+        config = mock_boto3_client.call_args[1]['config']
+        assert config.max_pool_connections >= lambda_stop_mlflow_servers.STOP_CONCURRENCY
+        assert 'sagemaker/eu-west-1' in lambda_stop_mlflow_servers.COLD_START_TIMINGS['client_init_ms']
+    
+    lambda_stop_mlflow_servers.reset_clients()
+    print("✅ lazy client test passed")
+
 def test_send_metrics():
     """Test the send_metrics function."""
     print("Testing send_metrics function...")
     
+    lambda_stop_mlflow_servers.reset_clients()
     with patch('boto3.client') as mock_boto3_client:
         # Create mock CloudWatch client
         mock_cloudwatch_client = Mock()
         mock_boto3_client.return_value = mock_cloudwatch_client
         
-        # Call the function
-        send_metrics(2, 1, 3, False)
+        # Call the function with the PutMetricData backend
+        send_metrics(2, 1, 3, False, sink=lambda_stop_mlflow_servers.get_metrics_sink('api'))
         
         # Verify that put_metric_data was called
         mock_cloudwatch_client.put_metric_data.assert_called_once()
@@ -130,7 +654,40 @@ def test_send_metrics():
         expected_names = ['ServersStopped', 'ServersFailed', 'TotalServers', 'ShutdownSuccess']
         assert set(metric_names) == set(expected_names), f"Expected {expected_names}, got {metric_names}"
         
-        print("✅ send_metrics test passed")
+    lambda_stop_mlflow_servers.reset_clients()
+    print("✅ send_metrics test passed")
+
+def test_send_metrics_emf():
+    """Test that the default EMF backend writes log records instead of calling the API."""
+    print("Testing send_metrics EMF backend...")
+    
+    stream = io.StringIO()
+    servers = [
+        {'name': 'a', 'outcome': 'Stopped', 'stop_call_seconds': 0.25, 'seconds_to_stop': 90.0},
+        {'name': 'b', 'outcome': 'Failed', 'stop_call_seconds': 0.5, 'seconds_to_stop': None}
+    ]
+    
+    with patch('boto3.client') as mock_boto3_client:
+        send_metrics(1, 1, 2, sink=lambda_stop_mlflow_servers.EmfMetricsSink(stream=stream), servers=servers)
+        mock_boto3_client.assert_not_called()
+    
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(records) == 3, f"Expected one record per dimension set, got {len(records)}"
+    
+    aggregate = records[0]
+    directive = aggregate['_aws']['CloudWatchMetrics'][0]
+    assert directive['Namespace'] == 'MLflowTrackingServer/Shutdown'
+    assert directive['Dimensions'] == [[]]
+    assert aggregate['ServersStopped'] == 1 and aggregate['ShutdownSuccess'] == 1
+    
+    by_server = {r['ServerName']: r for r in records[1:]}
+    assert by_server['a']['Outcome'] == 'Stopped'
+    assert by_server['a']['SecondsToStop'] == 90.0
+    assert by_server['b']['StopCallDuration'] == 0.5
+    assert 'SecondsToStop' not in by_server['b']
+    assert sorted(by_server['a']['_aws']['CloudWatchMetrics'][0]['Dimensions'][0]) == ['Outcome', 'ServerName']
+    
+    print("✅ send_metrics EMF test passed")
 
 def test_lambda_handler_success():
     """Test the lambda_handler function with successful execution."""
@@ -138,11 +695,14 @@ def test_lambda_handler_success():
     
     domains_response, mlflow_servers_response = create_mock_sagemaker_response()
     
+    lambda_stop_mlflow_servers.reset_clients()
     with patch('boto3.client') as mock_boto3_client:
         # Create mock clients
         mock_sagemaker_client = Mock()
         mock_cloudwatch_client = Mock()
-        mock_boto3_client.side_effect = [mock_sagemaker_client, mock_cloudwatch_client]
+        mock_boto3_client.side_effect = lambda service, **kwargs: {
+            'sagemaker': mock_sagemaker_client, 'cloudwatch': mock_cloudwatch_client
+        }[service]
         
         # Mock the list_domains call
         mock_sagemaker_client.list_domains.return_value = domains_response
@@ -201,21 +761,24 @@ def test_lambda_handler_no_running_servers():
     
     # All servers are stopped
     mlflow_servers_response = {
-        'MlflowTrackingServers': [
+        'TrackingServerSummaries': [
             {
-                'MlflowTrackingServerName': 'mlflow-server-1',
-                'MlflowTrackingServerArn': 'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/mlflow-server-1',
-                'Status': 'Stopped',
+                'TrackingServerName': 'mlflow-server-1',
+                'TrackingServerArn': 'arn:aws:sagemaker:us-east-1:123456789012:mlflow-tracking-server/mlflow-server-1',
+                'TrackingServerStatus': 'Stopped',
                 'DomainId': 'd-1234567890abcdef'
             }
         ]
     }
     
+    lambda_stop_mlflow_servers.reset_clients()
     with patch('boto3.client') as mock_boto3_client:
         # Create mock clients
         mock_sagemaker_client = Mock()
         mock_cloudwatch_client = Mock()
-        mock_boto3_client.side_effect = [mock_sagemaker_client, mock_cloudwatch_client]
+        mock_boto3_client.side_effect = lambda service, **kwargs: {
+            'sagemaker': mock_sagemaker_client, 'cloudwatch': mock_cloudwatch_client
+        }[service]
         
         # Mock the list_domains call
         mock_sagemaker_client.list_domains.return_value = domains_response
@@ -251,11 +814,14 @@ def test_lambda_handler_error():
     """Test the lambda_handler function with an error."""
     print("Testing lambda_handler function (error case)...")
     
+    lambda_stop_mlflow_servers.reset_clients()
     with patch('boto3.client') as mock_boto3_client:
         # Create mock clients
         mock_sagemaker_client = Mock()
         mock_cloudwatch_client = Mock()
-        mock_boto3_client.side_effect = [mock_sagemaker_client, mock_cloudwatch_client]
+        mock_boto3_client.side_effect = lambda service, **kwargs: {
+            'sagemaker': mock_sagemaker_client, 'cloudwatch': mock_cloudwatch_client
+        }[service]
         
         # Mock the list_domains call to raise an exception
         mock_sagemaker_client.list_domains.side_effect = Exception("Test error")
@@ -285,7 +851,22 @@ def main():
     
     try:
         test_list_mlflow_tracking_servers()
+        test_list_mlflow_tracking_servers_parallel()
+        test_call_with_retry_throttling()
+        test_lambda_handler_summary_fast_path()
+        test_stop_tracking_servers_concurrent()
+        test_lambda_handler_wait_for_stop()
+        test_lambda_handler_multi_target()
+        test_lambda_handler_large_simulated_fleet()
+        test_lambda_handler_deadline_continuation()
+        test_summary_mode_orders_by_size()
+        test_continuation_survives_failed_invocation()
+        test_lambda_handler_idle_policy()
+        test_lazy_cached_clients()
+        test_state_store_skips_unchanged_and_detects_restarts()
+        test_state_store_in_summary_mode()
         test_send_metrics()
+        test_send_metrics_emf()
         test_lambda_handler_success()
         test_lambda_handler_no_running_servers()
         test_lambda_handler_error()
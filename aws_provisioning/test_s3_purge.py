@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test script for the S3 bucket purge engine.
+Runs the purger against the in-process S3 stub in fake_aws.py.
+"""
+
+import os
+import sys
+
+# Add the current directory to the path so we can import the purger
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from botocore.exceptions import EndpointConnectionError
+    from s3_purge import BucketPurger, iter_versions, list_buckets
+    from fake_aws import FakeS3
+except ImportError:
+    print("Error: Could not import s3_purge. Make sure the file exists.")
+    sys.exit(1)
+
+
+def make_purger(s3, **kwargs):
+    return BucketPurger(s3, log=lambda line: None, **kwargs)
+
+
+def test_listing_covers_every_page():
+    """Test that versions and delete markers beyond the first page are all listed."""
+    print("Testing version listing...")
+
+    s3 = FakeS3(page_size=250)
+    s3.add_bucket('artifacts', objects=900, versions=2, delete_markers=True)
+
+    entries = list(iter_versions(s3, 'artifacts'))
+    assert len(entries) == 2700, f"Expected 2700 versions and markers, got {len(entries)}"
+    assert len({(e['Key'], e['VersionId']) for e in entries}) == 2700, "Entries should not repeat across pages"
+    assert s3.call_counts['ListObjectVersions'] == 11
+
+    print("✅ version listing test passed")
+
+
+def test_purge_many_buckets():
+    """Test that every bucket is emptied in batches of at most 1000 keys and then deleted."""
+    print("Testing purge...")
+
+    s3 = FakeS3(page_size=700)
+    for i in range(6):
+        s3.add_bucket(f'team{i}-artifacts', objects=1200, versions=2, delete_markers=(i % 2 == 0))
+    s3.add_bucket('team-empty-artifacts')
+    s3.add_bucket('nyp-aicourse', objects=10)
+
+    buckets = list_buckets(s3)
+    assert 'nyp-aicourse' not in buckets, "The protected bucket must never be listed for purging"
+
+    results = make_purger(s3, bucket_workers=3, delete_workers=4).purge(buckets)
+    assert [r['bucket'] for r in results] == buckets
+    assert all(r['bucket_deleted'] and not r['errors'] for r in results)
+    assert sum(r['deleted'] for r in results) == 3 * 3600 + 3 * 2400
+    assert s3.object_counts() == {'nyp-aicourse': 10}
+    assert s3.max_batch == 1000, f"Batches should be filled up to 1000 keys, largest was {s3.max_batch}"
+
+    try:
+        make_purger(s3).purge(['nyp-aicourse'])
+        assert False, "Purging the protected bucket should be refused"
+    except ValueError:
+        pass
+
+    print("✅ purge test passed")
+
+
+def test_dry_run_and_errors():
+    """Test that a dry run deletes nothing and that failed keys keep the bucket."""
+    print("Testing dry run and errors...")
+
+    s3 = FakeS3()
+    s3.add_bucket('team1-artifacts', objects=1500)
+    results = make_purger(s3, dry_run=True).purge(['team1-artifacts', 'missing-bucket'])
+    assert results[0]['listed'] == 1500
+    assert s3.call_counts['DeleteObjects'] == 0 and s3.call_counts['DeleteBucket'] == 0
+    assert s3.object_counts() == {'team1-artifacts': 1500}
+    assert results[1]['errors'] and 'NoSuchBucket' in results[1]['reason']
+
+    s3.fail_keys = {'artifacts/00000007.bin'}
+    result = make_purger(s3).purge(['team1-artifacts'])[0]
+    assert result['deleted'] == 1499
+    assert result['errors'] == 1 and 'AccessDenied' in result['reason']
+    assert not result['bucket_deleted'], "A bucket with undeleted objects should not be deleted"
+    assert s3.object_counts() == {'team1-artifacts': 1}
+
+    print("✅ dry run and errors test passed")
+
+
+def test_connection_error_is_per_bucket():
+    """Test that a non-API error (no connection) fails its own bucket while the others finish."""
+    print("Testing connection errors...")
+
+    s3 = FakeS3()
+    for name in ('team1-artifacts', 'team2-artifacts', 'team3-artifacts'):
+        s3.add_bucket(name, objects=1500)
+    delete_objects = s3.delete_objects
+    list_object_versions = s3.list_object_versions
+
+    def unreachable(operation, bucket):
+        def call(**kwargs):
+            if kwargs['Bucket'] == bucket:
+                raise EndpointConnectionError(endpoint_url=f'https://{bucket}.s3.amazonaws.com')
+            return operation(**kwargs)
+        return call
+
+    s3.delete_objects = unreachable(delete_objects, 'team2-artifacts')
+    s3.list_object_versions = unreachable(list_object_versions, 'team3-artifacts')
+    results = {r['bucket']: r for r in make_purger(s3, bucket_workers=1).purge(sorted(s3.object_counts()))}
+
+    assert results['team1-artifacts']['bucket_deleted']
+    assert results['team2-artifacts']['errors'] == 1500 and not results['team2-artifacts']['bucket_deleted']
+    assert 'EndpointConnectionError' in results['team2-artifacts']['reason']
+    assert results['team3-artifacts']['errors'] == 1 and 'EndpointConnectionError' in results['team3-artifacts']['reason']
+    assert s3.object_counts() == {'team2-artifacts': 1500, 'team3-artifacts': 1500}
+
+    print("✅ connection error test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting S3 purge tests...\n")
+
+    try:
+        test_listing_covers_every_page()
+        test_purge_many_buckets()
+        test_dry_run_and_errors()
+        test_connection_error_is_per_bucket()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Test script for the tracing module in demo_apps/ and its use in the shutdown Lambda.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+from unittest.mock import patch
+
+# Add the current directory to the path so we can import the modules under test,
+# and demo_apps/, which holds the tracing module the Lambda package includes
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'demo_apps'))
+sys.path.insert(0, HERE)
+
+# Clients need a region to be constructed outside Lambda
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+try:
+    import lambda_stop_mlflow_servers
+    import tracing
+    from tracing import Tracer, load_trace
+    from fake_aws import FakeSageMaker, FakeLambdaContext
+except ImportError:
+    print("Error: Could not import tracing. Make sure the file exists.")
+    sys.exit(1)
+
+
+def test_disabled_tracer_records_nothing():
+    """Test that a tracer without a path hands out the shared no-op span."""
+    print("Testing disabled tracer...")
+
+    tracer = Tracer()
+    assert not tracer.enabled
+    assert tracer.span('anything', rows=1) is tracing.NO_SPAN
+
+    @tracer.traced('work')
+    def work(x):
+        return x * 2
+
+    with tracer.span('outer') as span:
+        span.set(rows=3)
+        assert work(21) == 42
+    assert tracer.events == [] and tracer.export() is None
+
+    print("✅ disabled tracer test passed")
+
+
+def test_nested_spans_export():
+    """Test nesting, threads, errors and the exported trace format."""
+    print("Testing span export...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'traces', 'trace.json')
+        tracer = Tracer(path, max_events=5)
+
+        @tracer.traced('inner')
+        def inner():
+            with tracer.span('leaf', step=1):
+                pass
+
+        with tracer.span('outer'):
+            inner()
+            worker = threading.Thread(target=lambda: tracer.span('thread').__enter__().__exit__(None, None, None))
+            worker.start()
+            worker.join()
+        try:
+            with tracer.span('failing'):
+                raise KeyError('x')
+        except KeyError:
+            pass
+
+        assert tracer.export() == path
+        with open(path) as f:
+            trace = json.load(f)
+        events = {e['name']: e for e in trace['traceEvents']}
+        assert set(events) == {'outer', 'inner', 'leaf', 'thread', 'failing'}, f"Unexpected spans {set(events)}"
+        assert all(e['ph'] == 'X' for e in events.values())
+        outer, leaf = events['outer'], events['leaf']
+        assert outer['ts'] <= leaf['ts'] and leaf['ts'] + leaf['dur'] <= outer['ts'] + outer['dur'], \
+            "The leaf span should lie inside the outer span"
+        assert leaf['args'] == {'step': 1}
+        assert events['thread']['tid'] != outer['tid']
+        assert events['failing']['args']['error'] == 'KeyError'
+
+        # Past max_events spans are only counted
+        with tracer.span('extra'):
+            pass
+        assert tracer.dropped == 1 and tracer.summary()['outer']['count'] == 1
+
+    print("✅ span export test passed")
+
+
+def test_export_and_clear():
+    """Test that export(clear=True) writes only the spans since the previous export."""
+    print("Testing export with clear...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'trace.json')
+        tracer = Tracer(path)
+        for run in range(3):
+            with tracer.span('rerun', run=run):
+                pass
+            tracer.export(clear=True)
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+            assert [e['args']['run'] for e in events] == [run], f"Export {run} should only hold its own span"
+        assert tracer.events == [] and tracer.summary() == {}
+
+    print("✅ export with clear test passed")
+
+
+def test_export_append():
+    """Test that appending exports keep every span, written once, in a file the viewers and load_trace read."""
+    print("Testing appending exports...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'trace.json')
+        tracer = Tracer(path, max_events=2)
+        for run in range(3):
+            with tracer.span('rerun', run=run):
+                pass
+            tracer.export(append=True)
+        assert tracer.events == []
+        assert [e['args']['run'] for e in load_trace(path)] == [0, 1, 2]
+
+        # a second tracer (another process) appends to the same file
+        other = Tracer(path)
+        threads = [threading.Thread(target=lambda: other.span('worker').__enter__().__exit__(None, None, None))
+                   for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        other.export(append=True)
+
+        # spans past max_events are reported as a counter event
+        for run in range(3, 6):
+            with tracer.span('rerun', run=run):
+                pass
+        tracer.export(append=True)
+
+        events = load_trace(path)
+        assert [e['name'] for e in events].count('worker') == 20
+        assert [e['args']['run'] for e in events if e['name'] == 'rerun'] == [0, 1, 2, 3, 4]
+        assert events[-1]['name'] == 'dropped_events' and events[-1]['args'] == {'dropped': 1}
+        with open(path) as f:
+            text = f.read()
+        assert text.startswith('[\n') and text.count('[\n') == 1, "The array should be opened once"
+        assert json.loads(text.rstrip().rstrip(',') + ']') == events
+
+        # a trace written without append reads the same way
+        assert Tracer(os.path.join(tmp, 'plain.json')).export() and load_trace(os.path.join(tmp, 'plain.json')) == []
+
+    print("✅ appending export test passed")
+
+
+def test_lambda_invocation_trace():
+    """Test that a traced handler run writes one trace per invocation with the shutdown phases."""
+    print("Testing Lambda tracing...")
+
+    sagemaker = FakeSageMaker.with_fleet(40, running_fraction=0.5, seed=3)
+    running = sum(1 for status in sagemaker.statuses().values() if status == 'Started')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'trace.json')
+        with patch.object(lambda_stop_mlflow_servers, 'tracer', Tracer(path)), \
+             patch.object(lambda_stop_mlflow_servers, 'get_sagemaker_client', return_value=sagemaker), \
+             patch.object(lambda_stop_mlflow_servers, 'get_metrics_sink',
+                          return_value=lambda_stop_mlflow_servers.InMemoryMetricsSink()):
+            result = lambda_stop_mlflow_servers.lambda_handler({'stop_rate_per_second': 0}, FakeLambdaContext())
+        assert result['statusCode'] == 200
+        with open(path) as f:
+            names = [e['name'] for e in json.load(f)['traceEvents']]
+        assert names.count('lambda_handler') == 1
+        assert names.count('stop') == running, f"Expected one stop span per running server, got {names.count('stop')}"
+        assert {'list_servers', 'process_target', 'stop_servers', 'send_metrics'} <= set(names)
+
+    print("✅ Lambda tracing test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting tracing tests...\n")
+
+    try:
+        test_disabled_tracer_records_nothing()
+        test_nested_spans_export()
+        test_export_and_clear()
+        test_export_append()
+        test_lambda_invocation_trace()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Batch scoring of patient records with the heart failure model.
+
+Reads a CSV or Parquet file containing the 12 model features (see schema.py),
+scores it chunk by chunk with one model.predict call per chunk and writes the
+input rows plus a `prediction` column.  Only one chunk is held in memory at a
+time, so files with millions of rows can be scored on a small machine.
+
+Usage:
+    python batch_score.py patients.csv -o scored.csv
+    python batch_score.py patients.parquet -o scored.parquet --chunksize 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import IO, Iterator, Union
+
+import numpy as np
+import pandas as pd
+
+from model_registry import MODEL_PATH, registry
+from prediction_cache import predict_unique
+from schema import FEATURES
+
+DEFAULT_CHUNKSIZE = 50_000
+PREDICTION_COLUMN = 'prediction'
+
+Source = Union[str, IO[bytes]]
+
+
+def detect_format(name: str) -> str:
+    """Return 'csv' or 'parquet' based on a file name's extension."""
+    ext = os.path.splitext(name)[1].lower()
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    if ext in ('.csv', '.txt', ''):
+        return 'csv'
+    raise ValueError(f"Unsupported file type '{ext}'. Use .csv or .parquet")
+
+
+def check_columns(columns) -> None:
+    """Raise ValueError if any of the model features is missing."""
+    missing = [c for c in FEATURES if c not in columns]
+    if missing:
+        raise ValueError(f"Input is missing required columns: {', '.join(missing)}")
+
+
+def iter_chunks(src: Source, fmt: str, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """
+    Yield the input file as DataFrames of at most chunksize rows.
+
+    Args:
+        src: Path or binary file object
+        fmt: 'csv' or 'parquet'
+        chunksize: Maximum rows per chunk
+    """
+    if fmt == 'csv':
+        with pd.read_csv(src, chunksize=chunksize) as reader:
+            for chunk in reader:
+                check_columns(chunk.columns)
+                yield chunk
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(src)
+        check_columns(pf.schema_arrow.names)
+        for batch in pf.iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported format '{fmt}'")
+
+
+def feature_matrix(df: pd.DataFrame) -> np.ndarray:
+    """Return the model features of df as a float array in training order."""
+    return df[FEATURES].to_numpy(dtype=np.float64)
+
+
+def score_chunk(model, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Score every row of df with a single model.predict call.  Duplicate rows
+    within the chunk are only scored once.
+    """
+    y = predict_unique(model.predict, feature_matrix(df))
+    out = df.copy()
+    out[PREDICTION_COLUMN] = np.asarray(y).astype(np.int8)
+    return out
+
+
+def iter_scored(src: Source, fmt: str, model=None,
+                chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """Yield scored chunks of the input file."""
+    if model is None:
+        model = registry.get(MODEL_PATH).model
+    for chunk in iter_chunks(src, fmt, chunksize):
+        if len(chunk):
+            yield score_chunk(model, chunk)
+
+
+def score_file(src: Source, dst: Union[str, IO], in_fmt: str, out_fmt: str,
+               model=None, chunksize: int = DEFAULT_CHUNKSIZE) -> int:
+    """
+    Score src and stream the results to dst.
+
+    Args:
+        src: Input path or binary file object
+        dst: Output path or file object (text for csv, binary for parquet)
+        in_fmt: Input format, 'csv' or 'parquet'
+        out_fmt: Output format, 'csv' or 'parquet'
+        model: Fitted model; defaults to the registry's model.pkl
+        chunksize: Maximum rows scored per model.predict call
+
+    Returns:
+        Number of rows scored
+    """
+    rows = 0
+    writer = None
+    try:
+        for scored in iter_scored(src, in_fmt, model, chunksize):
+            if out_fmt == 'csv':
+                scored.to_csv(dst, header=(rows == 0), index=False)
+            elif out_fmt == 'parquet':
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(scored, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(dst, table.schema)
+                writer.write_table(table)
+            else:
+                raise ValueError(f"Unsupported format '{out_fmt}'")
+            rows += len(scored)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a CSV/Parquet file of patient records.')
+    parser.add_argument('input', help='CSV or Parquet file with the 12 model features')
+    parser.add_argument('-o', '--output', required=True, help='Output CSV or Parquet file')
+    parser.add_argument('-m', '--model', default=MODEL_PATH, help='Pickled model (default: %(default)s)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='Rows per model.predict call (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    in_fmt = detect_format(args.input)
+    out_fmt = detect_format(args.output)
+    model = registry.get(args.model).model
+
+    start = time.perf_counter()
+    if out_fmt == 'csv':
+        with open(args.output, 'w', newline='') as dst:
+            rows = score_file(args.input, dst, in_fmt, out_fmt, model, args.chunksize)
+    else:
+        rows = score_file(args.input, args.output, in_fmt, out_fmt, model, args.chunksize)
+    elapsed = time.perf_counter() - start
+
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Scored {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s) -> {args.output}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
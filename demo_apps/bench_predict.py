@@ -0,0 +1,269 @@
+"""
+Inference latency benchmark for the heart failure model.
+
+Measures, for a given model file:
+    - model load time (read + unpickle, or mmap for a model_artifact.py
+      directory) and app startup (fresh interpreter
+      importing the app's dependencies and loading the model)
+    - predict() latency at several batch sizes (p50/p99, rows/s)
+    - concurrent single-row predict() from a thread pool
+    - peak RSS of each scenario (every scenario runs in its own process)
+
+Inputs are synthetic rows drawn from the sidebar input ranges (schema.py)
+with a fixed seed, so runs are reproducible.  Results are written as JSON
+and can be compared against an earlier run, e.g. a retrained model.pkl or a
+different scikit-learn version.
+
+Usage:
+    python bench_predict.py -o bench-current.json
+    python bench_predict.py -m retrained.pkl -o bench-new.json --compare bench-current.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from model_registry import MODEL_PATH, registry
+from schema import synthetic_rows
+
+DEFAULT_BATCH_SIZES = [1, 32, 1000, 100_000]
+DEFAULT_THREADS = 8
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def summarize(latencies_s, rows_per_call: int) -> dict:
+    lat_ms = np.asarray(latencies_s) * 1000.0
+    total_s = float(np.sum(latencies_s))
+    return {
+        'calls': len(lat_ms),
+        'p50_ms': round(float(np.percentile(lat_ms, 50)), 4),
+        'p99_ms': round(float(np.percentile(lat_ms, 99)), 4),
+        'mean_ms': round(float(lat_ms.mean()), 4),
+        'rows_per_s': round(len(lat_ms) * rows_per_call / total_s, 1) if total_s > 0 else 0.0,
+    }
+
+
+def iterations_for(batch_size: int) -> int:
+    """Fewer repetitions for big batches, enough for a stable p99 on small ones."""
+    return max(5, min(1000, 200_000 // batch_size))
+
+
+def bench_load(model_path: str, repeats: int) -> dict:
+    import pickle
+
+    import model_artifact
+
+    def load_once():
+        start = time.perf_counter()
+        if model_artifact.is_artifact(model_path):
+            model_artifact.load(model_path)
+            size = sum(os.path.getsize(name) for name in model_artifact.artifact_files(model_path))
+        else:
+            with open(model_path, 'rb') as f:
+                data = f.read()
+            pickle.loads(data)
+            size = len(data)
+        return time.perf_counter() - start, size
+
+    # the first load also pays for importing sklearn, so it is reported separately
+    cold, size = load_once()
+    times = [load_once()[0] for _ in range(repeats)]
+    result = summarize(times, 1)
+    del result['rows_per_s']
+    result['cold_ms'] = round(cold * 1000.0, 2)
+    result['file_bytes'] = size
+    return result
+
+
+def bench_batch(model_path: str, batch_size: int, seed: int) -> dict:
+    model = registry.get(model_path).model
+    n = iterations_for(batch_size)
+    pool = synthetic_rows(batch_size * min(n, 10), seed)
+    batches = [pool[i * batch_size:(i + 1) * batch_size] for i in range(min(n, 10))]
+
+    for X in batches[:3]:
+        model.predict(X)
+
+    times = []
+    for i in range(n):
+        X = batches[i % len(batches)]
+        start = time.perf_counter()
+        model.predict(X)
+        times.append(time.perf_counter() - start)
+    return summarize(times, batch_size)
+
+
+def bench_concurrent(model_path: str, threads: int, calls: int, seed: int) -> dict:
+    model = registry.get(model_path).model
+    X = synthetic_rows(calls, seed)
+    model.predict(X[:1])
+
+    def one(i):
+        start = time.perf_counter()
+        model.predict(X[i:i + 1])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        times = list(pool.map(one, range(calls)))
+    wall = time.perf_counter() - start
+
+    result = summarize(times, 1)
+    # with threads the wall clock, not the summed latency, bounds throughput
+    result['rows_per_s'] = round(calls / wall, 1)
+    result['threads'] = threads
+    return result
+
+
+def bench_startup(model_path: str, repeats: int) -> dict:
+    """Time a fresh interpreter importing the app's dependencies and loading the model."""
+    code = (
+        'import time; t = time.perf_counter()\n'
+        'import pandas, numpy, streamlit\n'
+        't_import = time.perf_counter() - t\n'
+        'from model_registry import registry\n'
+        f'registry.get({model_path!r})\n'
+        'print(t_import, time.perf_counter() - t)\n'
+    )
+    imports, totals = [], []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=APP_DIR,
+                             capture_output=True, text=True, check=True).stdout.split()
+        imports.append(float(out[0]))
+        totals.append(float(out[1]))
+    return {
+        'runs': repeats,
+        'import_ms': round(float(np.median(imports)) * 1000.0, 2),
+        'import_and_load_ms': round(float(np.median(totals)) * 1000.0, 2),
+    }
+
+
+def run_scenario(name: str, kwargs: dict) -> dict:
+    """Entry point of the per-scenario worker process."""
+    import warnings
+
+    warnings.filterwarnings('ignore')
+    fn = {'load': bench_load, 'batch': bench_batch, 'concurrent': bench_concurrent}[name]
+    result = fn(**kwargs)
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    return result
+
+
+def isolated(name: str, **kwargs) -> dict:
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(run_scenario, name, kwargs).result()
+
+
+def library_versions() -> dict:
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    for module in ('sklearn', 'pandas', 'streamlit'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return versions
+
+
+def run_all(model_path: str, batch_sizes, threads: int, seed: int, startup: bool) -> dict:
+    model_path = os.path.abspath(model_path)
+    loaded = registry.get(model_path)
+    results = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'model_path': model_path,
+            'model_version': loaded.version,
+            'seed': seed,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'versions': library_versions(),
+        },
+        'load': isolated('load', model_path=model_path, repeats=20),
+        'batch': {},
+    }
+
+    for bs in batch_sizes:
+        print(f"batch size {bs} ...", file=sys.stderr)
+        results['batch'][str(bs)] = isolated('batch', model_path=model_path, batch_size=bs, seed=seed)
+
+    print(f"concurrent ({threads} threads) ...", file=sys.stderr)
+    results['concurrent'] = isolated('concurrent', model_path=model_path, threads=threads,
+                                     calls=2000, seed=seed)
+    if startup:
+        print("startup ...", file=sys.stderr)
+        results['startup'] = bench_startup(model_path, repeats=3)
+    return results
+
+
+def compare(current: dict, baseline: dict) -> str:
+    """Render a table of current vs baseline p50/p99 latency and throughput."""
+    lines = [f"{'scenario':<16}{'metric':<12}{'baseline':>12}{'current':>12}{'ratio':>8}"]
+
+    def row(scenario, metric, old, new):
+        if old is None or new is None:
+            return
+        ratio = new / old if old else float('nan')
+        lines.append(f"{scenario:<16}{metric:<12}{old:>12.4f}{new:>12.4f}{ratio:>8.2f}")
+
+    for metric in ('cold_ms', 'p50_ms'):
+        row('load', metric, baseline.get('load', {}).get(metric), current['load'][metric])
+    for bs, res in current['batch'].items():
+        old = baseline.get('batch', {}).get(bs, {})
+        for metric in ('p50_ms', 'p99_ms', 'rows_per_s'):
+            row(f'batch[{bs}]', metric, old.get(metric), res[metric])
+    old = baseline.get('concurrent', {})
+    for metric in ('p50_ms', 'p99_ms', 'rows_per_s'):
+        row('concurrent', metric, old.get(metric), current['concurrent'][metric])
+    if 'startup' in current:
+        row('startup', 'total_ms', baseline.get('startup', {}).get('import_and_load_ms'),
+            current['startup']['import_and_load_ms'])
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark heart failure model inference.')
+    parser.add_argument('-m', '--model', default=MODEL_PATH, help='Pickled model or artifact directory (default: %(default)s)')
+    parser.add_argument('-o', '--output', help='Write JSON results to this file')
+    parser.add_argument('--batch-sizes', default=','.join(str(b) for b in DEFAULT_BATCH_SIZES),
+                        help='Comma separated batch sizes (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help='Threads for the concurrent scenario (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-startup', action='store_true', help='Skip the app startup measurement')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',')]
+    results = run_all(args.model, batch_sizes, args.threads, args.seed, not args.no_startup)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(results, json.load(f)))
+
+
+if __name__ == '__main__':
+    main()
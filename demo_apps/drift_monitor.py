@@ -0,0 +1,420 @@
+"""
+Input drift monitoring for the heart failure model.
+
+A DriftSketch keeps, for each of the 12 features, a histogram over fixed bin
+edges derived from schema.FEATURE_RANGES (plus an underflow and an overflow
+bin), the row count, min, max, sum and sum of squares, and the number of
+missing (NaN or infinite) values, which are kept out of everything else
+so one bad row cannot poison the statistics.  Its memory does not
+grow with the number of predictions, updating it for one row is a few array
+operations, and two sketches built anywhere merge by adding their arrays,
+so sketches from several worker processes combine into one.
+
+A DriftMonitor wraps the prediction path, one per process, created by the
+app that serves predictions: observe(X), called once the rows have been
+scored, updates the process's sketch and, at most every flush_interval
+seconds, writes it to <directory>/sketch-<host>-<pid>.json.  The offline
+report merges every sketch file in the directory and compares it with a
+reference file (the training data, or a sketch of it) using the population
+stability index (PSI) and the Kolmogorov-Smirnov statistic of the binned
+distributions.
+
+Usage:
+    python drift_monitor.py sketch reference.csv -o reference-sketch.json
+    python drift_monitor.py report --reference reference-sketch.json --sketches drift
+    python drift_monitor.py report --reference reference.csv --sketches drift --json
+"""
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from batch_score import detect_format, feature_matrix, iter_chunks
+from prediction_cache import as_matrix
+from schema import FEATURE_RANGES, FEATURES, N_FEATURES
+
+DRIFT_DIR = 'drift'
+DEFAULT_BINS = 20
+DEFAULT_FLUSH_INTERVAL = 60.0
+
+# Usual PSI reading: below 0.1 stable, 0.1-0.25 moderate shift, above 0.25 drift
+PSI_WARN = 0.1
+PSI_ALERT = 0.25
+
+# Empty bins are given this share so PSI stays finite
+PSI_EPSILON = 1e-4
+
+
+def one_bin_per_value(name: str, bins: int = DEFAULT_BINS) -> bool:
+    """True for integer features with no more distinct values than bins."""
+    low, high, is_integer = FEATURE_RANGES[name]
+    return is_integer and high - low + 1 <= bins
+
+
+def bin_edges(bins: int = DEFAULT_BINS) -> np.ndarray:
+    """
+    Inner bin edges per feature, shape (12, bins + 1).  Integer features with
+    fewer distinct values than bins (e.g. the yes/no inputs) get one bin per
+    value instead of empty ones; the rest is padded with the top edge.
+    """
+    edges = np.empty((N_FEATURES, bins + 1), dtype=np.float64)
+    for j, name in enumerate(FEATURES):
+        low, high, _ = FEATURE_RANGES[name]
+        if one_bin_per_value(name, bins):
+            values = np.arange(low, high + 2) - 0.5
+            edges[j] = np.concatenate([values, np.full(bins + 1 - len(values), values[-1])])
+        else:
+            edges[j] = np.linspace(low, high, bins + 1)
+    return edges
+
+
+class DriftSketch:
+    """
+    Fixed-size, mergeable summary of the feature rows seen so far.
+
+    counts[j, 0] holds values of feature j below its first edge and
+    counts[j, -1] values at or above its last edge.  Non-finite values are
+    only counted in missing[j]; histograms, sums, min/max and quantiles of
+    feature j cover its n - missing[j] finite values.
+
+    Args:
+        bins: Histogram bins per feature between its range bounds
+    """
+
+    def __init__(self, bins: int = DEFAULT_BINS):
+        self.edges = bin_edges(bins)
+        self.counts = np.zeros((N_FEATURES, bins + 2), dtype=np.int64)
+        self.n = 0
+        self.missing = np.zeros(N_FEATURES, dtype=np.int64)
+        self.sums = np.zeros(N_FEATURES)
+        self.sumsq = np.zeros(N_FEATURES)
+        self.mins = np.full(N_FEATURES, np.inf)
+        self.maxs = np.full(N_FEATURES, -np.inf)
+        # per-feature constants for the vectorised bin lookup: evenly spaced
+        # features use (x - low) / width, one-bin-per-value features x - low,
+        # and _last is the last column that is not the overflow bin
+        self._even = np.array([not one_bin_per_value(name, bins) for name in FEATURES])
+        self._low = self.edges[:, 0]
+        self._high = self.edges[:, -1]
+        self._width = np.where(self._even, (self._high - self._low) / bins, 1.0)
+        self._last = np.where(self._even, bins, np.round(self._high - self._low)).astype(np.int64)
+        self._offsets = np.arange(N_FEATURES) * (bins + 2)
+
+    @property
+    def bins(self) -> int:
+        return self.counts.shape[1] - 2
+
+    @property
+    def valid(self) -> np.ndarray:
+        """Number of finite values seen per feature."""
+        return self.n - self.missing
+
+    def bin_index(self, X: np.ndarray) -> np.ndarray:
+        """Histogram column of every value in X, shape (n, 12)."""
+        idx = np.floor((X - self._low) / self._width) + 1
+        # values on the top edge of an evenly binned range belong to the last bin
+        idx[self._even & (X == self._high)] = self.bins
+        idx = np.clip(idx, 0, self._last + 1)
+        # anything past the last bin (and NaN, which update() leaves out) goes to the overflow column
+        idx[~(idx <= self._last)] = self.bins + 1
+        return idx.astype(np.int64)
+
+    def update(self, X) -> None:
+        """Add the rows of X (one row or an (n, 12) array)."""
+        X = as_matrix(X)
+        flat = (self.bin_index(X) + self._offsets).ravel()
+        finite = np.isfinite(X)
+        if not finite.all():
+            self.missing += (~finite).sum(axis=0)
+            flat = flat[finite.ravel()]
+            low, high = np.where(finite, X, np.inf), np.where(finite, X, -np.inf)
+            X = np.where(finite, X, 0.0)
+        else:
+            low = high = X
+        if len(X) == 1:
+            # every feature has its own row of counts, so the indices are distinct
+            self.counts.ravel()[flat] += 1
+        else:
+            self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        self.n += len(X)
+        self.sums += X.sum(axis=0)
+        self.sumsq += (X * X).sum(axis=0)
+        np.minimum(self.mins, low.min(axis=0), out=self.mins)
+        np.maximum(self.maxs, high.max(axis=0), out=self.maxs)
+
+    def merge(self, other: 'DriftSketch') -> 'DriftSketch':
+        """Add other's rows to this sketch and return it."""
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError('Cannot merge sketches with different bin edges')
+        self.counts += other.counts
+        self.n += other.n
+        self.missing += other.missing
+        self.sums += other.sums
+        self.sumsq += other.sumsq
+        np.minimum(self.mins, other.mins, out=self.mins)
+        np.maximum(self.maxs, other.maxs, out=self.maxs)
+        return self
+
+    def distribution(self) -> np.ndarray:
+        """Share of each feature's finite values in each bin, shape (12, bins + 2)."""
+        return self.counts / np.maximum(self.valid, 1)[:, None]
+
+    def quantiles(self, q) -> np.ndarray:
+        """
+        Approximate quantiles of every feature, shape (12, len(q)), by linear
+        interpolation inside the histogram bins (clamped to the observed min/max).
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        out = np.full((N_FEATURES, len(q)), np.nan)
+        valid = self.valid
+        for j in range(N_FEATURES):
+            if not valid[j]:
+                continue
+            lows = np.concatenate([[self.mins[j]], self.edges[j]])
+            highs = np.concatenate([self.edges[j], [self.maxs[j]]])
+            lows, highs = np.clip(lows, self.mins[j], self.maxs[j]), np.clip(highs, self.mins[j], self.maxs[j])
+            cum = np.cumsum(self.counts[j]) / valid[j]
+            for i, target in enumerate(q):
+                b = min(int(np.searchsorted(cum, target, side='left')), len(cum) - 1)
+                before = cum[b - 1] if b else 0.0
+                share = (target - before) / (cum[b] - before) if cum[b] > before else 0.0
+                out[j, i] = lows[b] + share * (highs[b] - lows[b])
+        return out
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, missing values, mean, std, min, median and max of every feature."""
+        n = np.maximum(self.valid, 1)
+        means = self.sums / n
+        stds = np.sqrt(np.maximum(self.sumsq / n - means ** 2, 0.0))
+        medians = self.quantiles([0.5])[:, 0]
+        return {
+            name: {'n': self.n, 'missing': int(self.missing[j]), 'mean': float(means[j]), 'std': float(stds[j]),
+                   'min': float(self.mins[j]), 'median': float(medians[j]), 'max': float(self.maxs[j])}
+            for j, name in enumerate(FEATURES)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'features': FEATURES,
+            'bins': self.bins,
+            'n': self.n,
+            'missing': self.missing.tolist(),
+            'counts': self.counts.tolist(),
+            'sums': self.sums.tolist(),
+            'sumsq': self.sumsq.tolist(),
+            'mins': [v if np.isfinite(v) else None for v in self.mins.tolist()],
+            'maxs': [v if np.isfinite(v) else None for v in self.maxs.tolist()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DriftSketch':
+        if data.get('features') != FEATURES:
+            raise ValueError('Sketch was built for a different feature list')
+        sketch = cls(data['bins'])
+        sketch.counts = np.asarray(data['counts'], dtype=np.int64)
+        sketch.n = int(data['n'])
+        # sketches written before missing values were tracked have none
+        sketch.missing = np.asarray(data.get('missing', [0] * N_FEATURES), dtype=np.int64)
+        sketch.sums = np.asarray(data['sums'], dtype=np.float64)
+        sketch.sumsq = np.asarray(data['sumsq'], dtype=np.float64)
+        sketch.mins = np.array([np.inf if v is None else v for v in data['mins']], dtype=np.float64)
+        sketch.maxs = np.array([-np.inf if v is None else v for v in data['maxs']], dtype=np.float64)
+        return sketch
+
+    def save(self, path: str) -> None:
+        """Write the sketch as JSON, atomically so readers never see half a file."""
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'DriftSketch':
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def sketch_file(src: str, bins: int = DEFAULT_BINS) -> DriftSketch:
+    """Sketch every row of a CSV/Parquet file, chunk by chunk."""
+    sketch = DriftSketch(bins)
+    for chunk in iter_chunks(src, detect_format(src)):
+        if len(chunk):
+            sketch.update(feature_matrix(chunk))
+    return sketch
+
+
+def load_sketch(path: str, bins: int = DEFAULT_BINS) -> DriftSketch:
+    """A sketch JSON file as is, or a CSV/Parquet file sketched on the fly."""
+    if path.endswith('.json'):
+        return DriftSketch.load(path)
+    return sketch_file(path, bins)
+
+
+def merge_sketches(paths: List[str], bins: int = DEFAULT_BINS) -> DriftSketch:
+    """Merge the sketch files at paths (e.g. one per worker process)."""
+    merged = None
+    for path in paths:
+        sketch = DriftSketch.load(path)
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged if merged is not None else DriftSketch(bins)
+
+
+def drift_report(reference: DriftSketch, current: DriftSketch) -> List[Dict[str, Any]]:
+    """
+    PSI and KS statistic of every feature of current against reference.
+
+    Returns:
+        One dict per feature with psi, ks, status ('ok', 'warn' or 'drift'),
+        the reference and current means and the current share of missing values
+    """
+    if not np.array_equal(reference.edges, current.edges):
+        raise ValueError('Reference and current sketches use different bin edges')
+    expected = np.maximum(reference.distribution(), PSI_EPSILON)
+    actual = np.maximum(current.distribution(), PSI_EPSILON)
+    psi = ((actual - expected) * np.log(actual / expected)).sum(axis=1)
+    ks = np.abs(np.cumsum(current.distribution(), axis=1) - np.cumsum(reference.distribution(), axis=1)).max(axis=1)
+    ref_means = reference.sums / np.maximum(reference.valid, 1)
+    cur_means = current.sums / np.maximum(current.valid, 1)
+    cur_missing = current.missing / max(current.n, 1)
+    return [
+        {
+            'feature': name,
+            'psi': float(psi[j]),
+            'ks': float(ks[j]),
+            'status': 'drift' if psi[j] >= PSI_ALERT else 'warn' if psi[j] >= PSI_WARN else 'ok',
+            'reference_mean': float(ref_means[j]),
+            'current_mean': float(cur_means[j]),
+            'current_missing': float(cur_missing[j]),
+        }
+        for j, name in enumerate(FEATURES)
+    ]
+
+
+class DriftMonitor:
+    """
+    Records the inputs of every prediction in a DriftSketch and flushes it
+    to a per-process file.
+
+    Args:
+        directory: Where sketch files are written
+        flush_interval: Seconds between flushes (a flush happens on the first
+            observe() after the interval has passed, and at exit)
+        bins: Histogram bins per feature
+        clock: Time source, replaceable in tests
+    """
+
+    def __init__(self, directory: str = DRIFT_DIR, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 bins: int = DEFAULT_BINS, clock: Callable[[], float] = time.monotonic):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.sketch = DriftSketch(bins)
+        self.flushes = 0
+        self._last_flush = clock()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        atexit.register(self._flush_at_exit)
+
+    @property
+    def path(self) -> str:
+        # the pid is part of the name so forked workers never overwrite each other
+        return os.path.join(self.directory, f'sketch-{socket.gethostname()}-{os.getpid()}.json')
+
+    def _check_fork(self):
+        # a forked worker starts its own sketch instead of double counting the parent's
+        if self._pid != os.getpid():
+            self.sketch = DriftSketch(self.sketch.bins)
+            self._pid = os.getpid()
+
+    def observe(self, X) -> None:
+        """Add the rows of a prediction request.  Never raises into the prediction path."""
+        try:
+            with self._lock:
+                self._check_fork()
+                self.sketch.update(X)
+                due = self.clock() - self._last_flush >= self.flush_interval
+            if due:
+                self.flush()
+        except (ValueError, OSError) as e:
+            print(f'drift monitor: {e}', file=sys.stderr)
+
+    def flush(self) -> Optional[str]:
+        """Write the sketch of everything observed by this process so far."""
+        with self._lock:
+            self._check_fork()
+            self._last_flush = self.clock()
+            if not self.sketch.n:
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            self.sketch.save(self.path)
+            self.flushes += 1
+            return self.path
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except OSError as e:
+            print(f'drift monitor: {e}', file=sys.stderr)
+
+
+def print_report(rows: List[Dict[str, Any]], reference: DriftSketch, current: DriftSketch) -> None:
+    print(f"reference rows: {reference.n}, current rows: {current.n}")
+    print(f"{'feature':<26}{'psi':>8}{'ks':>8}{'ref mean':>12}{'cur mean':>12}{'missing':>9}  status")
+    for row in rows:
+        print(f"{row['feature']:<26}{row['psi']:>8.3f}{row['ks']:>8.3f}"
+              f"{row['reference_mean']:>12.2f}{row['current_mean']:>12.2f}"
+              f"{row['current_missing']:>9.1%}  {row['status']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sketch model inputs and report drift.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sketch_cmd = sub.add_parser('sketch', help='Sketch a CSV/Parquet file, e.g. the training data')
+    sketch_cmd.add_argument('input', help='CSV or Parquet file with the 12 model features')
+    sketch_cmd.add_argument('-o', '--output', required=True, help='Sketch JSON file to write')
+    sketch_cmd.add_argument('--bins', type=int, default=DEFAULT_BINS, help='Bins per feature (default: %(default)s)')
+
+    report = sub.add_parser('report', help='Compare merged sketches against a reference')
+    report.add_argument('--reference', required=True, help='Reference sketch JSON, or a CSV/Parquet file')
+    report.add_argument('--sketches', default=DRIFT_DIR,
+                        help='Directory of sketch files written by DriftMonitor (default: %(default)s)')
+    report.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    if args.command == 'sketch':
+        sketch = sketch_file(args.input, args.bins)
+        sketch.save(args.output)
+        print(f"Sketched {sketch.n} rows -> {args.output}")
+        return
+
+    paths = sorted(glob.glob(os.path.join(args.sketches, 'sketch-*.json')))
+    if not paths:
+        raise ValueError(f'No sketch files in {args.sketches}')
+    current = merge_sketches(paths)
+    reference = load_sketch(args.reference, current.bins)
+    rows = drift_report(reference, current)
+    if args.json:
+        print(json.dumps({'reference_rows': reference.n, 'current_rows': current.n,
+                          'sketch_files': len(paths), 'features': rows}, indent=2))
+    else:
+        print_report(rows, reference, current)
+    if any(row['status'] == 'drift' for row in rows):
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
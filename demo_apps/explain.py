@@ -0,0 +1,273 @@
+"""
+Per-feature attributions for heart failure predictions.
+
+Attributions are sampled Shapley values of the predicted probability of
+heart failure.  For every (permutation, background row) pair the inputs are
+switched from the background row to the patient's values one feature at a
+time, in permutation order, and each feature is credited with the change in
+probability its switch caused.  Averaged over all pairs, the 12
+attributions add up exactly to
+
+    probability(patient) - mean probability over the background sample
+
+The permutations and the background sample are fixed when the Explainer is
+built, so explanations are reproducible.  All perturbed rows for a group of
+patients go to the model in one predict_proba call, instead of one call per
+feature, and explanations are cached by feature row and model version in a
+PredictionCache.
+
+Usage:
+    python explain.py patients.csv -o attributions.csv
+    python explain.py patients.parquet -o attributions.parquet --background reference.csv
+"""
+
+import argparse
+import hashlib
+import sys
+import threading
+import time
+from typing import IO, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from batch_score import Source, detect_format, feature_matrix, iter_chunks
+from model_registry import MODEL_PATH, registry
+from prediction_cache import PredictionCache, as_matrix
+from schema import FEATURES, N_FEATURES, synthetic_rows
+
+DEFAULT_BACKGROUND_SIZE = 32
+DEFAULT_PERMUTATIONS = 16
+
+# Perturbed rows per predict_proba call; patients are grouped up to this size
+DEFAULT_MAX_ROWS = 65_536
+
+ATTRIBUTION_PREFIX = 'attr_'
+BASE_COLUMN = 'base_probability'
+PROBABILITY_COLUMN = 'probability'
+
+
+def load_background(path: Optional[str] = None, size: int = DEFAULT_BACKGROUND_SIZE,
+                    seed: int = 0) -> np.ndarray:
+    """
+    Return a (size, 12) background sample.
+
+    Args:
+        path: CSV or Parquet file of reference patients; synthetic rows within
+            the sidebar input ranges are used when omitted
+        size: Number of background rows
+        seed: Random seed for sampling
+    """
+    if path is None:
+        return synthetic_rows(size, seed)
+    # a uniform sample of the whole file without holding it in memory
+    rng = np.random.default_rng(seed)
+    sample, keys = None, None
+    for chunk in iter_chunks(path, detect_format(path)):
+        X = feature_matrix(chunk)
+        k = rng.random(len(X))
+        sample = X if sample is None else np.vstack([sample, X])
+        keys = k if keys is None else np.concatenate([keys, k])
+        keep = np.argsort(keys)[:size]
+        sample, keys = sample[keep], keys[keep]
+    if sample is None or not len(sample):
+        raise ValueError(f'No background rows in {path}')
+    return sample
+
+
+def positive_probability(model, X: np.ndarray) -> np.ndarray:
+    """Probability of the positive class, or the raw prediction for models without predict_proba."""
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(X)[:, -1]
+    return np.asarray(model.predict(X), dtype=np.float64)
+
+
+class Explainer:
+    """
+    Sampled Shapley attributions against a fixed background sample.
+
+    Args:
+        model: Fitted model with predict_proba (or predict)
+        background: (n, 12) background rows, e.g. from load_background()
+        permutations: Feature orders sampled per explanation
+        max_rows: Largest number of perturbed rows sent in one model call
+        seed: Random seed for the permutations
+    """
+
+    def __init__(self, model, background: np.ndarray, permutations: int = DEFAULT_PERMUTATIONS,
+                 max_rows: int = DEFAULT_MAX_ROWS, seed: int = 0):
+        self.model = model
+        self.background = as_matrix(background)
+        rng = np.random.default_rng(seed)
+        self.orders = np.array([rng.permutation(N_FEATURES) for _ in range(permutations)])
+        # masks[p, k, j] is True once feature j has been switched at step k of order p
+        ranks = np.argsort(self.orders, axis=1)
+        self.masks = ranks[:, None, :] < np.arange(N_FEATURES + 1)[None, :, None]
+        self.rows_per_patient = permutations * len(self.background) * (N_FEATURES + 1)
+        self.max_rows = max(max_rows, self.rows_per_patient)
+        self.base_value = float(positive_probability(model, self.background).mean())
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the background and permutations, so cached explanations are not mixed up."""
+        h = hashlib.blake2b(self.background.tobytes(), digest_size=8)
+        h.update(self.orders.tobytes())
+        return h.hexdigest()
+
+    def _explain_group(self, X: np.ndarray) -> np.ndarray:
+        P, B, S = len(self.orders), len(self.background), N_FEATURES + 1
+        # (n, P, B, S, 12): background row b with the first k features of order p taken from the patient
+        rows = np.where(self.masks[None, :, None, :, :], X[:, None, None, None, :],
+                        self.background[None, None, :, None, :])
+        f = positive_probability(self.model, rows.reshape(-1, N_FEATURES)).reshape(len(X), P, B, S)
+        steps = np.diff(f, axis=3).mean(axis=2)
+        # steps[i, p, k] is the credit of feature orders[p, k]; put it back in feature order
+        ranks = np.argsort(self.orders, axis=1)
+        return np.take_along_axis(steps, ranks[None, :, :], axis=2).mean(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Attributions for every row of X, shape (n, 12).
+
+        Named predict so an Explainer can be handed to PredictionCache.predict.
+        """
+        X = as_matrix(X)
+        group = max(1, self.max_rows // self.rows_per_patient)
+        return np.vstack([self._explain_group(X[i:i + group]) for i in range(0, len(X), group)]
+                         or [np.empty((0, N_FEATURES))])
+
+    explain = predict
+
+
+class ExplanationService:
+    """
+    Cached explanations for the registry's current model.
+
+    The explainer is rebuilt whenever the model file changes, and the cache
+    is scoped to the model version plus the explainer's fingerprint.
+    """
+
+    def __init__(self, background: Optional[np.ndarray] = None, maxsize: int = 1024,
+                 permutations: int = DEFAULT_PERMUTATIONS):
+        self.background = load_background() if background is None else background
+        self.permutations = permutations
+        self.cache = PredictionCache(maxsize=maxsize)
+        # (model version, explainer), replaced as one object so readers never
+        # pair an explainer with another model's version
+        self._current: Optional[Tuple[str, Explainer]] = None
+        self._lock = threading.Lock()
+
+    def explainer(self, path: str = MODEL_PATH):
+        loaded = registry.get(path)
+        current = self._current
+        if current is None or current[0] != loaded.version:
+            with self._lock:
+                # Another session may have built it while we waited for the lock
+                current = self._current
+                if current is None or current[0] != loaded.version:
+                    current = (loaded.version, Explainer(loaded.model, self.background, self.permutations))
+                    self._current = current
+        version, explainer = current
+        return explainer, f'{version}:{explainer.fingerprint}'
+
+    def explain(self, X, path: str = MODEL_PATH) -> pd.DataFrame:
+        """
+        Return one row per input with the 12 attributions, the base probability
+        and the patient's probability.
+        """
+        explainer, version = self.explainer(path)
+        X = as_matrix(X)
+        attributions = self.cache.predict(explainer, version, X)
+        out = pd.DataFrame(np.asarray(attributions, dtype=np.float64).reshape(len(X), N_FEATURES),
+                           columns=FEATURES)
+        out[BASE_COLUMN] = explainer.base_value
+        out[PROBABILITY_COLUMN] = explainer.base_value + out[FEATURES].sum(axis=1)
+        return out
+
+
+# process-wide service shared by every Streamlit session
+explanations = ExplanationService()
+
+
+def iter_explained(src: Source, fmt: str, explainer: Explainer,
+                   chunksize: int = 10_000) -> Iterator[pd.DataFrame]:
+    """Yield each input chunk with attr_<feature>, base and probability columns added."""
+    for chunk in iter_chunks(src, fmt, chunksize):
+        if not len(chunk):
+            continue
+        attributions = explainer.explain(feature_matrix(chunk))
+        out = chunk.copy()
+        for j, name in enumerate(FEATURES):
+            out[ATTRIBUTION_PREFIX + name] = attributions[:, j]
+        out[BASE_COLUMN] = explainer.base_value
+        out[PROBABILITY_COLUMN] = explainer.base_value + attributions.sum(axis=1)
+        yield out
+
+
+def explain_file(src: Source, dst: Union[str, IO], in_fmt: str, out_fmt: str, explainer: Explainer,
+                 chunksize: int = 10_000) -> int:
+    """
+    Explain every row of src and stream the results to dst.
+
+    Returns:
+        Number of rows explained
+    """
+    rows = 0
+    writer = None
+    try:
+        for explained in iter_explained(src, in_fmt, explainer, chunksize):
+            if out_fmt == 'csv':
+                explained.to_csv(dst, header=(rows == 0), index=False)
+            elif out_fmt == 'parquet':
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(explained, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(dst, table.schema)
+                writer.write_table(table)
+            else:
+                raise ValueError(f"Unsupported format '{out_fmt}'")
+            rows += len(explained)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Explain the predictions for a CSV/Parquet file of patient records.')
+    parser.add_argument('input', help='CSV or Parquet file with the 12 model features')
+    parser.add_argument('-o', '--output', required=True, help='Output CSV or Parquet file')
+    parser.add_argument('-m', '--model', default=MODEL_PATH, help='Pickled model (default: %(default)s)')
+    parser.add_argument('--background', help='Reference patients to sample the background from (default: synthetic)')
+    parser.add_argument('--background-size', type=int, default=DEFAULT_BACKGROUND_SIZE,
+                        help='Background rows (default: %(default)s)')
+    parser.add_argument('--permutations', type=int, default=DEFAULT_PERMUTATIONS,
+                        help='Feature orders sampled per row (default: %(default)s)')
+    parser.add_argument('--chunksize', type=int, default=10_000, help='Rows read at a time (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    in_fmt = detect_format(args.input)
+    out_fmt = detect_format(args.output)
+    explainer = Explainer(registry.get(args.model).model,
+                          load_background(args.background, args.background_size), args.permutations)
+
+    start = time.perf_counter()
+    if out_fmt == 'csv':
+        with open(args.output, 'w', newline='') as dst:
+            rows = explain_file(args.input, dst, in_fmt, out_fmt, explainer, args.chunksize)
+    else:
+        rows = explain_file(args.input, args.output, in_fmt, out_fmt, explainer, args.chunksize)
+    elapsed = time.perf_counter() - start
+
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"Explained {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s) -> {args.output}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
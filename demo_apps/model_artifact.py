@@ -0,0 +1,320 @@
+"""
+Compact, memory-mapped model artifact format.
+
+A plain pickle deserialises every object and copies every numpy array into
+the heap of each process that loads it.  An artifact splits the model into:
+
+    <name>.artifact/
+        manifest.json           format version, feature names/order, array table, checksums
+        skeleton-<hash>.pkl     the estimator pickled with its numpy arrays left out
+        arrays-<hash>.bin       the raw array buffers, 64-byte aligned
+
+On load, the arrays file is memory-mapped read-only and each array becomes a
+view into the mapping, so any number of worker processes share the same
+physical pages and nothing is copied.
+
+Exporting into an existing artifact never modifies a file in place.  The
+data files are named after their checksums and written under temporary
+names, then renamed.  The manifest is replaced last, in a single rename.
+Processes that still map the previous arrays keep reading the old bytes,
+and a reader sees either the old artifact or the new one, never a mix.
+Data files that the new manifest no longer refers to are then removed.  On
+POSIX, a removed file stays readable through existing mappings.
+
+Usage:
+    python model_artifact.py export model.pkl -o model.artifact
+    python model_artifact.py verify model.artifact --against model.pkl
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import pickle
+import re
+import sys
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from schema import FEATURES, synthetic_rows
+
+FORMAT_NAME = 'heart-failure-model'
+FORMAT_VERSION = 2
+# version 1 artifacts used the fixed names below and are still readable
+SUPPORTED_VERSIONS = (1, 2)
+MANIFEST = 'manifest.json'
+SKELETON = 'skeleton.pkl'
+ARRAYS = 'arrays.bin'
+ALIGNMENT = 64
+
+# data files written by export(); anything matching that is not in the manifest is stale
+_DATA_FILE = re.compile(r'^(skeleton(-[0-9a-f]+)?\.pkl|arrays(-[0-9a-f]+)?\.bin)$')
+
+
+class ArtifactError(ValueError):
+    """Raised when an artifact is missing, corrupt or incompatible."""
+
+
+def is_artifact(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def _sha256(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _tmp_name(out_dir: str, name: str) -> str:
+    return os.path.join(out_dir, f'.{name}.{os.getpid()}.tmp')
+
+
+def artifact_files(path: str, manifest: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Paths of the manifest, skeleton and arrays files that make up the artifact."""
+    manifest = manifest if manifest is not None else read_manifest(path)
+    return [os.path.join(path, MANIFEST),
+            os.path.join(path, manifest.get('skeleton_file', SKELETON)),
+            os.path.join(path, manifest.get('arrays_file', ARRAYS))]
+
+
+class _ArrayPickler(pickle.Pickler):
+    """Pickler that replaces plain numeric ndarrays with references."""
+
+    def __init__(self, file, arrays: List[np.ndarray]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays = arrays
+
+    def persistent_id(self, obj):
+        if type(obj) is np.ndarray and not obj.dtype.hasobject and obj.size > 0:
+            self.arrays.append(obj)
+            return ('ndarray', len(self.arrays) - 1)
+        return None
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    """Unpickler that resolves array references to views of the mapping."""
+
+    def __init__(self, file, views: List[np.ndarray]):
+        super().__init__(file)
+        self.views = views
+
+    def persistent_load(self, pid):
+        kind, index = pid
+        if kind != 'ndarray':
+            raise pickle.UnpicklingError(f'Unknown persistent id {pid!r}')
+        return self.views[index]
+
+
+def export(model: Any, out_dir: str, feature_names: Optional[List[str]] = None,
+           source_version: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Write model as an artifact directory.
+
+    Args:
+        model: Fitted estimator
+        out_dir: Directory to create or replace the artifact in
+        feature_names: Input feature order; defaults to schema.FEATURES
+        source_version: Optional version of the pickle the model came from
+
+    Returns:
+        The manifest that was written
+    """
+    feature_names = list(feature_names or FEATURES)
+    arrays: List[np.ndarray] = []
+    buf = io.BytesIO()
+    _ArrayPickler(buf, arrays).dump(model)
+    skeleton = buf.getvalue()
+
+    os.makedirs(out_dir, exist_ok=True)
+    table = []
+    offset = 0
+    digest = hashlib.sha256()
+    arrays_tmp = _tmp_name(out_dir, ARRAYS)
+    skeleton_tmp = _tmp_name(out_dir, SKELETON)
+    manifest_tmp = _tmp_name(out_dir, MANIFEST)
+    try:
+        with open(arrays_tmp, 'wb') as f:
+            for arr in arrays:
+                pad = (-offset) % ALIGNMENT
+                if pad:
+                    f.write(b'\0' * pad)
+                    digest.update(b'\0' * pad)
+                    offset += pad
+                order = 'F' if arr.flags.f_contiguous and not arr.flags.c_contiguous else 'C'
+                data = arr.tobytes(order=order)
+                f.write(data)
+                digest.update(data)
+                table.append({
+                    'offset': offset,
+                    'dtype': arr.dtype.str,
+                    'shape': list(arr.shape),
+                    'order': order,
+                })
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(skeleton_tmp, 'wb') as f:
+            f.write(skeleton)
+            f.flush()
+            os.fsync(f.fileno())
+
+        try:
+            import sklearn
+            sklearn_version = sklearn.__version__
+        except ImportError:
+            sklearn_version = None
+
+        arrays_sha256 = digest.hexdigest()
+        skeleton_sha256 = _sha256(skeleton)
+        manifest = {
+            'format': FORMAT_NAME,
+            'format_version': FORMAT_VERSION,
+            'feature_names': feature_names,
+            'n_features': len(feature_names),
+            'source_version': source_version,
+            'sklearn_version': sklearn_version,
+            'skeleton_file': f'skeleton-{skeleton_sha256[:16]}.pkl',
+            'arrays_file': f'arrays-{arrays_sha256[:16]}.bin',
+            'arrays': table,
+            'arrays_bytes': offset,
+            'arrays_sha256': arrays_sha256,
+            'skeleton_sha256': skeleton_sha256,
+        }
+        with open(manifest_tmp, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # data files first, so the new manifest only ever names complete files
+        os.replace(arrays_tmp, os.path.join(out_dir, manifest['arrays_file']))
+        os.replace(skeleton_tmp, os.path.join(out_dir, manifest['skeleton_file']))
+        os.replace(manifest_tmp, os.path.join(out_dir, MANIFEST))
+    finally:
+        for tmp in (arrays_tmp, skeleton_tmp, manifest_tmp):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    live = {manifest['skeleton_file'], manifest['arrays_file']}
+    for name in os.listdir(out_dir):
+        if _DATA_FILE.match(name) and name not in live:
+            os.remove(os.path.join(out_dir, name))
+    return manifest
+
+
+def read_manifest(path: str, feature_names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Read and validate an artifact's manifest.
+
+    Raises:
+        ArtifactError: If the format, version or feature order do not match
+    """
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ArtifactError(f'Cannot read manifest in {path}: {e}')
+
+    if manifest.get('format') != FORMAT_NAME:
+        raise ArtifactError(f"{path} is not a {FORMAT_NAME} artifact")
+    if manifest.get('format_version') not in SUPPORTED_VERSIONS:
+        raise ArtifactError(f"Unsupported artifact version {manifest.get('format_version')}, "
+                            f"expected one of {SUPPORTED_VERSIONS}")
+    expected = list(feature_names or FEATURES)
+    if manifest.get('feature_names') != expected:
+        raise ArtifactError(f"Artifact feature order {manifest.get('feature_names')} "
+                            f"does not match the app's {expected}")
+    return manifest
+
+
+def _open(path: str, feature_names: Optional[List[str]]):
+    manifest = read_manifest(path, feature_names)
+    _, skeleton_path, arrays_path = artifact_files(path, manifest)
+    with open(skeleton_path, 'rb') as f:
+        skeleton = f.read()
+    if manifest['arrays_bytes']:
+        mapping = np.memmap(arrays_path, dtype=np.uint8, mode='r')
+    else:
+        mapping = np.empty(0, dtype=np.uint8)
+    return manifest, skeleton, mapping
+
+
+def load(path: str, verify: bool = False, feature_names: Optional[List[str]] = None) -> Any:
+    """
+    Load a model from an artifact directory with its arrays memory-mapped.
+
+    Args:
+        path: Artifact directory
+        verify: Also check the array and skeleton checksums (reads every page)
+        feature_names: Expected feature order; defaults to schema.FEATURES
+
+    Returns:
+        The estimator, whose numpy arrays are read-only views of the arrays file
+    """
+    try:
+        manifest, skeleton, mapping = _open(path, feature_names)
+    except FileNotFoundError:
+        # a concurrent export replaced the manifest and removed the files it named
+        manifest, skeleton, mapping = _open(path, feature_names)
+    arrays_path = os.path.join(path, manifest.get('arrays_file', ARRAYS))
+    if len(mapping) != manifest['arrays_bytes']:
+        raise ArtifactError(f'{arrays_path} is {len(mapping)} bytes, '
+                            f"manifest expects {manifest['arrays_bytes']}")
+
+    if verify:
+        if _sha256(skeleton) != manifest['skeleton_sha256']:
+            raise ArtifactError(f"{manifest.get('skeleton_file', SKELETON)} checksum mismatch")
+        if _sha256(mapping) != manifest['arrays_sha256']:
+            raise ArtifactError(f"{manifest.get('arrays_file', ARRAYS)} checksum mismatch")
+
+    views = []
+    for entry in manifest['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        count = int(np.prod(shape))
+        flat = np.frombuffer(mapping, dtype=dtype, count=count, offset=entry['offset'])
+        views.append(flat.reshape(shape, order=entry['order']))
+
+    return _ArrayUnpickler(io.BytesIO(skeleton), views).load()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export or verify memory-mapped model artifacts.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_export = sub.add_parser('export', help='Convert a pickled model into an artifact directory')
+    p_export.add_argument('model', help='Pickled model, e.g. model.pkl')
+    p_export.add_argument('-o', '--output', required=True, help='Artifact directory to write')
+
+    p_verify = sub.add_parser('verify', help='Check an artifact loads and predicts like the pickle')
+    p_verify.add_argument('artifact', help='Artifact directory')
+    p_verify.add_argument('--against', help='Pickled model to compare predictions with')
+    p_verify.add_argument('--rows', type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        from model_registry import registry
+
+        loaded = registry.get(args.model)
+        manifest = export(loaded.model, args.output, source_version=loaded.version)
+        print(f"Wrote {args.output}: {len(manifest['arrays'])} arrays, "
+              f"{manifest['arrays_bytes']} bytes mapped")
+    else:
+        model = load(args.artifact, verify=True)
+        print(f'{args.artifact}: manifest and checksums OK')
+        if args.against:
+            with open(args.against, 'rb') as f:
+                reference = pickle.load(f)
+            X = synthetic_rows(args.rows)
+            mismatches = int(np.sum(model.predict(X) != reference.predict(X)))
+            print(f'{mismatches} of {args.rows} predictions differ from {args.against}')
+            if mismatches:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except ArtifactError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
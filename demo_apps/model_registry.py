@@ -0,0 +1,134 @@
+"""
+Process-wide registry for the pickled heart failure model.
+
+Streamlit re-executes streamapp.py from the top on every widget change, but
+imported modules stay in sys.modules.  Anything held here therefore survives
+reruns and is shared by every session served by the same process, so the
+model is unpickled once and only reloaded when model.pkl actually changes.
+
+The path may also be a memory-mapped artifact directory written by
+model_artifact.py; its manifest is then used for change detection.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Tuple
+
+import model_artifact
+
+MODEL_PATH = 'model.pkl'
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    """A model together with the file it came from and its content version."""
+    model: Any = field(repr=False)
+    path: str
+    version: str
+    mtime_ns: int
+    size: int
+
+
+def _stamp_path(path: str) -> str:
+    # an artifact directory changes whenever its manifest is rewritten
+    if os.path.isdir(path):
+        return os.path.join(path, model_artifact.MANIFEST)
+    return path
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(_stamp_path(path))
+    return st.st_mtime_ns, st.st_size
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+class ModelRegistry:
+    """
+    Loads each model file once per process and hands out the cached object.
+
+    A cheap os.stat() is done on every lookup.  Only when the mtime or size
+    differs from the cached entry is the file re-read and hashed, and only
+    when the hash differs is it unpickled again (a touched but identical file
+    keeps the existing model object).
+    """
+
+    def __init__(self):
+        self._models: Dict[str, LoadedModel] = {}
+        self._assets: Dict[str, Tuple[Tuple[int, int], bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str = MODEL_PATH) -> LoadedModel:
+        """
+        Return the model stored at path, loading or reloading it if needed.
+
+        Args:
+            path: Path to a pickled model file or a model artifact directory
+
+        Returns:
+            LoadedModel for the current contents of the file
+        """
+        key = os.path.abspath(path)
+        stamp = _file_stamp(key)
+        entry = self._models.get(key)
+        if entry is not None and (entry.mtime_ns, entry.size) == stamp:
+            return entry
+
+        with self._lock:
+            # Another session may have reloaded while we waited for the lock
+            entry = self._models.get(key)
+            stamp = _file_stamp(key)
+            if entry is not None and (entry.mtime_ns, entry.size) == stamp:
+                return entry
+
+            with open(_stamp_path(key), 'rb') as f:
+                data = f.read()
+            version = _digest(data)
+
+            if entry is not None and entry.version == version:
+                model = entry.model
+            elif os.path.isdir(key):
+                model = model_artifact.load(key)
+            else:
+                model = pickle.loads(data)
+
+            entry = LoadedModel(model=model, path=key, version=version,
+                                mtime_ns=stamp[0], size=stamp[1])
+            self._models[key] = entry
+            return entry
+
+    def get_bytes(self, path: str) -> bytes:
+        """
+        Return the raw bytes of a static asset (e.g. an image), re-reading the
+        file only when its mtime or size changes.
+        """
+        key = os.path.abspath(path)
+        stamp = _file_stamp(key)
+        cached = self._assets.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        with open(key, 'rb') as f:
+            data = f.read()
+        self._assets[key] = (stamp, data)
+        return data
+
+    def clear(self):
+        """Drop every cached model and asset."""
+        with self._lock:
+            self._models.clear()
+            self._assets.clear()
+
+
+# the single registry shared by all sessions in this process
+registry = ModelRegistry()
+
+
+def get_model(path: str = MODEL_PATH) -> LoadedModel:
+    """Shortcut for registry.get(path)."""
+    return registry.get(path)
@@ -0,0 +1,387 @@
+"""
+Shadow evaluation of candidate models next to the primary heart failure model.
+
+A ModelSet holds the primary model path and any number of shadow model
+paths (pickles or model_artifact.py directories), all loaded once per
+process through the model registry.  The primary model answers every
+request as before.  shadow() then hands the same rows, with the primary's
+predictions and latency, to a small background thread pool.  The pool
+scores them with every shadow model and returns at once, so users never
+wait on a shadow model.  When the pool falls behind by more than max_pending
+requests, further requests are dropped (and counted) instead of queued.
+
+When shadow models are configured (or a log directory is given explicitly),
+a JSON line is appended to <log_dir>/shadow-<pid>.jsonl for every request,
+with the inputs, the primary prediction and each shadow's prediction,
+latency and agreement.  Once the file reaches max_log_bytes it is rotated
+to shadow-<pid>.jsonl.1 (then .2, ...), and only log_backups old files are
+kept.  With neither shadows nor a log directory, shadow() only updates the
+primary's latency stats and no thread pool is started.
+
+stats() gives, per model, the number of rows, the disagreement rate with
+the primary and latency percentiles.
+
+The replay command re-scores logged inputs (or any CSV/Parquet file of
+patient records) against one or more candidate models in vectorised
+batches.  Each candidate is compared with the logged primary predictions,
+or with the primary model when replaying a plain input file, so a retrained
+model can be evaluated on real traffic before it is promoted.
+
+Usage:
+    SHADOW_MODELS=model-v2.pkl streamlit run streamapp.py
+    SHADOW_LOG_DIR=shadow_logs streamlit run streamapp.py      # log inputs without shadows
+    python model_set.py replay shadow_logs --model model-v2.pkl --model model-v3
+    python model_set.py replay patients.csv --model model-v2.pkl --json
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from batch_score import detect_format, feature_matrix, iter_chunks
+from model_registry import MODEL_PATH, registry
+from prediction_cache import as_matrix
+from schema import N_FEATURES
+
+SHADOW_LOG_DIR = 'shadow_logs'
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 1000
+DEFAULT_MAX_LOG_BYTES = 64 * 1024 * 1024
+DEFAULT_LOG_BACKUPS = 3
+
+# shadow-<pid>.jsonl and its rotated copies shadow-<pid>.jsonl.<n>
+_LOG_FILE = re.compile(r'\.jsonl(\.\d+)?$')
+
+# Latencies kept per model for the percentiles in stats()
+LATENCY_WINDOW = 2048
+
+DEFAULT_REPLAY_BATCH = 50_000
+
+
+class ModelStats:
+    """Running counts and recent latencies of one model."""
+
+    def __init__(self):
+        self.requests = 0
+        self.rows = 0
+        self.disagreements = 0
+        self.errors = 0
+        self.latencies_ms: deque = deque(maxlen=LATENCY_WINDOW)
+
+    def as_dict(self) -> Dict[str, Any]:
+        lat = np.asarray(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+        return {
+            'requests': self.requests,
+            'rows': self.rows,
+            'errors': self.errors,
+            'disagreement_rate': self.disagreements / self.rows if self.rows else 0.0,
+            'p50_ms': round(float(np.percentile(lat, 50)), 4),
+            'p95_ms': round(float(np.percentile(lat, 95)), 4),
+        }
+
+
+class ModelSet:
+    """
+    The primary model plus shadow models scored in the background.
+
+    Args:
+        primary: Path of the model that answers requests
+        shadows: Paths of the models scored in the background
+        log_dir: Directory for the per-process JSONL shadow log (None disables it)
+        workers: Background threads scoring shadow models
+        max_pending: Requests waiting for the pool before new ones are dropped
+        max_log_bytes: Size at which the log file is rotated
+        log_backups: Rotated log files kept per process
+    """
+
+    def __init__(self, primary: str = MODEL_PATH, shadows: Optional[List[str]] = None,
+                 log_dir: Optional[str] = None, workers: int = DEFAULT_WORKERS,
+                 max_pending: int = DEFAULT_MAX_PENDING, max_log_bytes: int = DEFAULT_MAX_LOG_BYTES,
+                 log_backups: int = DEFAULT_LOG_BACKUPS):
+        self.primary = primary
+        # the primary is already scored on the request path
+        self.shadows = [path for path in dict.fromkeys(shadows or []) if path != primary]
+        self.log_dir = log_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_log_bytes = max_log_bytes
+        self.log_backups = log_backups
+        self.dropped = 0
+        self.stats_by_model: Dict[str, ModelStats] = {name: ModelStats() for name in [primary] + self.shadows}
+        self._pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ModelSet':
+        """
+        Shadow models from the comma separated SHADOW_MODELS environment
+        variable.  Requests are logged to SHADOW_LOG_DIR, which defaults to
+        shadow_logs/ when shadow models are set; without either nothing is logged.
+        """
+        shadows = [p.strip() for p in os.environ.get('SHADOW_MODELS', '').split(',') if p.strip()]
+        log_dir = os.environ.get('SHADOW_LOG_DIR') or (SHADOW_LOG_DIR if shadows else None)
+        return cls(MODEL_PATH, shadows, log_dir)
+
+    @property
+    def log_path(self) -> Optional[str]:
+        if not self.log_dir:
+            return None
+        return os.path.join(self.log_dir, f'shadow-{os.getpid()}.jsonl')
+
+    def load(self):
+        """Load every model now rather than on the first request."""
+        for path in [self.primary] + self.shadows:
+            registry.get(path)
+
+    def shadow(self, X, primary_predictions, primary_ms: float) -> bool:
+        """
+        Queue the rows for scoring by the shadow models and return immediately.
+
+        Args:
+            X: The rows the primary model scored
+            primary_predictions: What the primary model returned for them
+            primary_ms: How long the primary prediction took
+
+        Returns:
+            False if the request was dropped because the pool is behind
+        """
+        X = as_matrix(X)
+        y = np.asarray(primary_predictions)
+        with self._lock:
+            stats = self.stats_by_model[self.primary]
+            stats.requests += 1
+            stats.rows += len(X)
+            stats.latencies_ms.append(primary_ms)
+            if not self.shadows and not self.log_dir:
+                return True
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shadow')
+        self._executor.submit(self._score_shadows, X, y, primary_ms, time.time())
+        return True
+
+    def _score_shadows(self, X: np.ndarray, y: np.ndarray, primary_ms: float, received: float):
+        try:
+            record = {
+                'time': received,
+                'inputs': X.tolist(),
+                'primary': {'model': self.primary, 'version': registry.get(self.primary).version,
+                            'predictions': y.tolist(), 'ms': round(primary_ms, 4)},
+                'shadows': {},
+            }
+            for path in self.shadows:
+                record['shadows'][path] = self._score_one(path, X, y)
+            self._log(record)
+        except Exception as e:
+            # never let a shadow failure surface anywhere near the request path
+            print(f'shadow scoring failed: {e}', file=sys.stderr)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _score_one(self, path: str, X: np.ndarray, y: np.ndarray) -> Dict[str, Any]:
+        stats = self.stats_by_model[path]
+        try:
+            loaded = registry.get(path)
+            start = time.perf_counter()
+            predictions = np.asarray(loaded.model.predict(X))
+            ms = (time.perf_counter() - start) * 1000.0
+        except Exception as e:
+            with self._lock:
+                stats.requests += 1
+                stats.errors += 1
+            return {'error': str(e)}
+        disagree = int(np.count_nonzero(predictions != y))
+        with self._lock:
+            stats.requests += 1
+            stats.rows += len(X)
+            stats.disagreements += disagree
+            stats.latencies_ms.append(ms)
+        return {'version': loaded.version, 'predictions': predictions.tolist(), 'ms': round(ms, 4),
+                'disagreements': disagree}
+
+    def _log(self, record: Dict[str, Any]):
+        path = self.log_path
+        if path is None:
+            return
+        line = json.dumps(record, default=float) + '\n'
+        with self._log_lock:
+            os.makedirs(self.log_dir, exist_ok=True)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            if size and size + len(line) > self.max_log_bytes:
+                self._rotate(path)
+            with open(path, 'a') as f:
+                f.write(line)
+
+    def _rotate(self, path: str):
+        # shadow-<pid>.jsonl -> .1 -> .2 ...; the oldest beyond log_backups is dropped
+        if self.log_backups <= 0:
+            os.remove(path)
+            return
+        for i in range(self.log_backups - 1, 0, -1):
+            if os.path.exists(f'{path}.{i}'):
+                os.replace(f'{path}.{i}', f'{path}.{i + 1}')
+        os.replace(path, f'{path}.1')
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """Wait until every queued shadow request has been scored; True if the queue emptied."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._pending:
+                    return True
+            time.sleep(0.005)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-model counts, disagreement with the primary and latency percentiles."""
+        with self._lock:
+            return {
+                'primary': self.primary,
+                'dropped': self.dropped,
+                'pending': self._pending,
+                'models': {name: stats.as_dict() for name, stats in self.stats_by_model.items()},
+            }
+
+
+# process-wide model set shared by every Streamlit session
+model_set = ModelSet.from_env()
+
+
+def iter_logged(paths: List[str], batch_rows: int = DEFAULT_REPLAY_BATCH) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yield (inputs, primary predictions) from shadow log files, in batches of
+    about batch_rows rows.
+    """
+    rows: List[List[float]] = []
+    predictions: List[Any] = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                rows.extend(record['inputs'])
+                predictions.extend(record['primary']['predictions'])
+                if len(rows) >= batch_rows:
+                    yield np.asarray(rows, dtype=np.float64), np.asarray(predictions)
+                    rows, predictions = [], []
+    if rows:
+        yield np.asarray(rows, dtype=np.float64), np.asarray(predictions)
+
+
+def iter_input_file(path: str, primary: str, batch_rows: int = DEFAULT_REPLAY_BATCH
+                    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yield (inputs, primary predictions) for a CSV/Parquet file, scoring it with the primary model."""
+    model = registry.get(primary).model
+    for chunk in iter_chunks(path, detect_format(path), batch_rows):
+        if len(chunk):
+            X = feature_matrix(chunk)
+            yield X, np.asarray(model.predict(X))
+
+
+def replay(batches: Iterator[Tuple[np.ndarray, np.ndarray]], candidates: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Score every batch with every candidate and compare with the primary predictions.
+
+    Returns:
+        Per candidate: rows, disagreements, disagreement rate, positive rate
+        of candidate and primary, and rows per second of the candidate
+    """
+    models = {path: registry.get(path).model for path in candidates}
+    totals = {path: {'rows': 0, 'disagreements': 0, 'positives': 0, 'primary_positives': 0, 'seconds': 0.0}
+              for path in candidates}
+    for X, y in batches:
+        if X.ndim != 2 or X.shape[1] != N_FEATURES:
+            raise ValueError(f'Expected {N_FEATURES} features per row, got shape {X.shape}')
+        for path, model in models.items():
+            start = time.perf_counter()
+            predictions = np.asarray(model.predict(X))
+            total = totals[path]
+            total['seconds'] += time.perf_counter() - start
+            total['rows'] += len(X)
+            total['disagreements'] += int(np.count_nonzero(predictions != y))
+            total['positives'] += int(np.count_nonzero(predictions == 1))
+            total['primary_positives'] += int(np.count_nonzero(y == 1))
+    return {
+        path: {
+            'rows': t['rows'],
+            'disagreements': t['disagreements'],
+            'disagreement_rate': t['disagreements'] / t['rows'] if t['rows'] else 0.0,
+            'positive_rate': t['positives'] / t['rows'] if t['rows'] else 0.0,
+            'primary_positive_rate': t['primary_positives'] / t['rows'] if t['rows'] else 0.0,
+            'rows_per_s': round(t['rows'] / t['seconds'], 1) if t['seconds'] > 0 else 0.0,
+        }
+        for path, t in totals.items()
+    }
+
+
+def log_files(source: str) -> List[str]:
+    """The shadow log files in a directory, including rotated ones, or the file itself."""
+    if os.path.isdir(source):
+        return sorted(path for path in glob.glob(os.path.join(source, 'shadow-*.jsonl*')) if _LOG_FILE.search(path))
+    if not os.path.exists(source):
+        raise ValueError(f'No such file: {source}')
+    return [source]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare candidate models on logged or recorded inputs.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rp = sub.add_parser('replay', help='Re-score logged inputs with candidate models')
+    rp.add_argument('source', help='Shadow log directory or .jsonl file, or a CSV/Parquet file of patient records')
+    rp.add_argument('--model', action='append', required=True, dest='models',
+                    help='Candidate model; repeat for several')
+    rp.add_argument('--primary', default=MODEL_PATH,
+                    help='Model to compare against for CSV/Parquet input (default: %(default)s)')
+    rp.add_argument('--batch-size', type=int, default=DEFAULT_REPLAY_BATCH,
+                    help='Rows per predict call (default: %(default)s)')
+    rp.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source) or _LOG_FILE.search(args.source):
+        paths = log_files(args.source)
+        if not paths:
+            raise ValueError(f'No shadow logs in {args.source}')
+        batches = iter_logged(paths, args.batch_size)
+    else:
+        batches = iter_input_file(args.source, args.primary, args.batch_size)
+
+    start = time.perf_counter()
+    results = replay(batches, args.models)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'model':<32}{'rows':>10}{'disagree':>10}{'rate':>9}{'pos rate':>10}{'primary':>9}{'rows/s':>12}")
+    for path, r in results.items():
+        print(f"{path:<32}{r['rows']:>10}{r['disagreements']:>10}{r['disagreement_rate']:>9.2%}"
+              f"{r['positive_rate']:>10.2%}{r['primary_positive_rate']:>9.2%}{r['rows_per_s']:>12,.0f}")
+    print(f"Replayed in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,82 @@
+"""
+Load generator for predict_service.py.
+
+Fires requests with random rows (within the sidebar input ranges) at the
+/predict endpoint from a fixed number of concurrent clients and reports
+throughput and latency percentiles.
+
+Usage:
+    python predict_loadgen.py --url http://localhost:8080/predict --concurrency 64 --requests 5000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+import numpy as np
+
+from schema import synthetic_rows
+
+
+async def run(url: str, concurrency: int, total: int, rows_per_request: int, seed: int = 0) -> dict:
+    """
+    Send total requests using concurrency parallel clients.
+
+    Returns:
+        Dictionary with request counts, throughput and latency percentiles (ms)
+    """
+    X = synthetic_rows(total * rows_per_request, seed).reshape(total, rows_per_request, -1)
+    bodies = [json.dumps({'instances': X[i].tolist()}) for i in range(total)]
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def client(session):
+        nonlocal next_index, errors
+        while next_index < total:
+            body = bodies[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            async with session.post(url, data=body, headers={'Content-Type': 'application/json'}) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    lat_ms = np.asarray(latencies) * 1000.0
+    return {
+        'requests': total,
+        'errors': errors,
+        'concurrency': concurrency,
+        'rows_per_request': rows_per_request,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(total / elapsed, 1),
+        'p50_ms': round(float(np.percentile(lat_ms, 50)), 2),
+        'p99_ms': round(float(np.percentile(lat_ms, 99)), 2),
+        'max_ms': round(float(lat_ms.max()), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the prediction service.')
+    parser.add_argument('--url', default='http://localhost:8080/predict')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rows-per-request', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.url, args.concurrency, args.requests, args.rows_per_request, args.seed))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""
+Low-latency HTTP prediction service for the heart failure model.
+
+The model is loaded once at startup.  Concurrent requests are coalesced into
+micro-batches: the first request to arrive opens a short window (max_wait_ms)
+during which further requests are collected, then the whole batch is scored
+with a single model.predict call on a worker thread pool.  This keeps the
+event loop free and amortises the per-call overhead of the sklearn pipeline
+across many requests.  The inputs of every request are also recorded by a
+DriftMonitor (see drift_monitor.py), which writes a sketch file per process.
+
+API:
+    POST /predict
+        {"instances": [[age, anaemia, ..., time], ...]}
+        {"instances": [{"age": 60, "anaemia": 0, ...}, ...]}
+        -> {"predictions": [0, 1, ...], "model_version": "..."}
+    GET /health
+        -> {"status": "ok", "model_version": "...", "requests": n, "batches": n, ...}
+
+Usage:
+    python predict_service.py --port 8080 --max-wait-ms 5 --workers 2
+    python predict_loadgen.py --url http://localhost:8080/predict
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+from aiohttp import web
+
+from drift_monitor import DEFAULT_FLUSH_INTERVAL, DRIFT_DIR, DriftMonitor
+from model_registry import MODEL_PATH, registry
+from schema import FEATURES, N_FEATURES
+
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_WORKERS = 2
+
+
+class MicroBatcher:
+    """
+    Collects rows from concurrent callers and scores them in batches.
+
+    Args:
+        predict_fn: Function taking an (n, 12) array and returning n predictions
+        max_batch_size: Upper bound on rows per predict_fn call
+        max_wait_ms: How long the first request of a batch waits for company
+        workers: Number of threads running predict_fn concurrently
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 workers: int = DEFAULT_WORKERS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = workers
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._inflight = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='predict')
+        self._slots = asyncio.Semaphore(self.workers)
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    async def submit(self, rows: np.ndarray) -> np.ndarray:
+        """Queue rows for scoring and wait for their predictions."""
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        await self._queue.put((rows, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            rows, future = await self._queue.get()
+            batch = [(rows, future)]
+            size = len(rows)
+            deadline = loop.time() + self.max_wait
+
+            while size < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    rows, future = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append((rows, future))
+                size += len(rows)
+
+            # wait for a free worker so batches keep growing while all are busy
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            X = np.concatenate([rows for rows, _ in batch]) if len(batch) > 1 else batch[0][0]
+            try:
+                y = await loop.run_in_executor(self._executor, self.predict_fn, X)
+            except Exception:
+                if len(batch) == 1:
+                    raise
+                # one request's rows failed the whole batch: score each request
+                # on its own so only the offending one gets the error
+                await self._dispatch_each(batch)
+                return
+            self.batches += 1
+            self.rows += len(X)
+            offset = 0
+            for rows, future in batch:
+                if not future.done():
+                    future.set_result(y[offset:offset + len(rows)])
+                offset += len(rows)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    async def _dispatch_each(self, batch):
+        loop = asyncio.get_running_loop()
+        for rows, future in batch:
+            try:
+                y = await loop.run_in_executor(self._executor, self.predict_fn, rows)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += len(rows)
+            if not future.done():
+                future.set_result(y)
+
+
+def parse_instances(payload) -> np.ndarray:
+    """
+    Convert a request payload into an (n, 12) float array.
+
+    Accepts {"instances": [...]} where each instance is either a list of the
+    12 values in schema order or an object keyed by feature name.  A single
+    instance may also be sent on its own.
+
+    Raises:
+        ValueError: If the payload does not match the schema or a value is
+            null, NaN or infinite
+    """
+    if isinstance(payload, dict) and 'instances' in payload:
+        instances = payload['instances']
+    else:
+        instances = [payload]
+    if not isinstance(instances, list) or not instances:
+        raise ValueError('instances must be a non-empty list')
+
+    rows: List[List[float]] = []
+    for inst in instances:
+        if isinstance(inst, dict):
+            missing = [f for f in FEATURES if f not in inst]
+            if missing:
+                raise ValueError(f"instance is missing features: {', '.join(missing)}")
+            inst = [inst[f] for f in FEATURES]
+        if not isinstance(inst, list) or len(inst) != N_FEATURES:
+            raise ValueError(f'each instance must have {N_FEATURES} values in order: {", ".join(FEATURES)}')
+        rows.append(inst)
+
+    try:
+        X = np.asarray(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError('instance values must be numeric')
+    # null becomes NaN above; neither it nor an infinity is a valid reading
+    if not np.isfinite(X).all():
+        bad = sorted({FEATURES[j] for j in np.nonzero(~np.isfinite(X))[1]})
+        raise ValueError(f"instance values must be finite numbers: {', '.join(bad)}")
+    return X
+
+
+# typed application keys; plain string keys make aiohttp warn (NotAppKeyWarning)
+BATCHER = web.AppKey('batcher', MicroBatcher)
+DRIFT_MONITOR = web.AppKey('drift_monitor', DriftMonitor)
+MODEL_VERSION = web.AppKey('model_version', str)
+
+
+async def handle_predict(request: web.Request) -> web.Response:
+    try:
+        X = parse_instances(await request.json())
+    except json.JSONDecodeError:
+        return web.json_response({'error': 'request body must be JSON'}, status=400)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+
+    try:
+        y = await request.app[BATCHER].submit(X)
+    except Exception as e:
+        return web.json_response({'error': f'prediction failed: {e}'}, status=500)
+    # only rows that passed validation and were scored are recorded
+    request.app[DRIFT_MONITOR].observe(X)
+    return web.json_response({
+        'predictions': [int(v) for v in y],
+        'model_version': request.app[MODEL_VERSION],
+    })
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    batcher = request.app[BATCHER]
+    return web.json_response({
+        'status': 'ok',
+        'model_version': request.app[MODEL_VERSION],
+        'requests': batcher.requests,
+        'batches': batcher.batches,
+        'rows': batcher.rows,
+        'mean_batch_rows': batcher.rows / batcher.batches if batcher.batches else 0.0,
+    })
+
+
+def create_app(model_path: str = MODEL_PATH,
+               max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+               max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+               workers: int = DEFAULT_WORKERS,
+               drift_dir: str = DRIFT_DIR) -> web.Application:
+    """Build the aiohttp application; the model is loaded once here."""
+    loaded = registry.get(model_path)
+    model = loaded.model
+
+    app = web.Application()
+    app[MODEL_VERSION] = loaded.version
+    app[BATCHER] = MicroBatcher(model.predict, max_batch_size, max_wait_ms, workers)
+    app[DRIFT_MONITOR] = DriftMonitor(drift_dir, DEFAULT_FLUSH_INTERVAL)
+
+    async def on_startup(app):
+        await app[BATCHER].start()
+
+    async def on_cleanup(app):
+        await app[BATCHER].stop()
+        app[DRIFT_MONITOR].flush()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post('/predict', handle_predict)
+    app.router.add_get('/health', handle_health)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the heart failure model over HTTP.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('-m', '--model', default=MODEL_PATH, help='Pickled model (default: %(default)s)')
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help='Maximum rows per model.predict call (default: %(default)s)')
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help='Batching window in milliseconds (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Prediction worker threads (default: %(default)s)')
+    parser.add_argument('--drift-dir', default=DRIFT_DIR,
+                        help='Directory for input drift sketches (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    app = create_app(args.model, args.max_batch_size, args.max_wait_ms, args.workers, args.drift_dir)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Bounded LRU/TTL cache of model predictions keyed on the input row.
+
+Each row is canonicalised to 12 float64 values (so 30 and 30.0, or -0.0 and
+0.0, hash the same) and hashed together with the model version.  The cache
+is scoped to a single model version: the first lookup made with a different
+version (i.e. after model.pkl was reloaded) empties it.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from schema import N_FEATURES
+
+DEFAULT_MAXSIZE = 4096
+DEFAULT_TTL = 3600.0
+
+
+def as_matrix(X) -> np.ndarray:
+    """Return X as a 2-D float64 array with one row per input."""
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.shape[1] != N_FEATURES:
+        raise ValueError(f'Expected {N_FEATURES} features per row, got {X.shape[1]}')
+    # adding 0.0 turns -0.0 into 0.0 so both produce the same key
+    return np.ascontiguousarray(X + 0.0)
+
+
+def row_key(row: np.ndarray, model_version: str) -> bytes:
+    """Canonical hash of one float64 feature row for the given model version."""
+    h = hashlib.blake2b(model_version.encode(), digest_size=16)
+    h.update(row.tobytes())
+    return h.digest()
+
+
+def predict_unique(predict_fn: Callable[[np.ndarray], np.ndarray], X: np.ndarray) -> np.ndarray:
+    """
+    Call predict_fn once on the distinct rows of X and expand the result back
+    to one prediction per input row.
+    """
+    df = pd.DataFrame(X)
+    # hash-based grouping is exact and O(n), unlike np.unique(axis=0) which sorts
+    codes = df.groupby(list(df.columns), sort=False, dropna=False).ngroup().to_numpy()
+    n_unique = int(codes.max()) + 1 if len(codes) else 0
+    if n_unique == len(X):
+        return np.asarray(predict_fn(X))
+    _, first = np.unique(codes, return_index=True)
+    return np.asarray(predict_fn(X[first]))[codes]
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with a per-entry time to live.
+
+    hits and misses count input rows: a row repeated within one call is
+    scored once but counted as a miss each time.
+
+    Args:
+        maxsize: Maximum number of cached rows
+        ttl: Seconds after which an entry is treated as a miss
+        clock: Time source, replaceable in tests
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._version: Optional[str] = None
+        self._entries: 'OrderedDict[bytes, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _scope(self, model_version: str):
+        if model_version != self._version:
+            self._entries.clear()
+            self._version = model_version
+
+    def _lookup(self, key: bytes, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: bytes, value: Any, now: float):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def predict(self, model, model_version: str, X) -> np.ndarray:
+        """
+        Return model.predict(X), scoring only the rows that are not cached.
+
+        All missing rows are scored together in a single model.predict call.
+
+        Args:
+            model: Fitted model
+            model_version: Version of the model, e.g. LoadedModel.version
+            X: One row or a list/array of rows with the 12 features
+
+        Returns:
+            Array with one prediction per row
+        """
+        X = as_matrix(X)
+        keys = [row_key(row, model_version) for row in X]
+        results: list = [None] * len(keys)
+        missing: Dict[bytes, list] = {}
+
+        with self._lock:
+            self._scope(model_version)
+            now = self.clock()
+            for i, key in enumerate(keys):
+                value = self._lookup(key, now)
+                if value is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    results[i] = value
+            missed = sum(len(idx) for idx in missing.values())
+            self.hits += len(keys) - missed
+            self.misses += missed
+
+        if missing:
+            order = list(missing)
+            y = model.predict(X[[missing[k][0] for k in order]])
+            with self._lock:
+                self._scope(model_version)
+                now = self.clock()
+                for key, value in zip(order, y):
+                    self._store(key, value, now)
+                    for i in missing[key]:
+                        results[i] = value
+
+        return np.asarray(results)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'hit_rate': self.hits / total if total else 0.0,
+            'model_version': self._version,
+        }
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+# process-wide cache shared by every Streamlit session
+cache = PredictionCache()
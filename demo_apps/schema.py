@@ -0,0 +1,63 @@
+"""
+Input schema of the heart failure model.
+
+The model was trained on the 12 clinical features below, in this order.  This
+is the same order getInputs() in streamapp.py uses to build its single row.
+"""
+
+import numpy as np
+
+FEATURES = [
+    'age',
+    'anaemia',
+    'creatinine_phosphokinase',
+    'diabetes',
+    'ejection_fraction',
+    'high_blood_pressure',
+    'platelets',
+    'serum_creatinine',
+    'serum_sodium',
+    'sex',
+    'smoking',
+    'time',
+]
+
+N_FEATURES = len(FEATURES)
+
+# (low, high, is_integer) for each feature.  Bounds come from the sidebar
+# widgets in streamapp.py; where a widget is unbounded (platelets, serum
+# creatinine, serum sodium, follow-up time) the range of the original
+# heart failure clinical records dataset is used instead.
+FEATURE_RANGES = {
+    'age': (20, 120, True),
+    'anaemia': (0, 1, True),
+    'creatinine_phosphokinase': (1, 8000, True),
+    'diabetes': (0, 1, True),
+    'ejection_fraction': (0, 100, True),
+    'high_blood_pressure': (0, 1, True),
+    'platelets': (25000, 850000, True),
+    'serum_creatinine': (0.5, 9.4, False),
+    'serum_sodium': (113, 148, True),
+    'sex': (0, 1, True),
+    'smoking': (0, 1, True),
+    'time': (4, 285, True),
+}
+
+
+def synthetic_rows(n: int, seed: int = 0) -> np.ndarray:
+    """
+    Return an (n, 12) float array of random inputs within FEATURE_RANGES.
+
+    Args:
+        n: Number of rows
+        seed: Random seed, so runs are reproducible
+    """
+    rng = np.random.default_rng(seed)
+    X = np.empty((n, N_FEATURES), dtype=np.float64)
+    for j, name in enumerate(FEATURES):
+        low, high, is_integer = FEATURE_RANGES[name]
+        if is_integer:
+            X[:, j] = rng.integers(low, high, size=n, endpoint=True)
+        else:
+            X[:, j] = np.round(rng.uniform(low, high, size=n), 2)
+    return X
@@ -1,6 +1,16 @@
 import pandas as pd
 import math
-import pickle
+import os
+import tempfile
+import time
+
+from batch_score import detect_format, score_file
+from drift_monitor import DriftMonitor
+from explain import BASE_COLUMN, PROBABILITY_COLUMN, explanations
+from model_registry import registry
+from model_set import model_set
+from prediction_cache import cache
+from tracing import tracer
 
 # create a streamlit app
 
@@ -9,17 +19,35 @@ import streamlit as st
 # create a title and a subheader
 st.title('Heart Failure Prediction App')
 
-# insert image at home page
-st.image('heart-failure-image.jpg', width=500)
+# insert image at home page (bytes are cached for the life of the server process)
+st.image(registry.get_bytes('heart-failure-image.jpg'), width=500)
 
-# load the model
-model = pickle.load(open('model.pkl', 'rb'))
+# the model is unpickled once per server process and shared across sessions;
+# it is only reloaded when model.pkl changes on disk
+MODEL_PATH = 'model.pkl'
+
+@st.cache_resource
+def driftMonitor():
+    # one monitor per server process, shared by every session and kept across reruns
+    return DriftMonitor()
 
 def predict(X): 
-    y = model.predict(X)
+    # repeated inputs are answered from a cache scoped to the loaded model version
+    with tracer.span('model_load'):
+        loaded = registry.get(MODEL_PATH)
+    with tracer.span('model_predict', rows=len(X)):
+        start = time.perf_counter()
+        y = cache.predict(loaded.model, loaded.version, X)
+        primary_ms = (time.perf_counter() - start) * 1000.0
+    # inputs that were scored are recorded in a fixed-size drift sketch, flushed to drift/ periodically
+    with tracer.span('drift_observe'):
+        driftMonitor().observe(X)
+    # shadow models (SHADOW_MODELS) score the same rows on a background pool; this only queues them
+    model_set.shadow(X, y, primary_ms)
     return y
 
 # generate streamlit inputs for the following variables: age, sex, bmi, bp, s1, s2, s3, s4, s5, s6
+@tracer.traced('inputs')
 def getInputs():
  
     with st.sidebar:
@@ -80,18 +108,101 @@ def getInputs():
         time = st.number_input('Follow-up period (days)', step=1)
 
         values = [[age, anemia, cp_level, diabetes, ejection, hbp, platelets, serum_creatinine, serum_sodium, sex, smoking, time]]
+
+        # read back by explainInputs() after the prediction is shown
+        st.checkbox('Explain prediction', key='explain')
     
         if st.button('Predict'):
+            st.session_state['last_inputs'] = values
             y = predict(values)
             return y[0] 
 
 
+# show how much each input moved the predicted probability away from the average patient
+@tracer.traced('explain')
+def explainInputs(values):
+
+    explained = explanations.explain(values, MODEL_PATH).iloc[0]
+    st.subheader('Why this prediction?')
+    st.write(f"Probability of heart failure: {explained[PROBABILITY_COLUMN]:.1%} "
+             f"(average patient: {explained[BASE_COLUMN]:.1%})")
+    attributions = explained.drop([BASE_COLUMN, PROBABILITY_COLUMN])
+    st.bar_chart(attributions.reindex(attributions.abs().sort_values(ascending=False).index))
+
+
+# delete the session's previous scored file, so each session keeps at most one on disk
+def discardScoredFile():
+    path = st.session_state.pop('scored_file', None)
+    st.session_state.pop('scored_rows', None)
+    st.session_state.pop('scored_upload', None)
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# score an uploaded CSV/Parquet file of patient records in chunks
+@tracer.traced('batch_score')
+def batchScore():
+
+    st.subheader('Batch scoring')
+    uploaded = st.file_uploader('Upload patient records (CSV or Parquet with the 12 input columns)',
+                                type=['csv', 'parquet'])
+    if uploaded is None:
+        discardScoredFile()
+        return
+
+    if st.button('Score file'):
+        discardScoredFile()
+        try:
+            in_fmt = detect_format(uploaded.name)
+            # results are streamed to a temporary file chunk by chunk so memory stays bounded
+            out = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False)
+            try:
+                with out:
+                    rows = score_file(uploaded, out, in_fmt, 'csv', registry.get(MODEL_PATH).model)
+            except BaseException:
+                # don't leave a partial result behind
+                os.remove(out.name)
+                raise
+            st.session_state['scored_file'] = out.name
+            st.session_state['scored_rows'] = rows
+            st.session_state['scored_upload'] = (uploaded.name, uploaded.size)
+        except ValueError as e:
+            st.error(str(e))
+            return
+
+    if st.session_state.get('scored_upload') == (uploaded.name, uploaded.size):
+        st.write(f"Scored {st.session_state['scored_rows']} records")
+        with open(st.session_state['scored_file'], 'rb') as f:
+            st.download_button('Download predictions', f, file_name='predictions.csv', mime='text/csv')
+
+
 
 if __name__ == "__main__":
-    y = getInputs()
-    
-    if y is not None:
-        if y == 0:
-            st.write('Predicted Heart Failure: No')
-        else:
-            st.write('Predicted Heart Failure: Yes')
\ No newline at end of file
+    # with TRACE_FILE set, every rerun is traced and its spans are added to the file afterwards
+    with tracer.span('rerun'):
+        batchScore()
+
+        y = getInputs()
+        
+        if y is not None:
+            if y == 0:
+                st.write('Predicted Heart Failure: No')
+            else:
+                st.write('Predicted Heart Failure: Yes')
+            if st.session_state.get('explain'):
+                explainInputs(st.session_state['last_inputs'])
+
+        stats = cache.stats()
+        st.caption(f"Prediction cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size']} entries")
+        if model_set.shadows:
+            shadow_stats = model_set.stats()
+            st.caption('Shadow models: ' + ', '.join(
+                f"{name} {s['disagreement_rate']:.1%} disagree, p50 {s['p50_ms']:.2f} ms"
+                for name, s in shadow_stats['models'].items() if name != model_set.primary))
+
+    if tracer.enabled:
+        # only the spans since the previous export are written, by this session or any other,
+        # so the cost of an export does not grow with uptime while the file keeps every rerun
+        tracer.export(append=True)
\ No newline at end of file
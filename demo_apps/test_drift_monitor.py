@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test script for the input drift sketches and report.
+"""
+
+import atexit
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the current directory to the path so we can import the modules under test
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from drift_monitor import DriftMonitor, DriftSketch, drift_report, merge_sketches
+    from schema import FEATURES, synthetic_rows
+except ImportError:
+    print("Error: Could not import drift_monitor. Make sure the file exists.")
+    sys.exit(1)
+
+
+def sketch_of(X) -> DriftSketch:
+    sketch = DriftSketch()
+    sketch.update(X)
+    return sketch
+
+
+def assert_same(a: DriftSketch, b: DriftSketch):
+    assert a.n == b.n and np.array_equal(a.counts, b.counts) and np.array_equal(a.missing, b.missing)
+    assert np.allclose(a.sums, b.sums) and np.allclose(a.sumsq, b.sumsq)
+    assert np.array_equal(a.mins, b.mins) and np.array_equal(a.maxs, b.maxs)
+
+
+def test_merge_is_associative():
+    """Test that merging partial sketches in any grouping equals sketching all rows at once."""
+    print("Testing sketch merging...")
+
+    X = synthetic_rows(3000, seed=1)
+    parts = [X[:1], X[1:1200], X[1200:]]
+    whole = sketch_of(X)
+
+    left = sketch_of(parts[0]).merge(sketch_of(parts[1])).merge(sketch_of(parts[2]))
+    right = sketch_of(parts[0]).merge(sketch_of(parts[1]).merge(sketch_of(parts[2])))
+    row_by_row = DriftSketch()
+    for row in X[:500]:
+        row_by_row.update(row)
+    assert_same(left, whole)
+    assert_same(right, whole)
+    assert_same(row_by_row, sketch_of(X[:500]))
+    assert int(whole.counts.sum()) == 3000 * len(FEATURES)
+
+    # merging saved per-process files gives the same result
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, part in enumerate(parts):
+            paths.append(os.path.join(tmp, f'sketch-{i}.json'))
+            sketch_of(part).save(paths[-1])
+        assert_same(merge_sketches(paths), whole)
+
+    print("✅ sketch merging test passed")
+
+
+def test_non_finite_values_are_counted_separately():
+    """Test that NaN and infinite values neither reach the histograms nor the statistics."""
+    print("Testing missing values...")
+
+    X = synthetic_rows(1000, seed=2)
+    bad = X[:3].copy()
+    bad[0, FEATURES.index('time')] = np.nan
+    bad[1, FEATURES.index('time')] = np.inf
+    bad[2, FEATURES.index('age')] = -np.inf
+
+    sketch = sketch_of(X)
+    sketch.update(bad[:1])
+    sketch.update(bad[1:])
+    summary = sketch.summary()
+    assert sketch.n == 1003
+    assert summary['time']['missing'] == 2 and summary['age']['missing'] == 1
+    for name in FEATURES:
+        stats = summary[name]
+        assert all(np.isfinite(stats[k]) for k in ('mean', 'std', 'min', 'median', 'max')), \
+            f"{name} statistics should stay finite: {stats}"
+    assert int(sketch.counts[FEATURES.index('time')].sum()) == 1001
+    assert np.allclose(sketch.distribution().sum(axis=1), 1.0)
+
+    restored = DriftSketch.from_dict(sketch.to_dict())
+    assert_same(restored, sketch)
+    merged = sketch_of(X).merge(sketch_of(bad))
+    assert_same(merged, sketch)
+
+    # a feature with nothing but missing values has no statistics, not bogus ones
+    empty = sketch_of(np.full((2, len(FEATURES)), np.nan))
+    assert np.isnan(empty.quantiles([0.5])).all() and empty.summary()['age']['missing'] == 2
+
+    print("✅ missing values test passed")
+
+
+def test_psi_and_ks():
+    """Test that matching inputs report no drift and shifted inputs are flagged."""
+    print("Testing drift report...")
+
+    reference = sketch_of(synthetic_rows(20000, seed=3))
+    same = sketch_of(synthetic_rows(20000, seed=4))
+    rows = drift_report(reference, same)
+    assert all(row['status'] == 'ok' for row in rows), [r for r in rows if r['status'] != 'ok']
+    assert max(row['ks'] for row in rows) < 0.05
+
+    shifted = synthetic_rows(20000, seed=5)
+    age = FEATURES.index('age')
+    shifted[:, age] = np.minimum(shifted[:, age] + 30, 120)
+    shifted[:100, FEATURES.index('platelets')] = np.nan
+    rows = {row['feature']: row for row in drift_report(reference, sketch_of(shifted))}
+    assert rows['age']['status'] == 'drift' and rows['age']['ks'] > 0.2, rows['age']
+    assert rows['age']['current_mean'] > rows['age']['reference_mean'] + 20
+    assert rows['platelets']['status'] == 'ok' and rows['platelets']['current_missing'] == 100 / 20000
+    assert rows['sex']['status'] == 'ok'
+
+    # identical sketches are exactly zero
+    assert all(row['psi'] == 0 and row['ks'] == 0 for row in drift_report(reference, reference))
+
+    print("✅ drift report test passed")
+
+
+def test_monitor_flushes_per_interval():
+    """Test that the monitor writes its sketch once the flush interval has passed."""
+    print("Testing drift monitor...")
+
+    now = [0.0]
+    with tempfile.TemporaryDirectory() as tmp:
+        monitor = DriftMonitor(tmp, flush_interval=10, clock=lambda: now[0])
+        # the temporary directory is removed before the exit-time flush would run
+        atexit.unregister(monitor._flush_at_exit)
+        monitor.observe(synthetic_rows(5))
+        assert monitor.flushes == 0
+        now[0] = 11
+        monitor.observe(synthetic_rows(5, seed=1))
+        assert monitor.flushes == 1 and DriftSketch.load(monitor.path).n == 10
+        # a malformed row is reported, not raised into the caller
+        monitor.observe([[1, 2, 3]])
+        assert monitor.sketch.n == 10
+
+    print("✅ drift monitor test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting drift monitor tests...\n")
+
+    try:
+        test_merge_is_associative()
+        test_non_finite_values_are_counted_separately()
+        test_psi_and_ks()
+        test_monitor_flushes_per_interval()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for the per-feature explanations.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Add the current directory to the path so we can import the modules under test
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+try:
+    import explain
+    from explain import BASE_COLUMN, PROBABILITY_COLUMN, ExplanationService, Explainer, load_background
+    from model_registry import registry
+    from schema import FEATURES, synthetic_rows
+except ImportError:
+    print("Error: Could not import explain. Make sure the file exists.")
+    sys.exit(1)
+
+MODEL = os.path.join(HERE, 'model.pkl')
+
+
+def test_attributions_add_up_to_probability():
+    """Test that the attributions plus the base value equal predict_proba for every row."""
+    print("Testing additivity...")
+
+    model = registry.get(MODEL).model
+    explainer = Explainer(model, load_background(size=8), permutations=4, max_rows=1000)
+    X = synthetic_rows(50, seed=9)
+
+    attributions = explainer.explain(X)
+    assert attributions.shape == (50, len(FEATURES))
+    proba = model.predict_proba(X)[:, 1]
+    assert np.allclose(explainer.base_value + attributions.sum(axis=1), proba, atol=1e-9), \
+        "Attributions should add up to the predicted probability"
+    assert np.isclose(explainer.base_value, model.predict_proba(explainer.background)[:, 1].mean())
+
+    # grouping rows into several model calls gives the same result
+    one_at_a_time = Explainer(model, explainer.background, permutations=4, max_rows=1)
+    assert np.allclose(one_at_a_time.explain(X[:5]), attributions[:5])
+
+    print("✅ additivity test passed")
+
+
+def test_repeated_explanation_is_cached():
+    """Test that explaining the same row again is answered from the cache."""
+    print("Testing explanation cache...")
+
+    service = ExplanationService(background=load_background(size=8), permutations=4)
+    X = synthetic_rows(3, seed=4)
+
+    first = service.explain(X, MODEL)
+    assert service.cache.stats()['misses'] == 3 and service.cache.stats()['hits'] == 0
+    explainer, _ = service.explainer(MODEL)
+    explainer.predict = None  # any attempt to recompute would fail
+
+    second = service.explain(X[::-1], MODEL)
+    assert service.cache.stats()['hits'] == 3, "Repeated rows should be served from the cache"
+    assert np.allclose(second.to_numpy(), first.to_numpy()[::-1])
+    assert np.allclose(first[PROBABILITY_COLUMN], registry.get(MODEL).model.predict_proba(X)[:, 1])
+    assert (first[BASE_COLUMN] == explainer.base_value).all()
+
+    print("✅ explanation cache test passed")
+
+
+def test_explainer_built_once_under_concurrency():
+    """Test that concurrent first requests share one explainer instead of each building one."""
+    print("Testing concurrent explainer creation...")
+
+    service = ExplanationService(background=load_background(size=8), permutations=4)
+    built = []
+
+    class SlowExplainer(Explainer):
+        def __init__(self, *args, **kwargs):
+            built.append(self)
+            time.sleep(0.05)  # widen the window between the check and the assignment
+            super().__init__(*args, **kwargs)
+
+    original = explain.Explainer
+    explain.Explainer = SlowExplainer
+    try:
+        results = []
+        start = threading.Barrier(8)
+
+        def first_request():
+            start.wait()
+            results.append(service.explainer(MODEL))
+
+        threads = [threading.Thread(target=first_request) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        explain.Explainer = original
+
+    assert len(built) == 1, f"Expected one explainer, built {len(built)}"
+    assert all(explainer is built[0] for explainer, _ in results)
+    assert len({version for _, version in results}) == 1
+
+    print("✅ concurrent explainer creation test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting explanation tests...\n")
+
+    try:
+        test_attributions_add_up_to_probability()
+        test_repeated_explanation_is_cached()
+        test_explainer_built_once_under_concurrency()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
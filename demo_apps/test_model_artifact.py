@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test script for the memory-mapped model artifact format.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the current directory to the path so we can import the modules under test
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import model_artifact
+    from model_artifact import ArtifactError
+    from schema import synthetic_rows
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+except ImportError:
+    print("Error: Could not import model_artifact. Make sure the file exists.")
+    sys.exit(1)
+
+
+def fit_model(seed: int):
+    """A small scaler + logistic regression pipeline shaped like model.pkl."""
+    X = synthetic_rows(500, seed)
+    y = (X[:, 4] + X[:, 11] * (seed + 1) > np.median(X[:, 4] + X[:, 11] * (seed + 1))).astype(int)
+    return make_pipeline(StandardScaler(), LogisticRegression(max_iter=500)).fit(X, y)
+
+
+def test_round_trip():
+    """Test that a loaded artifact predicts exactly like the model it was exported from."""
+    print("Testing artifact round trip...")
+
+    model = fit_model(0)
+    X = synthetic_rows(2000, seed=7)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.artifact')
+        manifest = model_artifact.export(model, path, source_version='abc')
+        assert model_artifact.is_artifact(path)
+        assert sorted(os.listdir(path)) == sorted([model_artifact.MANIFEST, manifest['skeleton_file'],
+                                                   manifest['arrays_file']]), \
+            f"Unexpected files {os.listdir(path)}"
+
+        loaded = model_artifact.load(path, verify=True)
+        assert np.array_equal(loaded.predict(X), model.predict(X))
+        assert np.array_equal(loaded.predict_proba(X), model.predict_proba(X))
+        scaler = loaded.steps[0][1]
+        assert isinstance(scaler.mean_, np.ndarray) and not scaler.mean_.flags.writeable, \
+            "Arrays should be read-only views of the mapping"
+
+    print("✅ artifact round trip test passed")
+
+
+def test_rejects_bad_artifacts():
+    """Test that a foreign manifest, a different feature order and corrupt data are refused."""
+    print("Testing artifact validation...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.artifact')
+        manifest = model_artifact.export(fit_model(0), path)
+        manifest_path = os.path.join(path, model_artifact.MANIFEST)
+
+        def expect_error(match, **kwargs):
+            try:
+                model_artifact.load(path, **kwargs)
+            except ArtifactError as e:
+                assert match in str(e), f"Unexpected error: {e}"
+            else:
+                raise AssertionError(f"Expected ArtifactError containing '{match}'")
+
+        expect_error('does not match', feature_names=['a', 'b'])
+
+        for key, value, match in (('format', 'other-model', 'is not a'),
+                                  ('format_version', 99, 'Unsupported artifact version')):
+            with open(manifest_path, 'w') as f:
+                json.dump(dict(manifest, **{key: value}), f)
+            expect_error(match)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+        # flip one byte of the array data: only a verified load notices
+        arrays_path = os.path.join(path, manifest['arrays_file'])
+        with open(arrays_path, 'r+b') as f:
+            f.seek(manifest['arrays'][0]['offset'])
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        model_artifact.load(path)
+        expect_error('checksum mismatch', verify=True)
+
+        with open(arrays_path, 'ab') as f:
+            f.write(b'\0')
+        expect_error('manifest expects')
+
+    print("✅ artifact validation test passed")
+
+
+def test_reexport_while_loaded():
+    """Test that exporting into the same directory leaves already loaded models intact."""
+    print("Testing re-export of a loaded artifact...")
+
+    first, second = fit_model(0), fit_model(1)
+    X = synthetic_rows(2000, seed=11)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.artifact')
+        model_artifact.export(first, path)
+        loaded = model_artifact.load(path)
+        mean_before = np.array(loaded.steps[0][1].mean_)
+        proba_before = loaded.predict_proba(X)
+
+        manifest = model_artifact.export(second, path)
+        assert np.array_equal(loaded.steps[0][1].mean_, mean_before), \
+            "Re-exporting must not change the bytes under an existing mapping"
+        assert np.array_equal(loaded.predict_proba(X), proba_before)
+
+        reloaded = model_artifact.load(path, verify=True)
+        assert np.array_equal(reloaded.predict_proba(X), second.predict_proba(X))
+        assert len(os.listdir(path)) == 3, f"Stale data files were left behind: {os.listdir(path)}"
+        assert os.path.exists(os.path.join(path, manifest['arrays_file']))
+
+        # exporting the same model again is harmless too
+        model_artifact.export(second, path)
+        assert np.array_equal(reloaded.predict_proba(X), second.predict_proba(X))
+
+    print("✅ re-export test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting model artifact tests...\n")
+
+    try:
+        test_round_trip()
+        test_rejects_bad_artifacts()
+        test_reexport_while_loaded()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
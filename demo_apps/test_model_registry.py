@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script for the process-wide model registry.
+"""
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the current directory to the path so we can import the modules under test
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+try:
+    import model_artifact
+    from model_registry import ModelRegistry
+    from sklearn.dummy import DummyClassifier
+except ImportError:
+    print("Error: Could not import model_registry. Make sure the file exists.")
+    sys.exit(1)
+
+MODEL = os.path.join(HERE, 'model.pkl')
+
+
+def rows(n: int) -> np.ndarray:
+    return np.random.default_rng(0).normal(size=(n, 12))
+
+
+def constant_model(value: int):
+    X = rows(4)
+    return DummyClassifier(strategy='constant', constant=value).fit(X, np.full(len(X), value))
+
+
+def bump_mtime(path: str):
+    # make sure the stamp changes even on filesystems with coarse timestamps
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_model_reused_until_content_changes():
+    """Test that a pickle is loaded once, survives a touch, and is reloaded when its bytes change."""
+    print("Testing pickle reload...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.pkl')
+        shutil.copy(MODEL, path)
+        registry = ModelRegistry()
+
+        first = registry.get(path)
+        assert registry.get(path) is first, "An unchanged file should return the cached entry"
+
+        # touched but identical: re-hashed, but the model object is kept
+        bump_mtime(path)
+        touched = registry.get(path)
+        assert touched.model is first.model and touched.version == first.version
+
+        with open(path, 'wb') as f:
+            pickle.dump(constant_model(1), f)
+        bump_mtime(path)
+        changed = registry.get(path)
+        assert changed.version != first.version and changed.model is not first.model
+        assert set(changed.model.predict(rows(10))) == {1}
+        assert registry.get(path) is changed
+
+    print("✅ pickle reload test passed")
+
+
+def test_artifact_reloaded_on_manifest_change():
+    """Test that an artifact directory is reloaded when it is re-exported with a different model."""
+    print("Testing artifact reload...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.artifact')
+        model_artifact.export(constant_model(0), path)
+        registry = ModelRegistry()
+
+        first = registry.get(path)
+        assert registry.get(path) is first
+
+        model_artifact.export(constant_model(1), path)
+        bump_mtime(os.path.join(path, model_artifact.MANIFEST))
+        changed = registry.get(path)
+        assert changed.version != first.version
+        assert set(changed.model.predict(rows(10))) == {1}
+        # the old model still works: its mapping was not overwritten
+        assert set(first.model.predict(rows(10))) == {0}
+
+    print("✅ artifact reload test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting model registry tests...\n")
+
+    try:
+        test_model_reused_until_content_changes()
+        test_artifact_reloaded_on_manifest_change()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
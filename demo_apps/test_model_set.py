@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test script for shadow model scoring and replay.
+"""
+
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+# Add the current directory to the path so we can import the modules under test
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+try:
+    from model_registry import registry
+    from model_set import ModelSet, iter_logged, log_files, replay
+    from schema import synthetic_rows
+    from sklearn.dummy import DummyClassifier
+except ImportError:
+    print("Error: Could not import model_set. Make sure the file exists.")
+    sys.exit(1)
+
+MODEL = os.path.join(HERE, 'model.pkl')
+
+
+def make_models(tmp):
+    """A copy of the primary (always agrees) and a model that always predicts 1."""
+    same = os.path.join(tmp, 'same.pkl')
+    shutil.copy(MODEL, same)
+    always_one = os.path.join(tmp, 'always_one.pkl')
+    X = synthetic_rows(10)
+    with open(always_one, 'wb') as f:
+        pickle.dump(DummyClassifier(strategy='constant', constant=1).fit(X, np.ones(len(X), dtype=int)), f)
+    return same, always_one
+
+
+def score(model_set, X):
+    y = registry.get(MODEL).model.predict(X)
+    assert model_set.shadow(X, y, 1.0)
+    return y
+
+
+def test_nothing_is_logged_without_shadows():
+    """Test that without shadows or a log directory no pool is started and no file written."""
+    print("Testing default logging...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            model_set = ModelSet(MODEL)
+            score(model_set, synthetic_rows(4))
+            assert model_set._executor is None and os.listdir(tmp) == []
+            assert model_set.stats()['models'][MODEL]['rows'] == 4
+        finally:
+            os.chdir(cwd)
+
+    print("✅ default logging test passed")
+
+
+def test_agreement_stats_and_replay():
+    """Test per-shadow disagreement rates, the request log and replaying it."""
+    print("Testing shadow agreement...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        same, always_one = make_models(tmp)
+        log_dir = os.path.join(tmp, 'logs')
+        model_set = ModelSet(MODEL, [MODEL, same, always_one], log_dir=log_dir)
+        assert model_set.shadows == [same, always_one], "The primary should not shadow itself"
+
+        X = synthetic_rows(300, seed=4)
+        y = np.concatenate([score(model_set, X[i:i + 30]) for i in range(0, 300, 30)])
+        assert model_set.drain(), "The shadow queue should empty"
+
+        stats = model_set.stats()['models']
+        assert stats[same]['rows'] == 300 and stats[same]['disagreement_rate'] == 0.0
+        assert stats[always_one]['disagreement_rate'] == np.mean(y != 1)
+        assert stats[always_one]['errors'] == 0 and stats[MODEL]['requests'] == 10
+
+        paths = log_files(log_dir)
+        with open(paths[0]) as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 10 and records[0]['shadows'][always_one]['predictions'] == [1] * 30
+
+        results = replay(iter_logged(paths, batch_rows=128), [same, always_one])
+        assert results[same]['rows'] == 300 and results[same]['disagreements'] == 0
+        assert results[always_one]['disagreements'] == int(np.sum(y != 1))
+        assert results[always_one]['positive_rate'] == 1.0
+
+    print("✅ shadow agreement test passed")
+
+
+def test_full_queue_drops_requests():
+    """Test that requests are dropped and counted, not queued, while the pool is behind."""
+    print("Testing queue-full drops...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        same, _ = make_models(tmp)
+        model_set = ModelSet(MODEL, [same], workers=1, max_pending=2)
+        release = threading.Event()
+        score_shadows = model_set._score_shadows
+
+        def blocked(*args):
+            release.wait(10)
+            score_shadows(*args)
+
+        model_set._score_shadows = blocked
+        X = synthetic_rows(1)
+        y = registry.get(MODEL).model.predict(X)
+        accepted = [model_set.shadow(X, y, 1.0) for _ in range(5)]
+        assert accepted == [True, True, False, False, False], f"Unexpected admissions {accepted}"
+        assert model_set.stats()['dropped'] == 3 and model_set.stats()['pending'] == 2
+
+        release.set()
+        assert model_set.drain()
+        assert model_set.stats()['models'][same]['requests'] == 2
+        assert model_set.shadow(X, y, 1.0), "Requests are accepted again once the queue drains"
+        assert model_set.drain()
+
+    print("✅ queue-full drop test passed")
+
+
+def test_log_rotation():
+    """Test that the log is rotated at max_log_bytes and old files beyond log_backups go."""
+    print("Testing log rotation...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = os.path.join(tmp, 'logs')
+        model_set = ModelSet(MODEL, log_dir=log_dir, max_log_bytes=2000, log_backups=2)
+        X = synthetic_rows(5)
+        for _ in range(40):
+            score(model_set, X)
+            assert model_set.drain()
+
+        names = sorted(os.listdir(log_dir))
+        base = os.path.basename(model_set.log_path)
+        assert names == [base, f'{base}.1', f'{base}.2'], f"Unexpected log files {names}"
+        assert all(os.path.getsize(os.path.join(log_dir, n)) <= 2000 for n in names)
+        assert len(log_files(log_dir)) == 3
+
+    print("✅ log rotation test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting model set tests...\n")
+
+    try:
+        test_nothing_is_logged_without_shadows()
+        test_agreement_stats_and_replay()
+        test_full_queue_drops_requests()
+        test_log_rotation()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
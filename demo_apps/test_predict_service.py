@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test script for the micro-batching prediction service.
+Serves the app in-process with aiohttp's test server.
+"""
+
+import asyncio
+import atexit
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the current directory to the path so we can import the modules under test
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+try:
+    from aiohttp import test_utils
+    from model_registry import registry
+    from predict_service import BATCHER, DRIFT_MONITOR, MicroBatcher, create_app, parse_instances
+    from schema import FEATURES, synthetic_rows
+except ImportError:
+    print("Error: Could not import predict_service. Make sure the file exists.")
+    sys.exit(1)
+
+MODEL = os.path.join(HERE, 'model.pkl')
+
+
+def strict_predict(X):
+    """Stands in for a model that rejects NaN, like the sklearn pipeline does."""
+    if not np.isfinite(X).all():
+        raise ValueError('Input X contains NaN.')
+    return (X[:, 0] > 60).astype(int)
+
+
+async def score_concurrently(batcher, requests):
+    await batcher.start()
+    try:
+        return await asyncio.gather(*(batcher.submit(rows) for rows in requests), return_exceptions=True)
+    finally:
+        await batcher.stop()
+
+
+def test_concurrent_requests_are_batched():
+    """Test that concurrent requests share predict calls and get their own rows back."""
+    print("Testing micro-batching...")
+
+    requests = [synthetic_rows(n, seed=n) for n in (1, 3, 2, 5, 1, 4) * 5]
+    batcher = MicroBatcher(strict_predict, max_batch_size=256, max_wait_ms=50, workers=1)
+    results = asyncio.run(score_concurrently(batcher, requests))
+
+    for rows, y in zip(requests, results):
+        assert np.array_equal(y, strict_predict(rows)), "Each request should get the predictions of its own rows"
+    assert batcher.requests == 30 and batcher.rows == sum(len(r) for r in requests)
+    assert batcher.batches < 30, f"Expected requests to be batched, got {batcher.batches} batches for 30 requests"
+
+    print("✅ micro-batching test passed")
+
+
+def test_failing_request_is_isolated():
+    """Test that rows failing the model only fail their own request, not the whole batch."""
+    print("Testing error isolation...")
+
+    requests = [synthetic_rows(2, seed=i) for i in range(8)]
+    requests[3] = requests[3].copy()
+    requests[3][1, 4] = np.nan
+    batcher = MicroBatcher(strict_predict, max_batch_size=256, max_wait_ms=50, workers=1)
+    results = asyncio.run(score_concurrently(batcher, requests))
+
+    assert isinstance(results[3], ValueError), f"The bad request should fail, got {results[3]!r}"
+    for i, (rows, y) in enumerate(zip(requests, results)):
+        if i != 3:
+            assert np.array_equal(y, strict_predict(rows)), f"Request {i} should not fail with the bad one"
+
+    print("✅ error isolation test passed")
+
+
+def test_parse_rejects_non_finite_values():
+    """Test that null, NaN and infinite values are refused before scoring."""
+    print("Testing input validation...")
+
+    row = synthetic_rows(1)[0].tolist()
+    assert parse_instances({'instances': [row]}).shape == (1, 12)
+    assert parse_instances(dict(zip(FEATURES, row))).shape == (1, 12)
+
+    for bad in (None, float('nan'), float('inf')):
+        values = list(row)
+        values[7] = bad
+        try:
+            parse_instances({'instances': [row, values]})
+        except ValueError as e:
+            assert 'serum_creatinine' in str(e), f"The error should name the feature: {e}"
+        else:
+            raise AssertionError(f"{bad!r} should be rejected")
+
+    print("✅ input validation test passed")
+
+
+def test_http_errors_are_per_request():
+    """Test over HTTP that one bad client gets a JSON 400 while concurrent good ones succeed."""
+    print("Testing HTTP error handling...")
+
+    good = [synthetic_rows(1, seed=i)[0].tolist() for i in range(3)]
+    bad = list(good[0])
+    bad[2] = None
+
+    async def run(drift_dir):
+        app = create_app(MODEL, max_wait_ms=50, workers=1, drift_dir=drift_dir)
+        # the app flushes its sketch on cleanup; the directory is gone at exit
+        atexit.unregister(app[DRIFT_MONITOR]._flush_at_exit)
+        async with test_utils.TestClient(test_utils.TestServer(app)) as client:
+            responses = await asyncio.gather(
+                client.post('/predict', json={'instances': [good[0]]}),
+                client.post('/predict', json={'instances': [bad]}),
+                client.post('/predict', json={'instances': [good[1], good[2]]}),
+            )
+            bodies = [await r.json() for r in responses]
+            statuses = [r.status for r in responses]
+            # a model failure is reported as JSON rather than a bare 500
+            app[BATCHER].predict_fn = lambda X: 1 / 0
+            failed = await client.post('/predict', json={'instances': [good[0]]})
+            return statuses, bodies, failed.status, await failed.json()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        statuses, bodies, failed_status, failed_body = asyncio.run(run(tmp))
+
+    expected = registry.get(MODEL).model.predict(np.asarray(good)).tolist()
+    assert statuses == [200, 400, 200], f"Unexpected statuses {statuses}"
+    assert bodies[0]['predictions'] == expected[:1] and bodies[2]['predictions'] == expected[1:]
+    assert 'finite' in bodies[1]['error']
+    assert failed_status == 500 and 'prediction failed' in failed_body['error']
+
+    print("✅ HTTP error handling test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting prediction service tests...\n")
+
+    try:
+        test_concurrent_requests_are_batched()
+        test_failing_request_is_isolated()
+        test_parse_rejects_non_finite_values()
+        test_http_errors_are_per_request()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test script for the prediction cache.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+# Add the current directory to the path so we can import the modules under test
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+try:
+    from model_registry import registry
+    from prediction_cache import PredictionCache, predict_unique, row_key
+    from schema import synthetic_rows
+except ImportError:
+    print("Error: Could not import prediction_cache. Make sure the file exists.")
+    sys.exit(1)
+
+MODEL = os.path.join(HERE, 'model.pkl')
+
+
+class CountingModel:
+    """Predicts the first feature and remembers how many rows it was asked to score."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, X):
+        self.calls.append(len(X))
+        return X[:, 0].copy()
+
+
+def test_hits_and_misses():
+    """Test that cached rows are not rescored and both counters count rows."""
+    print("Testing hit/miss counters...")
+
+    model = CountingModel()
+    cache = PredictionCache()
+    X = synthetic_rows(4)
+    X[:, 1] = 0.0
+    with_repeats = np.vstack([X, X[:2]])
+
+    assert np.array_equal(cache.predict(model, 'v1', with_repeats), with_repeats[:, 0])
+    assert model.calls == [4], "Repeated rows should be scored once, in a single call"
+    assert cache.stats()['hits'] == 0 and cache.stats()['misses'] == 6
+
+    # 30 and 30.0, and -0.0 and 0.0, are the same row
+    same = [[int(v) if v.is_integer() else v for v in row] for row in X.tolist()]
+    for row in same:
+        row[1] = -0.0
+    assert np.array_equal(cache.predict(model, 'v1', same), X[:, 0])
+    assert model.calls == [4]
+    stats = cache.stats()
+    assert stats['hits'] == 4 and stats['misses'] == 6 and stats['size'] == 4
+    assert stats['hit_rate'] == 0.4
+
+    print("✅ hit/miss counter test passed")
+
+
+def test_ttl_expiry():
+    """Test that entries older than the TTL are scored again."""
+    print("Testing TTL expiry...")
+
+    now = [0.0]
+    model = CountingModel()
+    cache = PredictionCache(ttl=10, clock=lambda: now[0])
+    X = synthetic_rows(1)
+    cache.predict(model, 'v1', X)
+    now[0] = 10
+    cache.predict(model, 'v1', X)
+    assert model.calls == [1], "An entry is still valid at its expiry time"
+    now[0] = 10.5
+    cache.predict(model, 'v1', X)
+    assert model.calls == [1, 1], "An expired entry should be scored again"
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+    print("✅ TTL expiry test passed")
+
+
+def test_lru_eviction():
+    """Test that the least recently used row is evicted first."""
+    print("Testing LRU eviction...")
+
+    model = CountingModel()
+    cache = PredictionCache(maxsize=2)
+    a, b, c = synthetic_rows(3, seed=1)
+    cache.predict(model, 'v1', a)
+    cache.predict(model, 'v1', b)
+    cache.predict(model, 'v1', a)  # a is now more recent than b
+    cache.predict(model, 'v1', c)  # evicts b
+    assert len(cache) == 2 and cache.stats()['evictions'] == 1
+
+    calls = len(model.calls)
+    cache.predict(model, 'v1', a)
+    assert len(model.calls) == calls, "The recently used row should still be cached"
+    cache.predict(model, 'v1', b)
+    assert len(model.calls) == calls + 1, "The least recently used row should have been evicted"
+
+    print("✅ LRU eviction test passed")
+
+
+def test_model_version_change_invalidates():
+    """Test that a new model version empties the cache and keys differ per version."""
+    print("Testing version invalidation...")
+
+    model = CountingModel()
+    cache = PredictionCache()
+    X = synthetic_rows(3)
+    cache.predict(model, 'v1', X)
+    assert row_key(X[0], 'v1') != row_key(X[0], 'v2')
+
+    cache.predict(model, 'v2', X)
+    assert model.calls == [3, 3], "Rows cached for v1 must not answer for v2"
+    stats = cache.stats()
+    assert stats['model_version'] == 'v2' and stats['size'] == 3
+
+    print("✅ version invalidation test passed")
+
+
+def test_predict_unique_matches_model():
+    """Test that predict_unique returns model.predict row for row, scoring each distinct row once."""
+    print("Testing predict_unique...")
+
+    model = registry.get(MODEL).model
+    rng = np.random.default_rng(0)
+    distinct = synthetic_rows(200, seed=2)
+    X = distinct[rng.integers(0, len(distinct), size=1000)]
+
+    counting = CountingModel()
+    predict_unique(counting.predict, X)
+    assert counting.calls == [len(np.unique(X, axis=0))]
+
+    assert np.array_equal(predict_unique(model.predict, X), model.predict(X))
+    assert np.array_equal(predict_unique(model.predict, distinct), model.predict(distinct))
+
+    print("✅ predict_unique test passed")
+
+
+def main():
+    """Run all tests."""
+    print("🧪 Starting prediction cache tests...\n")
+
+    try:
+        test_hits_and_misses()
+        test_ttl_expiry()
+        test_lru_eviction()
+        test_model_version_change_invalidates()
+        test_predict_unique_matches_model()
+
+        print("\n🎉 All tests passed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Lightweight request tracing: nested, timed spans exported as a Chrome trace.
+
+    from tracing import tracer
+
+    with tracer.span('predict', rows=len(X)):
+        ...
+
+    @tracer.traced('load_model')
+    def load_model(): ...
+
+    tracer.export()          # writes the trace file
+    tracer.export(append=True)   # or adds the new spans to it
+
+Tracing is off unless the TRACE_FILE environment variable names the file
+to write (or a Tracer is built with a path).  While off, span() returns a
+shared do-nothing context manager, so an instrumented call costs one
+attribute check.  While on, each span is recorded as a complete ("X")
+event with its start, duration, process and thread.  Spans opened inside
+other spans on the same thread show up nested in the viewer.  The output is
+the Trace Event Format JSON that chrome://tracing, https://ui.perfetto.dev
+and speedscope load directly.
+
+The MLflow shutdown Lambda in aws_provisioning/ uses this module too; its
+deployment package includes a copy taken from here at build time.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+TRACE_FILE_ENV = 'TRACE_FILE'
+
+# Events kept in memory; later spans are counted in `dropped` instead
+DEFAULT_MAX_EVENTS = 100_000
+
+
+class _NoSpan:
+    """Returned by a disabled tracer; entering and leaving it does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Span:
+    """One timed section.  set() adds arguments shown with the event in the viewer."""
+
+    __slots__ = ('tracer', 'name', 'args', 'start_ns')
+
+    def __init__(self, tracer: 'Tracer', name: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start_ns = 0
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.start_ns, end_ns, self.args)
+        return False
+
+
+class Tracer:
+    """
+    Collects spans from any thread and writes them as a trace file.
+
+    Args:
+        path: Trace file written by export(); tracing is enabled when given
+        enabled: Override whether spans are recorded
+        max_events: Upper bound on events held in memory
+    """
+
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None,
+                 max_events: int = DEFAULT_MAX_EVENTS):
+        self.path = path
+        self.enabled = bool(path) if enabled is None else enabled
+        self.max_events = max_events
+        self.events: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self._origin_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, var: str = TRACE_FILE_ENV) -> 'Tracer':
+        return cls(os.environ.get(var) or None)
+
+    def span(self, name: str, **args):
+        """Context manager timing the enclosed block (a no-op while disabled)."""
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, args)
+
+    def traced(self, name: Optional[str] = None) -> Callable:
+        """Decorator wrapping every call of a function in a span."""
+        def decorate(fn):
+            label = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with Span(self, label, {}):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def record(self, name: str, start_ns: int, end_ns: int, args: Optional[Dict[str, Any]] = None):
+        """Add a finished span measured with time.perf_counter_ns()."""
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': (start_ns - self._origin_ns) / 1000,
+            'dur': (end_ns - start_ns) / 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_native_id(),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, total and longest duration in milliseconds for each span name."""
+        totals: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            entry = totals.setdefault(event['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            ms = event['dur'] / 1000
+            entry['count'] += 1
+            entry['total_ms'] = round(entry['total_ms'] + ms, 3)
+            entry['max_ms'] = round(max(entry['max_ms'], ms), 3)
+        return totals
+
+    def export(self, path: Optional[str] = None, clear: bool = False, append: bool = False) -> Optional[str]:
+        """
+        Write every recorded span as Trace Event Format JSON.
+
+        Args:
+            path: File to write instead of the tracer's path
+            clear: Also forget the exported spans, in the same step, so spans
+                recorded meanwhile by other threads are kept for the next export
+            append: Add the spans to the end of the file instead of replacing
+                it, so the file covers every export.  Implies clear, so each
+                span is written once.  The file is then in the JSON Array
+                Format without its closing bracket, which the viewers accept;
+                read it back with load_trace().
+
+        Returns:
+            The path written, or None when no path is configured
+        """
+        path = path or self.path
+        if not path:
+            return None
+        with self._lock:
+            events = list(self.events)
+            dropped = self.dropped
+            if clear or append:
+                self.events.clear()
+                self.dropped = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if append:
+            if dropped:
+                events.append({'name': 'dropped_events', 'ph': 'C', 'ts': events[-1]['ts'] if events else 0,
+                               'pid': os.getpid(), 'tid': threading.get_native_id(), 'args': {'dropped': dropped}})
+            chunk = ''.join(json.dumps(event, default=str) + ',\n' for event in events)
+            # one write per export, so exports from other threads or processes do not interleave
+            with self._write_lock, open(path, 'a') as f:
+                f.write(chunk if f.tell() else '[\n' + chunk)
+            return path
+        trace = {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'dropped_events': dropped},
+        }
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(trace, f, default=str)
+        os.replace(tmp, path)
+        return path
+
+    def clear(self):
+        """Forget all recorded spans."""
+        with self._lock:
+            self.events.clear()
+            self.dropped = 0
+
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """The events of a trace file written by export(), with or without append."""
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith('{'):
+        return json.loads(text)['traceEvents']
+    return json.loads(text.rstrip(',]') + ']') if text else []
+
+
+# process-wide tracer, enabled by setting TRACE_FILE
+tracer = Tracer.from_env()